@@ -13,6 +13,15 @@ Min_Scatt_Filenumber = Min_Filenumber
 Max_Scatt_Filenumber = Max_Filenumber
 Min_Trans_Filenumber = Min_Filenumber 
 Max_Trans_Filenumber = Max_Filenumber
+UseMetadataIndex = 1 #Default is 1 (yes); saves a catalog of file metadata (VSANS_MetadataIndex.npz) in save_path so unchanged files are not re-read on later runs
+MaxOpenFiles = 128 #Default is 128; maximum number of data files kept open at once (lower this if the system limit on open files is reached)
+PanelCacheMB = 512 #Default is 512; memory (in MB) used to keep detector panel arrays after they are first read so each panel is only decompressed once
+SaveBlockedBeamRates = 0 #Default is 0 (no); 1 = saves blocked beam count rates in save_path/VSANS_BlockedBeamRates.h5 so later runs skip reading the blocked beam files (they are re-read if those files change)
+SaveGeometryCache = 0 #Default is 0 (no); 1 = saves the Q, Q-resolution, angle and shadow maps for each detector geometry in save_path/GeometryCache and reuses them on later runs
+ParallelWorkers = 1 #Default is 1 (serial); number of worker processes that reduce (configuration, sample) pairs at the same time, 0 = one per CPU core
+UseIncrementalReduction = 0 #Default is 0 (no); 1 = keeps the 1D slices in save_path/IncrementalCache and only re-reduces samples whose data files or relevant settings changed since the last run
+LiveReduction = 0 #Default is 0 (no); 1 = keeps running during beamtime: watches input_path and re-reduces (incrementally) whenever new runs have finished landing; stop with Ctrl-C
+LivePollSeconds = 5 #Default is 5; seconds between checks of input_path when LiveReduction = 1
 
 TransPanel = 'MR' #Default is 'MR'
 SectorCutAngles = 20.0 #Default is typically 10.0 to 20.0 (degrees)
@@ -26,6 +35,9 @@ AverageQRanges = 1 #Default is 1; 0 for no
 Absolute_Q_min = 0.003 #Default 0; Will take the maximum of Q_min_Calc from all detectors and this value
 Absolute_Q_max = 0.11 #Default 0.6; Will take the minimum of Q_max_Calc from all detectors and this value
 YesNoShowPlots = 0 #0 = No and simply saves plots; 1 = yes and displays plots when code is run
+Headless = 0 #Default is 0 (no); 1 = never loads a window (GUI) plotting backend, plots are still saved (for batch and cluster runs)
+SavePlots = 1 #Default is 1 (yes); 0 = no plots are drawn or saved at all
+PlotWorkers = 0 #Default is 0 (one per CPU core); number of processes drawing the plots queued during the reduction (1 = drawn in this process, as they always are off Linux)
 YesNoSetPlotXRange = 0 #Default is 0 (no), 1 = yes
 YesNoSetPlotYRange = 0 #Default is 0 (no), 1 = yes
 PlotXmin = 0.00023 #Only used if YesNoSetPlotXRange = 1
@@ -39,6 +51,8 @@ CompareFullPolTypes = 1
 
 YesNo_2DCombinedFiles = 0 #Default is 0 (no), 1 = yes which can be read using SasView
 YesNo_2DFilesPerDetector = 0 #Default is 0 (no), 1 = yes; Note all detectors will be summed after beamline masking applied and can be read by SasView 4.2.2 (and higher?)
+YesNo_TextOutput = 1 #Default is 1 (yes); writes the reduced data as .txt (1D) and .DAT (2D) text files
+YesNo_HDF5Output = 0 #Default is 0 (no), 1 = yes; writes one compressed NXcanSAS-style file, Reduced_{Sample},{Config}.h5, per sample and configuration holding all slices, results and 2D data
 
 #High Res Detector is linked to then Converging Beam option (at 6.7 angstroms)
 #UseHighResDetWhenAvailable = 0 #0 = No, 1 = Yes
@@ -48,9 +62,12 @@ HighResMinY = 667 #Default 667
 HighResMaxY = 917 #Default 917
 ConvertHighResToSubset = 1 #Default = 1 for yes (uses only a small subset of the million plus pixels for approximately an 18 x's savings in computing power).
 HighResGain = 100.0 #320 for EarlyJanuary2020; 100 for LateJanuary2020
+HighResRebin = 1 #Default is 1 (every pixel); 2, 4 or 8 = reduces the HighRes ('B') panel as summed 2x2, 4x4 or 8x8 pixel blocks, e.g. the whole panel (ConvertHighResToSubset = 0) at about the cost of the subset
+SinglePrecision = 0 #Default is 0 (float64); 1 = per pixel maps and scaled data in float32 and masks as uint8 (1D sums are still float64), check with check_precision()
 
 UsePolCorr = 1 #Default is 1 to pol-correct full-pol data, 0 means no and will only correct for 3He transmission as a function of time.
 He3CorrectionType = 1 #0 for chi, 1 for chi = upsilon (only active if YesNoManualHe3Entry = 1), 2 for upsilon
+PolCorrUncertainty = 1 #Default is 1 to propagate full-pol uncertainties through the pol-correction, 2 = also includes PSM and He3 cell fit uncertainties, 0 = passes the uncorrected uncertainties through
 YesNoBypassBestGuessPSM = 0 #Default is 1, will bypass to higher (or the highest) PSM value if one (or more) is/are measured
 PSM_Guess = 0.9985 #0.9985 is good for 4 guides, 5.5 angstroms
 Minimum_PSM = 0.01
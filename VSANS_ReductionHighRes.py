@@ -1,17 +1,92 @@
 import numpy as np
 import h5py
-import scipy as sp
-from scipy.optimize.minpack import curve_fit
-import matplotlib.pyplot as plt
 from pathlib import Path
-import dateutil
 import datetime
 from numpy.linalg import inv
 #from uncertainties import unumpy
 import os
 import os.path
-from scipy import ndimage
-from UserInput import *
+import sys
+import time
+import hashlib
+import pickle
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+
+#matplotlib.pyplot, scipy and dateutil are imported inside the functions that use them, so runs that never plot or fit do not pay
+#for loading them (plain import statements, which PyInstaller still finds when freezing this script)
+
+MaxOpenFiles = 128 #Default is 128; maximum number of data files held open at once (least recently used files are closed first)
+PanelCacheMB = 512 #Default is 512; memory (in MB) for detector panel arrays kept after they are first read (least recently used arrays are dropped first)
+UseMetadataIndex = 1 #Default is 1 (yes); saves the file catalog in save_path and only re-reads files whose size or modification time changed
+SaveBlockedBeamRates = 0 #Default is 0 (no); 1 = save blocked beam count rates in save_path and reuse them on later runs while the blocked beam files are unchanged
+SaveGeometryCache = 0 #Default is 0 (no); 1 = save the Q, resolution, angle and shadow maps of each geometry in save_path and reuse them on later runs
+ParallelWorkers = 1 #Default is 1 (serial); number of worker processes used to reduce (configuration, sample) pairs at the same time, 0 = one per CPU core
+PolCorrUncertainty = 1 #Default is 1; full-pol uncertainties propagated through the pol-correction matrix, 2 = also includes the PSM and He3 cell fit uncertainties, 0 = uncorrected uncertainties passed through
+YesNo_TextOutput = 1 #Default is 1 (yes); writes the reduced 1D and 2D data as text (.txt and .DAT) files
+YesNo_HDF5Output = 0 #Default is 0 (no); 1 = also writes one compressed NXcanSAS-style Reduced_{Sample},{Config}.h5 file holding every slice, result and 2D data set
+UseIncrementalReduction = 0 #Default is 0 (no); 1 = reuse the 1D slices saved in save_path for any sample/configuration whose input files and settings are unchanged
+LiveReduction = 0 #Default is 0 (no); 1 = keep running after the first reduction, watch input_path and reduce again (incrementally) whenever new or changed data files have settled
+LivePollSeconds = 5 #Default is 5; seconds between checks of input_path when LiveReduction = 1
+Headless = 0 #Default is 0 (no); 1 = never loads a window (GUI) plotting backend, plots are still saved (for batch and cluster runs)
+SavePlots = 1 #Default is 1 (yes); 0 = no plots are drawn or saved at all
+PlotWorkers = 0 #Default is 0 (one per CPU core); number of processes drawing the plots queued during the reduction (1 = drawn in this process, as they always are off Linux)
+HighResRebin = 1 #Default is 1 (every pixel); 2, 4 or 8 = reduces the HighRes ('B') panel as summed 2x2, 4x4 or 8x8 pixel blocks, e.g. the whole panel (ConvertHighResToSubset = 0) at about the cost of the subset
+SinglePrecision = 0 #Default is 0 (float64); 1 = per pixel maps and scaled data in float32 and masks as uint8 (1D sums are still float64), check with check_precision()
+
+Default_Settings = {Name : globals()[Name] for Name in ['MaxOpenFiles', 'PanelCacheMB', 'UseMetadataIndex', 'SaveBlockedBeamRates', 'SaveGeometryCache',
+                                                       'ParallelWorkers', 'PolCorrUncertainty', 'YesNo_TextOutput', 'YesNo_HDF5Output',
+                                                       'UseIncrementalReduction', 'LiveReduction', 'LivePollSeconds', 'Headless', 'SavePlots',
+                                                       'PlotWorkers', 'HighResRebin', 'SinglePrecision']}
+#The remaining UserInput.py settings have no default and must be given (see ExampleUserInput.py)
+Required_Settings = ['input_path', 'save_path', 'Excluded_Filenumbers', 'ReAssignBlockBeam', 'ReAssignEmpty', 'ReAssignOpen', 'YesNoRenameEmpties',
+                     'Min_Filenumber', 'Max_Filenumber', 'Min_Scatt_Filenumber', 'Max_Scatt_Filenumber', 'Min_Trans_Filenumber', 'Max_Trans_Filenumber',
+                     'TransPanel', 'SectorCutAngles', 'Slices', 'AutoSubtractEmpty', 'UseMTCirc', 'Calc_Q_From_Trans', 'TempDiffAllowedForSharingTrans',
+                     'AverageQRanges', 'Absolute_Q_min', 'Absolute_Q_max', 'YesNoShowPlots', 'YesNoSetPlotXRange', 'YesNoSetPlotYRange',
+                     'PlotXmin', 'PlotXmax', 'PlotYmin', 'PlotYmax', 'CompareFullPolSumCirc', 'CompareHalfPolSumCirc', 'CompareUnpolCirc',
+                     'CompareFullPolTypes', 'YesNo_2DCombinedFiles', 'YesNo_2DFilesPerDetector', 'HighResMinX', 'HighResMaxX', 'HighResMinY',
+                     'HighResMaxY', 'ConvertHighResToSubset', 'HighResGain', 'UsePolCorr', 'He3CorrectionType', 'YesNoBypassBestGuessPSM',
+                     'PSM_Guess', 'Minimum_PSM', 'YesNoManualHe3Entry', 'New_HE3_Files', 'MuValues', 'TeValues']
+
+class ReductionSettings(object):
+    '''
+    The UserInput.py values for one reduction, read and changed as attributes (Settings.UsePolCorr = 0).
+    ReductionSettings(input_path = ..., save_path = ..., ...) starts from Default_Settings and needs every name in Required_Settings;
+    ReductionSettings.from_file('UserInput.py') reads a UserInput.py-style file instead (keywords override its values).
+    Contents is the text recorded in DataReductionSummary.txt.
+    '''
+    def __init__(self, Contents = None, **Values):
+        self.__dict__['Values'] = dict(Default_Settings)
+        self.Values.update(Values)
+        self.__dict__['Contents'] = Contents
+
+    @classmethod
+    def from_file(cls, FileName = 'UserInput.py', **Overrides):
+        with open(FileName, 'r') as h:
+            Contents = h.read()
+        Namespace = {}
+        exec(compile(Contents, FileName, 'exec'), Namespace)
+        Values = {Name : Value for Name, Value in Namespace.items() if not Name.startswith('_') and not isinstance(Value, type(os))}
+        Values.update(Overrides)
+        return cls(Contents = Contents, **Values)
+
+    def __getattr__(self, Name):
+        Values = self.__dict__.get('Values', {})
+        if Name in Values:
+            return Values[Name]
+        raise AttributeError(Name)
+
+    def __setattr__(self, Name, Value):
+        self.Values[Name] = Value
+
+    def Missing(self):
+        return [Name for Name in Required_Settings if Name not in self.Values]
+
+    def Record(self):
+        if self.Contents is not None:
+            return self.Contents
+        return ''.join('{} = {!r}\n'.format(Name, Value) for Name, Value in self.Values.items())
 
 '''
 Note about User-Defined Masks (which are added in additiona to the detector shadowing already accounted for):
@@ -25,26 +100,168 @@ the data with that filenumber must be in the data folder (used to match configur
 
 all_detectors = ["B", "MT", "MB", "MR", "ML", "FT", "FB", "FR", "FL"]
 short_detectors = ["MT", "MB", "MR", "ML", "FT", "FB", "FR", "FL"]
-file_objects = {}
+file_objects = OrderedDict()
+file_object_stats = {'Hits' : 0, 'Misses' : 0, 'Evictions' : 0}
+panel_data = OrderedDict()
+panel_data_stats = {'Hits' : 0, 'Misses' : 0, 'Evictions' : 0, 'Bytes' : 0}
 
 def get_by_filenumber(filenumber, cache=True):
+    #Open files are kept in file_objects in least-recently-used order; once more than MaxOpenFiles
+    #are open the oldest is closed (it is simply reopened if asked for again).
     if filenumber in file_objects:
+        file_object_stats['Hits'] += 1
+        file_objects.move_to_end(filenumber)
         return file_objects[filenumber]
     else:
         filename = "sans" + str(filenumber) + ".nxs.ngv"
         fullpath = os.path.join(input_path, filename)
         if os.path.isfile(fullpath):
+            file_object_stats['Misses'] += 1
             file_object = h5py.File(fullpath, 'r')
-            file_objects[filenumber] = file_object
+            if cache:
+                file_objects[filenumber] = file_object
+                while len(file_objects) > max(1, int(MaxOpenFiles)):
+                    old_filenumber, old_file_object = file_objects.popitem(last=False)
+                    old_file_object.close()
+                    file_object_stats['Evictions'] += 1
             return file_object
         else:
             return None
 
+def get_panel_data(filenumber, dshort):
+    #Uses f = get_by_filenumber(filenumber)
+    #Each detector panel array is read (and decompressed) once and kept in panel_data, keyed by (filenumber, dshort), in
+    #least-recently-used order until the arrays take more than PanelCacheMB. The arrays are shared so they are read-only;
+    #copy before changing them in place.
+    key = (filenumber, dshort)
+    if key in panel_data:
+        panel_data_stats['Hits'] += 1
+        panel_data.move_to_end(key)
+        return panel_data[key]
+    f = get_by_filenumber(filenumber)
+    if f is None:
+        return None
+    panel_data_stats['Misses'] += 1
+    data = np.array(f['entry/instrument/detector_{ds}/data'.format(ds=dshort)])
+    return cache_panel_data(key, data)
+
+def cache_panel_data(key, data):
+    #Stores a (read-only) panel array in panel_data, dropping the least recently used arrays once they take more than PanelCacheMB
+    data.flags.writeable = False
+    panel_data[key] = data
+    panel_data_stats['Bytes'] += data.nbytes
+    while panel_data_stats['Bytes'] > PanelCacheMB*1024*1024 and len(panel_data) > 1:
+        old_key, old_data = panel_data.popitem(last=False)
+        panel_data_stats['Bytes'] -= old_data.nbytes
+        panel_data_stats['Evictions'] += 1
+    return data
+
+def highres_region():
+    #The HighResMin/Max X/Y part of the 'B' panel kept when ConvertHighResToSubset > 0
+    return (slice(HighResMinX, HighResMaxX+1), slice(HighResMinY, HighResMaxY+1))
+
+HighRes_Levels = [1, 2, 4, 8]
+
+def highres_blocks(data, level):
+    #View of a 2D panel array as (rows/level, level, columns/level, level) blocks; rows and columns that do not fill a whole block are dropped
+    X = (data.shape[0]//level)*level
+    Y = (data.shape[1]//level)*level
+    return data[:X, :Y].reshape(X//level, level, Y//level, level)
+
+def highres_rebin(data, level, Aggregate = np.sum):
+    #Combines level x level blocks of a 2D panel array with Aggregate (np.sum for counts, np.mean for efficiencies, np.min or np.max for masks)
+    if level <= 1:
+        return data
+    return Aggregate(highres_blocks(data, level), axis=(1, 3))
+
+def read_panel_region(dataset, region):
+    #Reads only dataset[region]: through a memory map of the file when the dataset is stored contiguous and uncompressed (only the
+    #pages holding the region are read), otherwise as an HDF5 hyperslab (only the chunks overlapping the region are read and decompressed)
+    offset = dataset.id.get_offset()
+    if dataset.chunks is None and offset is not None and dataset.file.driver == 'sec2':
+        mapped = np.memmap(dataset.file.filename, dtype=dataset.dtype, mode='r', offset=offset, shape=dataset.shape)
+        return np.array(mapped[region])
+    return dataset[region]
+
+def get_panel_subset(filenumber, dshort):
+    #Uses f = get_by_filenumber(filenumber)
+    #The panel as the reduction uses it: get_panel_data, except that with ConvertHighResToSubset > 0 only the highres_region() of the
+    #'B' panel is read from the file, so the B panel costs the subset size rather than the whole detector, and with HighResRebin > 1
+    #the B counts are summed in HighResRebin x HighResRebin blocks; the result is what is kept in panel_data.
+    if dshort != 'B' or (ConvertHighResToSubset <= 0 and HighResRebin <= 1):
+        return get_panel_data(filenumber, dshort)
+    key = (filenumber, dshort, ConvertHighResToSubset > 0, HighResMinX, HighResMaxX, HighResMinY, HighResMaxY, HighResRebin)
+    if key in panel_data:
+        panel_data_stats['Hits'] += 1
+        panel_data.move_to_end(key)
+        return panel_data[key]
+    if ConvertHighResToSubset > 0 and (filenumber, dshort) in panel_data:
+        panel_data_stats['Hits'] += 1
+        data = panel_data[(filenumber, dshort)][highres_region()]
+        if HighResRebin <= 1:
+            return data
+    elif ConvertHighResToSubset > 0:
+        f = get_by_filenumber(filenumber)
+        if f is None:
+            return None
+        panel_data_stats['Misses'] += 1
+        data = read_panel_region(f['entry/instrument/detector_{ds}/data'.format(ds=dshort)], highres_region())
+    else:
+        data = get_panel_data(filenumber, dshort)
+        if data is None:
+            return None
+    return cache_panel_data(key, highres_rebin(data, HighResRebin))
+
+def get_panel_shape(filenumber, dshort):
+    #Uses f = get_by_filenumber(filenumber)
+    #Shape and dtype of a detector panel from the dataset header; the counts themselves are not read.
+    key = (filenumber, dshort)
+    if key in panel_data:
+        return panel_data[key].shape, panel_data[key].dtype
+    f = get_by_filenumber(filenumber)
+    if f is None:
+        return None, None
+    dataset = f['entry/instrument/detector_{ds}/data'.format(ds=dshort)]
+    return dataset.shape, dataset.dtype
+
+def close_all_files():
+    while len(file_objects) > 0:
+        old_filenumber, old_file_object = file_objects.popitem(last=False)
+        old_file_object.close()
+    panel_data.clear()
+    panel_data_stats['Bytes'] = 0
+    return
+
+def forget_file(filenumber):
+    #Drops everything held in memory for a data file that was rewritten on disk: its open handle, its panel arrays, the
+    #transmissions that used it (as transmission or blocked beam file) and the blocked beam rates (cheap to rebuild)
+    if filenumber in file_objects:
+        file_objects.pop(filenumber).close()
+    for key in [key for key in panel_data if key[0] == filenumber]:
+        panel_data_stats['Bytes'] -= panel_data.pop(key).nbytes
+    for key in [key for key in trans_results if key[0] == filenumber or filenumber in key[1]]:
+        del trans_results[key]
+    blocked_beam_rates.clear()
+    return
+
+def forget_all_files():
+    #As forget_file, for every data file (used when input_path changes between reductions)
+    close_all_files()
+    trans_results.clear()
+    blocked_beam_rates.clear()
+    return
+
+def print_file_stats():
+    print('Data file handles: hits', file_object_stats['Hits'], ', misses (opened)', file_object_stats['Misses'], ', evictions (closed)', file_object_stats['Evictions'], ', still open', len(file_objects), 'of max', MaxOpenFiles)
+    print('Detector panel arrays: hits', panel_data_stats['Hits'], ', misses (read)', panel_data_stats['Misses'], ', evictions', panel_data_stats['Evictions'], ', held', len(panel_data), 'using', round(panel_data_stats['Bytes']/(1024*1024), 1), 'of max', PanelCacheMB, 'MB')
+    return
+
 def VSANS_GetBeamCenter(filenumber, dshort, trans_max_width_pixels):
     #Uses f = get_by_filenumber(filenumber)
+    from scipy import ndimage
 
     f = get_by_filenumber(filenumber)
-    data = np.array(f['entry/instrument/detector_{ds}/data'.format(ds=dshort)])
+    data = get_panel_data(filenumber, dshort)
     beam_center_x = f['entry/instrument/detector_{ds}/beam_center_x'.format(ds=dshort)][0]
     beam_center_y = f['entry/instrument/detector_{ds}/beam_center_y'.format(ds=dshort)][0]
     x_width, y_width = np.shape(data)
@@ -263,11 +480,128 @@ def VSANS_Config_ID(filenumber):
             Configuration_ID = str(Guides) + "Gd" + str(Desired_FrontCarriage_Distance) + "cmF" + str(Desired_MiddleCarriage_Distance) + "cmM" + str(Wavelength) + "Ang"
     return Configuration_ID
 
-def VSANS_SortDataAutomaticAlt(YesNoManualHe3Entry, New_HE3_Files, MuValues, TeValues):
+MetadataIndex_Name = 'VSANS_MetadataIndex.npz'
+MetadataIndex_Version = 2
+MetadataIndex_TextFields = ['Filename', 'Sample_Base', 'Sample_Name', 'Descrip', 'Listed_Config', 'Temp', 'Purpose', 'Intent', 'PolarizationState', 'Config', 'He3_Name']
+#Numeric columns keep the NeXus storage types so that values match those read directly from the files (integer columns use -1 when absent)
+MetadataIndex_NumberFields = {'Filenumber' : np.int64, 'File_Size' : np.int64, 'File_Mtime' : np.float64, 'Count_time' : np.float32, 'End_time' : np.float64,
+                              'Monitor_Counts' : np.int64, 'Attenuators_Dropped' : np.int64, 'Wavelength' : np.float32,
+                              'He3_Timestamp' : np.int64, 'He3_Opacity' : np.float32, 'He3_GlassTrans' : np.float32}
+for dshort in all_detectors:
+    MetadataIndex_NumberFields['Integrated_Count_' + dshort] = np.float32
+
+def VSANS_ReadFileMetadata(filenumber):
     #Uses get_by_filenumber(filenumber)
     #Uses VSANS_Sample_BaseNameDescrip(filenumber)
     #Uses VSANS_PurposeIntentPolarizationSolenoid(filenumber)
     #Uses VSANS_Config_ID(filenumber)
+    #Returns one row of the metadata index (dictionary of scalars) or None if the file cannot be found
+
+    Row = {}
+    f = get_by_filenumber(filenumber)
+    if f is None:
+        return None
+    Sample_Base, Sample_Name, Descrip, Listed_Config, Temp = VSANS_Sample_BaseNameDescrip(filenumber)
+    Purpose, Intent, PolarizationState, FrontPolDirection, BackPolDirection, SolenoidPosition = VSANS_PurposeIntentPolarizationSolenoid(filenumber)
+    Row['Sample_Base'] = Sample_Base
+    Row['Sample_Name'] = Sample_Name
+    Row['Descrip'] = Descrip
+    Row['Listed_Config'] = Listed_Config
+    Row['Temp'] = Temp
+    Row['Purpose'] = Purpose
+    Row['Intent'] = Intent
+    Row['PolarizationState'] = PolarizationState
+    Row['Config'] = VSANS_Config_ID(filenumber)
+    Row['Count_time'] = f['entry/collection_time'][0]
+    from dateutil import parser as dateutil_parser
+    Row['End_time'] = dateutil_parser.parse(f['entry/end_time'][0]).timestamp()
+    Row['Monitor_Counts'] = f['entry/control/monitor_counts'][0]
+    Row['Attenuators_Dropped'] = -1
+    if 'entry/instrument/attenuator/num_atten_dropped' in f:
+        Row['Attenuators_Dropped'] = f['entry/instrument/attenuator/num_atten_dropped'][0]
+    Row['Wavelength'] = np.nan
+    if 'entry/DAS_logs/wavelength/wavelength' in f:
+        Row['Wavelength'] = f['entry/DAS_logs/wavelength/wavelength'][0]
+    for dshort in all_detectors:
+        Row['Integrated_Count_' + dshort] = np.nan
+        if 'entry/instrument/detector_{ds}/integrated_count'.format(ds=dshort) in f:
+            Row['Integrated_Count_' + dshort] = f['entry/instrument/detector_{ds}/integrated_count'.format(ds=dshort)][0]
+    Row['He3_Name'] = ''
+    Row['He3_Timestamp'] = -1
+    Row['He3_Opacity'] = np.nan
+    Row['He3_GlassTrans'] = np.nan
+    if "backPolarization" in f['entry/DAS_logs/']:
+        if 'name' in f['entry/DAS_logs/backPolarization']:
+            CellName = str(f['entry/DAS_logs/backPolarization/name'][0])
+            Row['He3_Name'] = CellName[2:-1]
+        if 'timestamp' in f['entry/DAS_logs/backPolarization']:
+            Row['He3_Timestamp'] = f['entry/DAS_logs/backPolarization/timestamp'][0]
+        if 'opacityAt1Ang' in f['entry/DAS_logs/backPolarization']:
+            Row['He3_Opacity'] = f['entry/DAS_logs/backPolarization/opacityAt1Ang'][0]
+        if 'glassTransmission' in f['entry/DAS_logs/backPolarization']:
+            Row['He3_GlassTrans'] = f['entry/DAS_logs/backPolarization/glassTransmission'][0]
+
+    return Row
+
+def VSANS_MetadataIndex(data_path):
+    #Uses VSANS_ReadFileMetadata(filenumber)
+    #Returns a columnar catalog (dictionary of numpy arrays, one entry per .nxs.ngv file sorted by filename).
+    #If UseMetadataIndex > 0 the catalog is saved as MetadataIndex_Name in save_path (never in the data folder) and rows are reused on
+    #later runs of the same data_path for files whose size and modification time are unchanged, so only new or rewritten files are opened.
+
+    filelist = [fn for fn in os.listdir(data_path) if fn.endswith(".nxs.ngv")]
+    filelist.sort()
+
+    Previous = {}
+    index_fullpath = os.path.join(save_path, MetadataIndex_Name)
+    if UseMetadataIndex > 0 and os.path.isfile(index_fullpath):
+        try:
+            with np.load(index_fullpath, allow_pickle=False) as saved:
+                if int(saved['Index_Version']) == MetadataIndex_Version and str(saved['Data_Path']) == os.path.abspath(data_path) and all(name in saved for name in MetadataIndex_TextFields + list(MetadataIndex_NumberFields)):
+                    Columns = {name : saved[name] for name in MetadataIndex_TextFields + list(MetadataIndex_NumberFields)}
+                    for row in range(len(Columns['Filename'])):
+                        Previous[str(Columns['Filename'][row])] = {name : Columns[name][row] for name in Columns}
+        except (OSError, ValueError, KeyError):
+            print('Could not read', index_fullpath, '; re-reading all data files')
+            Previous = {}
+
+    Rows = []
+    files_read = 0
+    for filename in filelist:
+        fullpath = os.path.join(data_path, filename)
+        file_stat = os.stat(fullpath)
+        if filename in Previous and Previous[filename]['File_Size'] == file_stat.st_size and Previous[filename]['File_Mtime'] == file_stat.st_mtime:
+            Rows.append(Previous[filename])
+        else:
+            filenumber = int(filename[4:9])
+            Row = VSANS_ReadFileMetadata(filenumber)
+            if Row is None:
+                continue
+            Row['Filename'] = filename
+            Row['Filenumber'] = filenumber
+            Row['File_Size'] = file_stat.st_size
+            Row['File_Mtime'] = file_stat.st_mtime
+            Rows.append(Row)
+            files_read += 1
+
+    Index = {}
+    for name in MetadataIndex_TextFields:
+        Index[name] = np.array([str(Row[name]) for Row in Rows], dtype=str)
+    for name in MetadataIndex_NumberFields:
+        Index[name] = np.array([Row[name] for Row in Rows], dtype=MetadataIndex_NumberFields[name])
+
+    if UseMetadataIndex > 0:
+        print('Metadata index:', len(Rows), 'files catalogued,', files_read, 'read from disk')
+        if files_read > 0 or len(Previous) != len(Rows):
+            try:
+                np.savez(index_fullpath, Index_Version=MetadataIndex_Version, Data_Path=os.path.abspath(data_path), **Index)
+            except OSError:
+                print('Could not save metadata index to', index_fullpath)
+
+    return Index
+
+def VSANS_SortDataAutomaticAlt(YesNoManualHe3Entry, New_HE3_Files, MuValues, TeValues):
+    #Uses VSANS_MetadataIndex(input_path), which reads each file once via VSANS_ReadFileMetadata(filenumber)
     
     Sample_Names = {}
     Sample_Bases = {}
@@ -290,125 +624,238 @@ def VSANS_SortDataAutomaticAlt(YesNoManualHe3Entry, New_HE3_Files, MuValues, TeV
     CellIdentifier = 0
     HE3OUT_filenumber = -10
 
-    filelist = [fn for fn in os.listdir(input_path) if fn.endswith(".nxs.ngv")] #or filenames = [fn for fn in os.listdir("./") if os.path.isfile(fn)]
-    filelist.sort()
-    if len(filelist) >= 1:
-        for filename in filelist:
-            filenumber = int(filename[4:9])
+    Index = VSANS_MetadataIndex(input_path)
+    if len(Index['Filenumber']) >= 1:
+        for row in range(len(Index['Filenumber'])):
+            filenumber = int(Index['Filenumber'][row])
             if filenumber >= Min_Filenumber and filenumber <= Max_Filenumber:
                 if start_number == 0:
                     start_number = filenumber
-                f = get_by_filenumber(filenumber)
-                if f is not None:
-                    Sample_Base, Sample_Name, Descrip, ListedConfig, Temp = VSANS_Sample_BaseNameDescrip(filenumber)
-                    Purpose, Intent, PolarizationState, FrontPolDirection, BackPolDirection, SolenoidPosition = VSANS_PurposeIntentPolarizationSolenoid(filenumber)
-                    Config = VSANS_Config_ID(filenumber)
-                    Count_time = f['entry/collection_time'][0]
-                    End_time = dateutil.parser.parse(f['entry/end_time'][0])
-                    TimeOfMeasurement = (End_time.timestamp() - Count_time/2)/3600.0 #in hours
-                    if filenumber not in Excluded_Filenumbers and 'UNKNOWN' not in Config and Count_time > 29: #and str(Descrip).find("Align") == -1 and str(Descrip).find("align") == -1:
-                        print('Reading:', filenumber, ' ', Sample_Base, Descrip)
-                        FileNumberList.append(filenumber)
-                        if Config not in Configs and 'SCATT' in Purpose and 'Block' not in Intent:
-                            Configs[Config] = filenumber
-
-                        if 'Block' in Intent:
-                            if Config not in BlockBeam:
-                                BlockBeam[Config] = {'Scatt':{'File' : 'NA'}, 'Trans':{'File' : 'NA', 'CountsPerSecond' : 'NA'}, 'ExampleFile' : filenumber}
-                            Trans_Counts = f['entry/instrument/detector_{ds}/integrated_count'.format(ds=TransPanel)][0]
-                            if 'TRANS' in Purpose or 'HE3' in Purpose:
-                                if 'NA' in BlockBeam[Config]['Trans']['File']:
-                                    BlockBeam[Config]['Trans']['File'] = [filenumber]
-                                    BlockBeam[Config]['Trans']['CountsPerSecond'] = [Trans_Counts/Count_time]
-                                else:
-                                    BlockBeam[Config]['Trans']['File'].append(filenumber)
-                                    BlockBeam[Config]['Trans']['CountsPerSecond'].append(Trans_Counts/Count_time)
-                            elif 'SCATT' in Purpose:
-                                if 'NA' in BlockBeam[Config]['Scatt']['File']:
-                                    BlockBeam[Config]['Scatt']['File'] = [filenumber]
-                                else:
-                                    BlockBeam[Config]['Scatt']['File'].append(filenumber)
-
-
-                        elif 'SCATT' in Purpose and filenumber >= Min_Scatt_Filenumber and filenumber <= Max_Scatt_Filenumber:
-                            if len(Sample_Names) < 1:
-                                Sample_Names = [Sample_Name]
+                Sample_Base = str(Index['Sample_Base'][row])
+                Sample_Name = str(Index['Sample_Name'][row])
+                Descrip = str(Index['Descrip'][row])
+                ListedConfig = str(Index['Listed_Config'][row])
+                Temp = str(Index['Temp'][row])
+                Purpose = str(Index['Purpose'][row])
+                Intent = str(Index['Intent'][row])
+                PolarizationState = str(Index['PolarizationState'][row])
+                Config = str(Index['Config'][row])
+                Count_time = Index['Count_time'][row]
+                TimeOfMeasurement = (Index['End_time'][row] - Count_time/2)/3600.0 #in hours
+                if filenumber not in Excluded_Filenumbers and 'UNKNOWN' not in Config and Count_time > 29: #and str(Descrip).find("Align") == -1 and str(Descrip).find("align") == -1:
+                    print('Reading:', filenumber, ' ', Sample_Base, Descrip)
+                    FileNumberList.append(filenumber)
+                    if Config not in Configs and 'SCATT' in Purpose and 'Block' not in Intent:
+                        Configs[Config] = filenumber
+
+                    if 'Block' in Intent:
+                        if Config not in BlockBeam:
+                            BlockBeam[Config] = {'Scatt':{'File' : 'NA'}, 'Trans':{'File' : 'NA', 'CountsPerSecond' : 'NA'}, 'ExampleFile' : filenumber}
+                        Trans_Counts = Index['Integrated_Count_' + TransPanel][row]
+                        if 'TRANS' in Purpose or 'HE3' in Purpose:
+                            if 'NA' in BlockBeam[Config]['Trans']['File']:
+                                BlockBeam[Config]['Trans']['File'] = [filenumber]
+                                BlockBeam[Config]['Trans']['CountsPerSecond'] = [Trans_Counts/Count_time]
                             else:
-                                if Sample_Name not in Sample_Names:
-                                    Sample_Names.append(Sample_Name)
-                            if len(Sample_Bases) < 1:
-                                Sample_Bases = [Sample_Base]
+                                BlockBeam[Config]['Trans']['File'].append(filenumber)
+                                BlockBeam[Config]['Trans']['CountsPerSecond'].append(Trans_Counts/Count_time)
+                        elif 'SCATT' in Purpose:
+                            if 'NA' in BlockBeam[Config]['Scatt']['File']:
+                                BlockBeam[Config]['Scatt']['File'] = [filenumber]
                             else:
-                                if Sample_Base not in Sample_Bases:
-                                    Sample_Bases.append(Sample_Base)
+                                BlockBeam[Config]['Scatt']['File'].append(filenumber)
+
+
+                    elif 'SCATT' in Purpose and filenumber >= Min_Scatt_Filenumber and filenumber <= Max_Scatt_Filenumber:
+                        if len(Sample_Names) < 1:
+                            Sample_Names = [Sample_Name]
+                        else:
+                            if Sample_Name not in Sample_Names:
+                                Sample_Names.append(Sample_Name)
+                        if len(Sample_Bases) < 1:
+                            Sample_Bases = [Sample_Base]
+                        else:
+                            if Sample_Base not in Sample_Bases:
+                                Sample_Bases.append(Sample_Base)
 
                                 
-                            if Sample_Name not in Scatt:
-                                Scatt[Sample_Name] = {'Temp' : Temp, 'Intent': Intent, 'Sample_Base': Sample_Base, 'Config(s)' : {Config : {'Unpol': 'NA', 'U' : 'NA', 'D' : 'NA','UU' : 'NA', 'DU' : 'NA', 'DD' : 'NA', 'UD' : 'NA', 'UU_Time' : 'NA', 'DU_Time' : 'NA', 'DD_Time' : 'NA', 'UD_Time' : 'NA'}}}
-                            if Config not in Scatt[Sample_Name]['Config(s)']:
-                                Scatt[Sample_Name]['Config(s)'][Config] = {'Unpol': 'NA', 'U' : 'NA', 'D' : 'NA','UU' : 'NA', 'DU' : 'NA', 'DD' : 'NA', 'UD' : 'NA', 'UU_Time' : 'NA', 'DU_Time' : 'NA', 'DD_Time' : 'NA', 'UD_Time' : 'NA'}
+                        if Sample_Name not in Scatt:
+                            Scatt[Sample_Name] = {'Temp' : Temp, 'Intent': Intent, 'Sample_Base': Sample_Base, 'Config(s)' : {Config : {'Unpol': 'NA', 'U' : 'NA', 'D' : 'NA','UU' : 'NA', 'DU' : 'NA', 'DD' : 'NA', 'UD' : 'NA', 'UU_Time' : 'NA', 'DU_Time' : 'NA', 'DD_Time' : 'NA', 'UD_Time' : 'NA'}}}
+                        if Config not in Scatt[Sample_Name]['Config(s)']:
+                            Scatt[Sample_Name]['Config(s)'][Config] = {'Unpol': 'NA', 'U' : 'NA', 'D' : 'NA','UU' : 'NA', 'DU' : 'NA', 'DD' : 'NA', 'UD' : 'NA', 'UU_Time' : 'NA', 'DU_Time' : 'NA', 'DD_Time' : 'NA', 'UD_Time' : 'NA'}
                         
-                            if 'UNPOL' in PolarizationState:
-                                if 'NA' in Scatt[Sample_Name]['Config(s)'][Config]['Unpol']:
-                                    Scatt[Sample_Name]['Config(s)'][Config]['Unpol'] = [filenumber]
-                                else:
-                                    Scatt[Sample_Name]['Config(s)'][Config]['Unpol'].append(filenumber)
-                            if 'Front_U' in PolarizationState:
-                                if 'NA' in Scatt[Sample_Name]['Config(s)'][Config]['U']:
-                                    Scatt[Sample_Name]['Config(s)'][Config]['U'] = [filenumber]
-                                else:
-                                    Scatt[Sample_Name]['Config(s)'][Config]['U'].append(filenumber)
-                            if 'Front_D' in PolarizationState:
-                                if 'NA' in Scatt[Sample_Name]['Config(s)'][Config]['D']:
-                                    Scatt[Sample_Name]['Config(s)'][Config]['D'] = [filenumber]
-                                else:
-                                    Scatt[Sample_Name]['Config(s)'][Config]['D'].append(filenumber)
-                            if 'UU' in PolarizationState:
-                                if 'NA' in Scatt[Sample_Name]['Config(s)'][Config]['UU']:
-                                    Scatt[Sample_Name]['Config(s)'][Config]['UU'] = [filenumber]
-                                    Scatt[Sample_Name]['Config(s)'][Config]['UU_Time'] = [TimeOfMeasurement]
-                                else:
-                                    Scatt[Sample_Name]['Config(s)'][Config]['UU'].append(filenumber)
-                                    Scatt[Sample_Name]['Config(s)'][Config]['UU_Time'].append(TimeOfMeasurement)
-                            if 'DU' in PolarizationState:
-                                if 'NA' in Scatt[Sample_Name]['Config(s)'][Config]['DU']:
-                                    Scatt[Sample_Name]['Config(s)'][Config]['DU'] = [filenumber]
-                                    Scatt[Sample_Name]['Config(s)'][Config]['DU_Time'] = [TimeOfMeasurement]
-                                else:
-                                    Scatt[Sample_Name]['Config(s)'][Config]['DU'].append(filenumber)
-                                    Scatt[Sample_Name]['Config(s)'][Config]['DU_Time'].append(TimeOfMeasurement)
-                            if 'DD' in PolarizationState:
-                                if 'NA' in Scatt[Sample_Name]['Config(s)'][Config]['DD']:
-                                    Scatt[Sample_Name]['Config(s)'][Config]['DD'] = [filenumber]
-                                    Scatt[Sample_Name]['Config(s)'][Config]['DD_Time'] = [TimeOfMeasurement]
-                                else:
-                                    Scatt[Sample_Name]['Config(s)'][Config]['DD'].append(filenumber)
-                                    Scatt[Sample_Name]['Config(s)'][Config]['DD_Time'].append(TimeOfMeasurement)
-                            if 'UD' in PolarizationState:
-                                if 'NA' in Scatt[Sample_Name]['Config(s)'][Config]['UD']:
-                                    Scatt[Sample_Name]['Config(s)'][Config]['UD'] = [filenumber]
-                                    Scatt[Sample_Name]['Config(s)'][Config]['UD_Time'] = [TimeOfMeasurement]
-                                else:
-                                    Scatt[Sample_Name]['Config(s)'][Config]['UD'].append(filenumber)
-                                    Scatt[Sample_Name]['Config(s)'][Config]['UD_Time'].append(TimeOfMeasurement)
-
-                        elif 'TRANS' in Purpose and 'FR' in ListedConfig and filenumber >= Min_Trans_Filenumber and filenumber <= Max_Trans_Filenumber:
-                            if Sample_Name not in AlignDet_Trans:
-                                AlignDet_Trans[Sample_Name] = {'Temp' : Temp, 'Intent': Intent, 'Sample_Base': Sample_Base, 'Config(s)' : {Config : {'FR_Unpol_Files': 'NA', 'FR_Pol_Files' : 'NA', 'MR_Unpol_Files': 'NA', 'MR_Pol_Files' : 'NA'}}}
-                            if Config not in AlignDet_Trans[Sample_Name]['Config(s)']:
-                                AlignDet_Trans[Sample_Name]['Config(s)'][Config] = {'FR_Unpol_Files': 'NA', 'FR_Pol_Files' : 'NA', 'MR_Unpol_Files': 'NA', 'MR_Pol_Files' : 'NA'}
-                            if 'UNPOL' in PolarizationState:
-                                if 'NA' in AlignDet_Trans[Sample_Name]['Config(s)'][Config]['FR_Unpol_Files']:
-                                    AlignDet_Trans[Sample_Name]['Config(s)'][Config]['FR_Unpol_Files'] = [filenumber]
-                                else:
-                                    AlignDet_Trans[Sample_Name]['Config(s)'][Config]['FR_Unpol_Files'].append(filenumber)
-                            if 'Front_U' in PolarizationState or 'Front_D' in PolarizationState or 'UU' in PolarizationState or 'DD' in PolarizationState:
-                                if 'NA' in AlignDet_Trans[Sample_Name]['Config(s)'][Config]['FR_Pol_Files']:
-                                    AlignDet_Trans[Sample_Name]['Config(s)'][Config]['FR_Pol_Files'] = [filenumber]
+                        if 'UNPOL' in PolarizationState:
+                            if 'NA' in Scatt[Sample_Name]['Config(s)'][Config]['Unpol']:
+                                Scatt[Sample_Name]['Config(s)'][Config]['Unpol'] = [filenumber]
+                            else:
+                                Scatt[Sample_Name]['Config(s)'][Config]['Unpol'].append(filenumber)
+                        if 'Front_U' in PolarizationState:
+                            if 'NA' in Scatt[Sample_Name]['Config(s)'][Config]['U']:
+                                Scatt[Sample_Name]['Config(s)'][Config]['U'] = [filenumber]
+                            else:
+                                Scatt[Sample_Name]['Config(s)'][Config]['U'].append(filenumber)
+                        if 'Front_D' in PolarizationState:
+                            if 'NA' in Scatt[Sample_Name]['Config(s)'][Config]['D']:
+                                Scatt[Sample_Name]['Config(s)'][Config]['D'] = [filenumber]
+                            else:
+                                Scatt[Sample_Name]['Config(s)'][Config]['D'].append(filenumber)
+                        if 'UU' in PolarizationState:
+                            if 'NA' in Scatt[Sample_Name]['Config(s)'][Config]['UU']:
+                                Scatt[Sample_Name]['Config(s)'][Config]['UU'] = [filenumber]
+                                Scatt[Sample_Name]['Config(s)'][Config]['UU_Time'] = [TimeOfMeasurement]
+                            else:
+                                Scatt[Sample_Name]['Config(s)'][Config]['UU'].append(filenumber)
+                                Scatt[Sample_Name]['Config(s)'][Config]['UU_Time'].append(TimeOfMeasurement)
+                        if 'DU' in PolarizationState:
+                            if 'NA' in Scatt[Sample_Name]['Config(s)'][Config]['DU']:
+                                Scatt[Sample_Name]['Config(s)'][Config]['DU'] = [filenumber]
+                                Scatt[Sample_Name]['Config(s)'][Config]['DU_Time'] = [TimeOfMeasurement]
+                            else:
+                                Scatt[Sample_Name]['Config(s)'][Config]['DU'].append(filenumber)
+                                Scatt[Sample_Name]['Config(s)'][Config]['DU_Time'].append(TimeOfMeasurement)
+                        if 'DD' in PolarizationState:
+                            if 'NA' in Scatt[Sample_Name]['Config(s)'][Config]['DD']:
+                                Scatt[Sample_Name]['Config(s)'][Config]['DD'] = [filenumber]
+                                Scatt[Sample_Name]['Config(s)'][Config]['DD_Time'] = [TimeOfMeasurement]
+                            else:
+                                Scatt[Sample_Name]['Config(s)'][Config]['DD'].append(filenumber)
+                                Scatt[Sample_Name]['Config(s)'][Config]['DD_Time'].append(TimeOfMeasurement)
+                        if 'UD' in PolarizationState:
+                            if 'NA' in Scatt[Sample_Name]['Config(s)'][Config]['UD']:
+                                Scatt[Sample_Name]['Config(s)'][Config]['UD'] = [filenumber]
+                                Scatt[Sample_Name]['Config(s)'][Config]['UD_Time'] = [TimeOfMeasurement]
+                            else:
+                                Scatt[Sample_Name]['Config(s)'][Config]['UD'].append(filenumber)
+                                Scatt[Sample_Name]['Config(s)'][Config]['UD_Time'].append(TimeOfMeasurement)
+
+                    elif 'TRANS' in Purpose and 'FR' in ListedConfig and filenumber >= Min_Trans_Filenumber and filenumber <= Max_Trans_Filenumber:
+                        if Sample_Name not in AlignDet_Trans:
+                            AlignDet_Trans[Sample_Name] = {'Temp' : Temp, 'Intent': Intent, 'Sample_Base': Sample_Base, 'Config(s)' : {Config : {'FR_Unpol_Files': 'NA', 'FR_Pol_Files' : 'NA', 'MR_Unpol_Files': 'NA', 'MR_Pol_Files' : 'NA'}}}
+                        if Config not in AlignDet_Trans[Sample_Name]['Config(s)']:
+                            AlignDet_Trans[Sample_Name]['Config(s)'][Config] = {'FR_Unpol_Files': 'NA', 'FR_Pol_Files' : 'NA', 'MR_Unpol_Files': 'NA', 'MR_Pol_Files' : 'NA'}
+                        if 'UNPOL' in PolarizationState:
+                            if 'NA' in AlignDet_Trans[Sample_Name]['Config(s)'][Config]['FR_Unpol_Files']:
+                                AlignDet_Trans[Sample_Name]['Config(s)'][Config]['FR_Unpol_Files'] = [filenumber]
+                            else:
+                                AlignDet_Trans[Sample_Name]['Config(s)'][Config]['FR_Unpol_Files'].append(filenumber)
+                        if 'Front_U' in PolarizationState or 'Front_D' in PolarizationState or 'UU' in PolarizationState or 'DD' in PolarizationState:
+                            if 'NA' in AlignDet_Trans[Sample_Name]['Config(s)'][Config]['FR_Pol_Files']:
+                                AlignDet_Trans[Sample_Name]['Config(s)'][Config]['FR_Pol_Files'] = [filenumber]
+                            else:
+                                AlignDet_Trans[Sample_Name]['Config(s)'][Config]['FR_Pol_Files'].append(filenumber)
+
+                    elif 'TRANS' in Purpose and 'FR' not in ListedConfig and filenumber >= Min_Trans_Filenumber and filenumber <= Max_Trans_Filenumber:
+                        if Sample_Name not in AlignDet_Trans:
+                            AlignDet_Trans[Sample_Name] = {'Temp' : Temp, 'Intent': Intent, 'Sample_Base': Sample_Base, 'Config(s)' : {Config : {'FR_Unpol_Files': 'NA', 'FR_Pol_Files' : 'NA', 'MR_Unpol_Files': 'NA', 'MR_Pol_Files' : 'NA'}}}
+                        if Config not in AlignDet_Trans[Sample_Name]['Config(s)']:
+                            AlignDet_Trans[Sample_Name]['Config(s)'][Config] = {'FR_Unpol_Files': 'NA', 'FR_Pol_Files' : 'NA', 'MR_Unpol_Files': 'NA', 'MR_Pol_Files' : 'NA'}
+                        if 'UNPOL' in PolarizationState:
+                            if 'NA' in AlignDet_Trans[Sample_Name]['Config(s)'][Config]['MR_Unpol_Files']:
+                                AlignDet_Trans[Sample_Name]['Config(s)'][Config]['MR_Unpol_Files'] = [filenumber]
+                            else:
+                                AlignDet_Trans[Sample_Name]['Config(s)'][Config]['MR_Unpol_Files'].append(filenumber)
+                        if 'Front_U' in PolarizationState or 'Front_D' in PolarizationState or 'UU' in PolarizationState or 'DD' in PolarizationState:
+                            if 'NA' in AlignDet_Trans[Sample_Name]['Config(s)'][Config]['MR_Pol_Files']:
+                                AlignDet_Trans[Sample_Name]['Config(s)'][Config]['MR_Pol_Files'] = [filenumber]
+                            else:
+                                AlignDet_Trans[Sample_Name]['Config(s)'][Config]['MR_Pol_Files'].append(filenumber)
+                                    
+                        if Sample_Name not in Trans:
+                            Trans[Sample_Name] = {'Intent': Intent, 'Sample_Base': Sample_Base, 'Config(s)' : {Config : {'Unpol_Files': 'NA', 'U_Files' : 'NA', 'D_Files' : 'NA','Unpol_Trans_Cts': 'NA', 'U_Trans_Cts' : 'NA', 'D_Trans_Cts' : 'NA'}}}
+                        if Config not in Trans[Sample_Name]['Config(s)']:
+                            Trans[Sample_Name]['Config(s)'][Config] = {'Unpol_Files': 'NA', 'U_Files' : 'NA', 'D_Files': 'NA','Unpol_Trans_Cts': 'NA', 'U_Trans_Cts' : 'NA', 'D_Trans_Cts' : 'NA'}
+                        if Sample_Name not in Pol_Trans:
+                            Pol_Trans[Sample_Name] = {'T_UU' : {'File' : 'NA'},
+                                                          'T_DU' : {'File' : 'NA'},
+                                                          'T_DD' : {'File' : 'NA'},
+                                                          'T_UD' : {'File' : 'NA'},
+                                                          'T_SM' : {'File' : 'NA'},
+                                                          'Config' : 'NA'}
+                        if 'UNPOL' in PolarizationState:
+                            if 'NA' in Trans[Sample_Name]['Config(s)'][Config]['Unpol_Files']:
+                                Trans[Sample_Name]['Config(s)'][Config]['Unpol_Files'] = [filenumber]
+                            else:
+                                Trans[Sample_Name]['Config(s)'][Config]['Unpol_Files'].append(filenumber)
+                        if 'Front_U' in PolarizationState:
+                            if 'NA' in Trans[Sample_Name]['Config(s)'][Config]['U_Files']:
+                                Trans[Sample_Name]['Config(s)'][Config]['U_Files'] = [filenumber]
+                            else:
+                                Trans[Sample_Name]['Config(s)'][Config]['U_Files'].append(filenumber)
+                        if 'Front_D' in PolarizationState:
+                            if 'NA' in Trans[Sample_Name]['Config(s)'][Config]['D_Files']:
+                                Trans[Sample_Name]['Config(s)'][Config]['D_Files'] = [filenumber]
+                            else:
+                                Trans[Sample_Name]['Config(s)'][Config]['D_Files'].append(filenumber)
+                        if 'UU' in PolarizationState:
+                            UU_filenumber = filenumber
+                            UU_Time = TimeOfMeasurement
+                        if 'DU' in PolarizationState:
+                            DU_filenumber = filenumber
+                            DU_Time = TimeOfMeasurement
+                        if 'DD' in PolarizationState:
+                            DD_filenumber = filenumber
+                            DD_Time = TimeOfMeasurement
+                        if 'UD' in PolarizationState:
+                            UD_filenumber = filenumber
+                            UD_Time = TimeOfMeasurement
+                        if 'Front_U' in PolarizationState:
+                            SM_filenumber = filenumber
+                            if SM_filenumber - UU_filenumber == 4:
+                                if 'NA' in Pol_Trans[Sample_Name]['T_UU']['File']:
+                                    Pol_Trans[Sample_Name]['T_UU']['File'] = [UU_filenumber]
+                                    Pol_Trans[Sample_Name]['T_UU']['Meas_Time'] = [UU_Time]
+                                    Pol_Trans[Sample_Name]['T_DU']['File'] = [DU_filenumber]
+                                    Pol_Trans[Sample_Name]['T_DU']['Meas_Time'] = [DU_Time]
+                                    Pol_Trans[Sample_Name]['T_DD']['File'] = [DD_filenumber]
+                                    Pol_Trans[Sample_Name]['T_DD']['Meas_Time'] = [DD_Time]
+                                    Pol_Trans[Sample_Name]['T_UD']['File'] = [UD_filenumber]
+                                    Pol_Trans[Sample_Name]['T_UD']['Meas_Time'] = [UD_Time]
+                                    Pol_Trans[Sample_Name]['T_SM']['File'] = [SM_filenumber]
+                                    Pol_Trans[Sample_Name]['Config'] = [Config]
                                 else:
-                                    AlignDet_Trans[Sample_Name]['Config(s)'][Config]['FR_Pol_Files'].append(filenumber)
+                                    Pol_Trans[Sample_Name]['T_UU']['File'].append(UU_filenumber)
+                                    Pol_Trans[Sample_Name]['T_UU']['Meas_Time'].append(UU_Time)
+                                    Pol_Trans[Sample_Name]['T_DU']['File'].append(DU_filenumber)
+                                    Pol_Trans[Sample_Name]['T_DU']['Meas_Time'].append(DU_Time)
+                                    Pol_Trans[Sample_Name]['T_DD']['File'].append(DD_filenumber)
+                                    Pol_Trans[Sample_Name]['T_DD']['Meas_Time'].append(DD_Time)
+                                    Pol_Trans[Sample_Name]['T_UD']['File'].append(UD_filenumber)
+                                    Pol_Trans[Sample_Name]['T_UD']['Meas_Time'].append(UD_Time)
+                                    Pol_Trans[Sample_Name]['T_SM']['File'].append(SM_filenumber)
+                                    Pol_Trans[Sample_Name]['Config'].append(Config)
+
+                    elif 'HE3' in Purpose:
+                        if YesNoManualHe3Entry == 1:
+                            if filenumber in New_HE3_Files:
+                                print('New He3 cell inserted at filenumber ', filenumber)
+                                ScaledOpacity = MuValues[CellIdentifier]
+                                TE = TeValues[CellIdentifier]
+                                CellTimeIdentifier = TimeOfMeasurement
+                                HE3Insert_Time = TimeOfMeasurement
+                                CellIdentifier += 1
+                                CellName = CellTimeIdentifier
+                        else:
+                            CellTimeIdentifier = Index['He3_Timestamp'][row]/3600000 #milliseconds to hours
+                            CellName = str(Index['He3_Name'][row])
+                            CellName = CellName + str(CellTimeIdentifier)
+                            if CellTimeIdentifier not in HE3_Trans:
+                                print('New He3 cell inserted at filenumber ', filenumber)
+                                HE3Insert_Time = Index['He3_Timestamp'][row]/3600000 #milliseconds to hours
+                                Opacity = Index['He3_Opacity'][row]
+                                Wavelength = Index['Wavelength'][row]
+                                ScaledOpacity = Opacity*Wavelength
+                                TE = Index['He3_GlassTrans'][row]
+                        HE3Type = Descrip
+                        if 'OUT' in HE3Type:
+                            if Sample_Name not in Trans:
+                                Trans[Sample_Name] = {'Intent': Intent, 'Sample_Base': Sample_Base, 'Config(s)' : {Config : {'Unpol_Files': 'NA', 'U_Files' : 'NA', 'D_Files' : 'NA','Unpol_Trans_Cts': 'NA', 'U_Trans_Cts' : 'NA', 'D_Trans_Cts' : 'NA'}}}
+                            if Config not in Trans[Sample_Name]['Config(s)']:
+                                Trans[Sample_Name]['Config(s)'][Config] = {'Unpol_Files': 'NA', 'U_Files' : 'NA', 'D_Files': 'NA','Unpol_Trans_Cts': 'NA', 'U_Trans_Cts' : 'NA', 'D_Trans_Cts' : 'NA'}
+                            if 'NA' in Trans[Sample_Name]['Config(s)'][Config]['Unpol_Files']:
+                                Trans[Sample_Name]['Config(s)'][Config]['Unpol_Files'] = [filenumber]
+                            else:
+                                Trans[Sample_Name]['Config(s)'][Config]['Unpol_Files'].append(filenumber)
 
-                        elif 'TRANS' in Purpose and 'FR' not in ListedConfig and filenumber >= Min_Trans_Filenumber and filenumber <= Max_Trans_Filenumber:
                             if Sample_Name not in AlignDet_Trans:
                                 AlignDet_Trans[Sample_Name] = {'Temp' : Temp, 'Intent': Intent, 'Sample_Base': Sample_Base, 'Config(s)' : {Config : {'FR_Unpol_Files': 'NA', 'FR_Pol_Files' : 'NA', 'MR_Unpol_Files': 'NA', 'MR_Pol_Files' : 'NA'}}}
                             if Config not in AlignDet_Trans[Sample_Name]['Config(s)']:
@@ -418,149 +865,36 @@ def VSANS_SortDataAutomaticAlt(YesNoManualHe3Entry, New_HE3_Files, MuValues, TeV
                                     AlignDet_Trans[Sample_Name]['Config(s)'][Config]['MR_Unpol_Files'] = [filenumber]
                                 else:
                                     AlignDet_Trans[Sample_Name]['Config(s)'][Config]['MR_Unpol_Files'].append(filenumber)
-                            if 'Front_U' in PolarizationState or 'Front_D' in PolarizationState or 'UU' in PolarizationState or 'DD' in PolarizationState:
-                                if 'NA' in AlignDet_Trans[Sample_Name]['Config(s)'][Config]['MR_Pol_Files']:
-                                    AlignDet_Trans[Sample_Name]['Config(s)'][Config]['MR_Pol_Files'] = [filenumber]
-                                else:
-                                    AlignDet_Trans[Sample_Name]['Config(s)'][Config]['MR_Pol_Files'].append(filenumber)
-                                    
-                            if Sample_Name not in Trans:
-                                Trans[Sample_Name] = {'Intent': Intent, 'Sample_Base': Sample_Base, 'Config(s)' : {Config : {'Unpol_Files': 'NA', 'U_Files' : 'NA', 'D_Files' : 'NA','Unpol_Trans_Cts': 'NA', 'U_Trans_Cts' : 'NA', 'D_Trans_Cts' : 'NA'}}}
-                            if Config not in Trans[Sample_Name]['Config(s)']:
-                                Trans[Sample_Name]['Config(s)'][Config] = {'Unpol_Files': 'NA', 'U_Files' : 'NA', 'D_Files': 'NA','Unpol_Trans_Cts': 'NA', 'U_Trans_Cts' : 'NA', 'D_Trans_Cts' : 'NA'}
-                            if Sample_Name not in Pol_Trans:
-                                Pol_Trans[Sample_Name] = {'T_UU' : {'File' : 'NA'},
-                                                              'T_DU' : {'File' : 'NA'},
-                                                              'T_DD' : {'File' : 'NA'},
-                                                              'T_UD' : {'File' : 'NA'},
-                                                              'T_SM' : {'File' : 'NA'},
-                                                              'Config' : 'NA'}
-                            if 'UNPOL' in PolarizationState:
-                                if 'NA' in Trans[Sample_Name]['Config(s)'][Config]['Unpol_Files']:
-                                    Trans[Sample_Name]['Config(s)'][Config]['Unpol_Files'] = [filenumber]
-                                else:
-                                    Trans[Sample_Name]['Config(s)'][Config]['Unpol_Files'].append(filenumber)
-                            if 'Front_U' in PolarizationState:
-                                if 'NA' in Trans[Sample_Name]['Config(s)'][Config]['U_Files']:
-                                    Trans[Sample_Name]['Config(s)'][Config]['U_Files'] = [filenumber]
-                                else:
-                                    Trans[Sample_Name]['Config(s)'][Config]['U_Files'].append(filenumber)
-                            if 'Front_D' in PolarizationState:
-                                if 'NA' in Trans[Sample_Name]['Config(s)'][Config]['D_Files']:
-                                    Trans[Sample_Name]['Config(s)'][Config]['D_Files'] = [filenumber]
-                                else:
-                                    Trans[Sample_Name]['Config(s)'][Config]['D_Files'].append(filenumber)
-                            if 'UU' in PolarizationState:
-                                UU_filenumber = filenumber
-                                UU_Time = TimeOfMeasurement
-                            if 'DU' in PolarizationState:
-                                DU_filenumber = filenumber
-                                DU_Time = TimeOfMeasurement
-                            if 'DD' in PolarizationState:
-                                DD_filenumber = filenumber
-                                DD_Time = TimeOfMeasurement
-                            if 'UD' in PolarizationState:
-                                UD_filenumber = filenumber
-                                UD_Time = TimeOfMeasurement
-                            if 'Front_U' in PolarizationState:
-                                SM_filenumber = filenumber
-                                if SM_filenumber - UU_filenumber == 4:
-                                    if 'NA' in Pol_Trans[Sample_Name]['T_UU']['File']:
-                                        Pol_Trans[Sample_Name]['T_UU']['File'] = [UU_filenumber]
-                                        Pol_Trans[Sample_Name]['T_UU']['Meas_Time'] = [UU_Time]
-                                        Pol_Trans[Sample_Name]['T_DU']['File'] = [DU_filenumber]
-                                        Pol_Trans[Sample_Name]['T_DU']['Meas_Time'] = [DU_Time]
-                                        Pol_Trans[Sample_Name]['T_DD']['File'] = [DD_filenumber]
-                                        Pol_Trans[Sample_Name]['T_DD']['Meas_Time'] = [DD_Time]
-                                        Pol_Trans[Sample_Name]['T_UD']['File'] = [UD_filenumber]
-                                        Pol_Trans[Sample_Name]['T_UD']['Meas_Time'] = [UD_Time]
-                                        Pol_Trans[Sample_Name]['T_SM']['File'] = [SM_filenumber]
-                                        Pol_Trans[Sample_Name]['Config'] = [Config]
-                                    else:
-                                        Pol_Trans[Sample_Name]['T_UU']['File'].append(UU_filenumber)
-                                        Pol_Trans[Sample_Name]['T_UU']['Meas_Time'].append(UU_Time)
-                                        Pol_Trans[Sample_Name]['T_DU']['File'].append(DU_filenumber)
-                                        Pol_Trans[Sample_Name]['T_DU']['Meas_Time'].append(DU_Time)
-                                        Pol_Trans[Sample_Name]['T_DD']['File'].append(DD_filenumber)
-                                        Pol_Trans[Sample_Name]['T_DD']['Meas_Time'].append(DD_Time)
-                                        Pol_Trans[Sample_Name]['T_UD']['File'].append(UD_filenumber)
-                                        Pol_Trans[Sample_Name]['T_UD']['Meas_Time'].append(UD_Time)
-                                        Pol_Trans[Sample_Name]['T_SM']['File'].append(SM_filenumber)
-                                        Pol_Trans[Sample_Name]['Config'].append(Config)
-
-                        elif 'HE3' in Purpose:
-                            if YesNoManualHe3Entry == 1:
-                                if filenumber in New_HE3_Files:
-                                    print('New He3 cell inserted at filenumber ', filenumber)
-                                    ScaledOpacity = MuValues[CellIdentifier]
-                                    TE = TeValues[CellIdentifier]
-                                    CellTimeIdentifier = TimeOfMeasurement
-                                    HE3Insert_Time = TimeOfMeasurement
-                                    CellIdentifier += 1
-                                    CellName = CellTimeIdentifier
-                            else:
-                                CellTimeIdentifier = f['/entry/DAS_logs/backPolarization/timestamp'][0]/3600000 #milliseconds to hours
-                                CellName = str(f['entry/DAS_logs/backPolarization/name'][0])
-                                CellName = CellName[2:]
-                                CellName = CellName[:-1]
-                                CellName = CellName + str(CellTimeIdentifier)
-                                if CellTimeIdentifier not in HE3_Trans:
-                                    print('New He3 cell inserted at filenumber ', filenumber)
-                                    HE3Insert_Time = f['/entry/DAS_logs/backPolarization/timestamp'][0]/3600000 #milliseconds to hours
-                                    Opacity = f['/entry/DAS_logs/backPolarization/opacityAt1Ang'][0]
-                                    Wavelength = f['/entry/DAS_logs/wavelength/wavelength'][0]
-                                    ScaledOpacity = Opacity*Wavelength
-                                    TE = f['/entry/DAS_logs/backPolarization/glassTransmission'][0]
-                            HE3Type = str(f['entry/sample/description'][()])
-                            if 'OUT' in HE3Type:
-                                if Sample_Name not in Trans:
-                                    Trans[Sample_Name] = {'Intent': Intent, 'Sample_Base': Sample_Base, 'Config(s)' : {Config : {'Unpol_Files': 'NA', 'U_Files' : 'NA', 'D_Files' : 'NA','Unpol_Trans_Cts': 'NA', 'U_Trans_Cts' : 'NA', 'D_Trans_Cts' : 'NA'}}}
-                                if Config not in Trans[Sample_Name]['Config(s)']:
-                                    Trans[Sample_Name]['Config(s)'][Config] = {'Unpol_Files': 'NA', 'U_Files' : 'NA', 'D_Files': 'NA','Unpol_Trans_Cts': 'NA', 'U_Trans_Cts' : 'NA', 'D_Trans_Cts' : 'NA'}
-                                if 'NA' in Trans[Sample_Name]['Config(s)'][Config]['Unpol_Files']:
-                                    Trans[Sample_Name]['Config(s)'][Config]['Unpol_Files'] = [filenumber]
-                                else:
-                                    Trans[Sample_Name]['Config(s)'][Config]['Unpol_Files'].append(filenumber)
-
-                                if Sample_Name not in AlignDet_Trans:
-                                    AlignDet_Trans[Sample_Name] = {'Temp' : Temp, 'Intent': Intent, 'Sample_Base': Sample_Base, 'Config(s)' : {Config : {'FR_Unpol_Files': 'NA', 'FR_Pol_Files' : 'NA', 'MR_Unpol_Files': 'NA', 'MR_Pol_Files' : 'NA'}}}
-                                if Config not in AlignDet_Trans[Sample_Name]['Config(s)']:
-                                    AlignDet_Trans[Sample_Name]['Config(s)'][Config] = {'FR_Unpol_Files': 'NA', 'FR_Pol_Files' : 'NA', 'MR_Unpol_Files': 'NA', 'MR_Pol_Files' : 'NA'}
-                                if 'UNPOL' in PolarizationState:
-                                    if 'NA' in AlignDet_Trans[Sample_Name]['Config(s)'][Config]['MR_Unpol_Files']:
-                                        AlignDet_Trans[Sample_Name]['Config(s)'][Config]['MR_Unpol_Files'] = [filenumber]
-                                    else:
-                                        AlignDet_Trans[Sample_Name]['Config(s)'][Config]['MR_Unpol_Files'].append(filenumber)
                                    
-                                HE3OUT_filenumber = filenumber
-                                HE3OUT_config = Config
-                                HE3OUT_sample = Sample_Name
-                                HE3OUT_attenuators = int(f['entry/instrument/attenuator/num_atten_dropped'][0])
-                            elif 'IN' in HE3Type:
-                                HE3IN_filenumber = filenumber
-                                HE3IN_config = Config
-                                HE3IN_sample = Sample_Name
-                                HE3IN_attenuators = int(f['entry/instrument/attenuator/num_atten_dropped'][0])
-                                HE3IN_StartTime = TimeOfMeasurement
-                                if HE3OUT_filenumber > 0:
-                                    if HE3OUT_config == HE3IN_config and HE3OUT_attenuators == HE3IN_attenuators and HE3OUT_sample == HE3IN_sample: #This implies that you must have a 3He out before 3He in of same config and atten
-                                        if HE3Insert_Time not in HE3_Trans:
-                                            HE3_Trans[CellTimeIdentifier] = {'Te' : TE,
-                                                                         'Mu' : ScaledOpacity,
-                                                                         'Insert_time' : HE3Insert_Time}
-                                        Elasped_time = HE3IN_StartTime - HE3Insert_Time
-                                        if "Elasped_time" not in HE3_Trans[CellTimeIdentifier]:
-                                            HE3_Trans[CellTimeIdentifier]['Config'] = [HE3IN_config]
-                                            HE3_Trans[CellTimeIdentifier]['HE3_OUT_file'] = [HE3OUT_filenumber]
-                                            HE3_Trans[CellTimeIdentifier]['HE3_IN_file'] = [HE3IN_filenumber]
-                                            HE3_Trans[CellTimeIdentifier]['Elasped_time'] = [Elasped_time]
-                                            HE3_Trans[CellTimeIdentifier]['Cell_name'] = [CellName]
-                                        else:
-                                            HE3_Trans[CellTimeIdentifier]['Config'].append(HE3IN_config)
-                                            HE3_Trans[CellTimeIdentifier]['HE3_OUT_file'].append(HE3OUT_filenumber)
-                                            HE3_Trans[CellTimeIdentifier]['HE3_IN_file'].append(HE3IN_filenumber)
-                                            HE3_Trans[CellTimeIdentifier]['Elasped_time'].append(Elasped_time)
-                                            HE3_Trans[CellTimeIdentifier]['Cell_name'].append(CellName)
+                            HE3OUT_filenumber = filenumber
+                            HE3OUT_config = Config
+                            HE3OUT_sample = Sample_Name
+                            HE3OUT_attenuators = int(Index['Attenuators_Dropped'][row])
+                        elif 'IN' in HE3Type:
+                            HE3IN_filenumber = filenumber
+                            HE3IN_config = Config
+                            HE3IN_sample = Sample_Name
+                            HE3IN_attenuators = int(Index['Attenuators_Dropped'][row])
+                            HE3IN_StartTime = TimeOfMeasurement
+                            if HE3OUT_filenumber > 0:
+                                if HE3OUT_config == HE3IN_config and HE3OUT_attenuators == HE3IN_attenuators and HE3OUT_sample == HE3IN_sample: #This implies that you must have a 3He out before 3He in of same config and atten
+                                    if HE3Insert_Time not in HE3_Trans:
+                                        HE3_Trans[CellTimeIdentifier] = {'Te' : TE,
+                                                                     'Mu' : ScaledOpacity,
+                                                                     'Insert_time' : HE3Insert_Time}
+                                    Elasped_time = HE3IN_StartTime - HE3Insert_Time
+                                    if "Elasped_time" not in HE3_Trans[CellTimeIdentifier]:
+                                        HE3_Trans[CellTimeIdentifier]['Config'] = [HE3IN_config]
+                                        HE3_Trans[CellTimeIdentifier]['HE3_OUT_file'] = [HE3OUT_filenumber]
+                                        HE3_Trans[CellTimeIdentifier]['HE3_IN_file'] = [HE3IN_filenumber]
+                                        HE3_Trans[CellTimeIdentifier]['Elasped_time'] = [Elasped_time]
+                                        HE3_Trans[CellTimeIdentifier]['Cell_name'] = [CellName]
+                                    else:
+                                        HE3_Trans[CellTimeIdentifier]['Config'].append(HE3IN_config)
+                                        HE3_Trans[CellTimeIdentifier]['HE3_OUT_file'].append(HE3OUT_filenumber)
+                                        HE3_Trans[CellTimeIdentifier]['HE3_IN_file'].append(HE3IN_filenumber)
+                                        HE3_Trans[CellTimeIdentifier]['Elasped_time'].append(Elasped_time)
+                                        HE3_Trans[CellTimeIdentifier]['Cell_name'].append(CellName)
 
     return Sample_Names, Sample_Bases, Configs, BlockBeam, Scatt, Trans, Pol_Trans, AlignDet_Trans, HE3_Trans, start_number, FileNumberList
 
@@ -709,8 +1043,8 @@ def VSANS_MakeTransMask(filenumber, Config, DetectorPanel):
         CvBYesNo = 1
     f = get_by_filenumber(filenumber)
     for dshort in relevant_detectors:
-        data = np.array(f['entry/instrument/detector_{ds}/data'.format(ds=dshort)])
-        mask_it[dshort] = np.zeros_like(data)
+        data_shape, data_type = get_panel_shape(filenumber, dshort)
+        mask_it[dshort] = np.zeros(data_shape, dtype=data_type)
         x_pixel_size = f['entry/instrument/detector_{ds}/x_pixel_size'.format(ds=dshort)][0]/10.0
         y_pixel_size = f['entry/instrument/detector_{ds}/y_pixel_size'.format(ds=dshort)][0]/10.0
         beam_center_x = f['entry/instrument/detector_{ds}/beam_center_x'.format(ds=dshort)][0]
@@ -750,7 +1084,7 @@ def VSANS_MakeTransMask(filenumber, Config, DetectorPanel):
             elif position_key == 'R':
                 realDistX =  x_pixel_size*(0.5) + lateral_offset + panel_gap/2.0
                 realDistY =  coeffs
-        X, Y = np.indices(data.shape)
+        X, Y = np.indices(data_shape)
         if dshort == 'B':
             x0_pos =  realDistX - beam_center_x*x_pixel_size + (X)*x_pixel_size 
             y0_pos =  realDistY - beam_center_y*y_pixel_size + (Y)*y_pixel_size
@@ -840,10 +1174,13 @@ def ReadIn_IGORMasks(filenumberlisting):
                     f = get_by_filenumber(filenumber)
                     if f is not None:
                         for dshort in relevant_detectors:
-                            mask_data = np.array(f['entry/instrument/detector_{ds}/data'.format(ds=dshort)])
+                            mask_dataset = f['entry/instrument/detector_{ds}/data'.format(ds=dshort)]
                             if ConvertHighResToSubset > 0 and dshort == 'B':
-                                mask_holder = mask_data[HighResMinX:HighResMaxX+1,HighResMinY:HighResMaxY+1]
-                                mask_data = mask_holder
+                                mask_data = read_panel_region(mask_dataset, highres_region())
+                            else:
+                                mask_data = np.array(mask_dataset)
+                            if dshort == 'B':
+                                mask_data = highres_rebin(mask_data, HighResRebin, np.max) #a block is masked if any of its pixels is
                             '''
                             This reverses zeros and ones (assuming IGOR-made masks) so that zeros become the pixels to ignore:
                             '''
@@ -863,16 +1200,73 @@ def ReadIn_IGORMasks(filenumberlisting):
                             print('Saved', filename, ' as Scatt Mask With Solenoid for', ConfigID)                     
     return Masks, Mask_Record
 
+BlockedBeamRates_Name = 'VSANS_BlockedBeamRates.h5'
+blocked_beam_rates = {}
+
+def VSANS_BlockedBeamStamp(filelist):
+    #Size and modification time of each blocked beam file, used to tell whether saved rates are still valid.
+    Stamp = []
+    for item in filelist:
+        fullpath = os.path.join(input_path, "sans" + str(item) + ".nxs.ngv")
+        if os.path.isfile(fullpath):
+            file_stat = os.stat(fullpath)
+            Stamp.append((item, file_stat.st_size, file_stat.st_mtime))
+    return repr(Stamp)
+
+def VSANS_LoadBlockedBeamRates(BB_Key, filelist, relevant_detectors):
+    #Returns (BB_CountsPerSecond, BB_Unc) saved in BlockedBeamRates_Name for BB_Key, or None if absent or out of date.
+    rates_fullpath = os.path.join(save_path, BlockedBeamRates_Name)
+    group_name = hashlib.sha256(BB_Key.encode()).hexdigest()
+    if SaveBlockedBeamRates <= 0 or not os.path.isfile(rates_fullpath):
+        return None
+    try:
+        with h5py.File(rates_fullpath, 'r') as g:
+            if group_name not in g or g[group_name].attrs['Stamp'] != VSANS_BlockedBeamStamp(filelist):
+                return None
+            BB_CountsPerSecond = {dshort : np.array(g[group_name]['Rate_' + dshort]) for dshort in relevant_detectors}
+            BB_Unc = {dshort : np.array(g[group_name]['Unc_' + dshort]) for dshort in relevant_detectors}
+    except (OSError, KeyError):
+        print('Could not read blocked beam rates from', rates_fullpath)
+        return None
+    return BB_CountsPerSecond, BB_Unc
+
+def VSANS_SaveBlockedBeamRates(BB_Key, filelist, BB_CountsPerSecond, BB_Unc):
+    rates_fullpath = os.path.join(save_path, BlockedBeamRates_Name)
+    group_name = hashlib.sha256(BB_Key.encode()).hexdigest()
+    try:
+        with h5py.File(rates_fullpath, 'a') as g:
+            if group_name in g:
+                del g[group_name]
+            group = g.create_group(group_name)
+            group.attrs['Key'] = BB_Key
+            group.attrs['Stamp'] = VSANS_BlockedBeamStamp(filelist)
+            for dshort in BB_CountsPerSecond:
+                group.create_dataset('Rate_' + dshort, data=BB_CountsPerSecond[dshort])
+                group.create_dataset('Unc_' + dshort, data=BB_Unc[dshort])
+    except OSError:
+        print('Could not save blocked beam rates to', rates_fullpath)
+    return
+
 def VSANS_BlockedBeamCountsPerSecond_ListOfFiles(filelist, Config, examplefilenumber):
+    #Rates are kept in blocked_beam_rates keyed by (config, blocked beam files, detectors, HighRes subset) and shared read-only
+    #between the transmission and scattering reductions; with SaveBlockedBeamRates > 0 they also persist in BlockedBeamRates_Name.
+
+    relevant_detectors = short_detectors
+    if str(Config).find('CvB') != -1:
+        relevant_detectors = all_detectors
+
+    BB_Key = repr((Config, tuple(filelist), tuple(relevant_detectors), ConvertHighResToSubset, HighResMinX, HighResMaxX, HighResMinY, HighResMaxY))
+    if BB_Key in blocked_beam_rates:
+        return blocked_beam_rates[BB_Key]
+    Saved = VSANS_LoadBlockedBeamRates(BB_Key, filelist, relevant_detectors)
+    if Saved is not None:
+        blocked_beam_rates[BB_Key] = Saved
+        return Saved
 
     BB_Counts = {}
     BB_Unc = {}
     BB_Seconds = {}
     BB_CountsPerSecond = {}
-    
-    relevant_detectors = short_detectors
-    if str(Config).find('CvB') != -1:
-        relevant_detectors = all_detectors
 
     item_counter = 0
     for item in filelist:
@@ -882,8 +1276,7 @@ def VSANS_BlockedBeamCountsPerSecond_ListOfFiles(filelist, Config, examplefilenu
             Count_time = f['entry/collection_time'][0]
             if Count_time > 0:
                 for dshort in relevant_detectors:
-                    bb_data = np.array(f['entry/instrument/detector_{ds}/data'.format(ds=dshort)])
-                    unc = np.sqrt(np.array(f['entry/instrument/detector_{ds}/data'.format(ds=dshort)]))
+                    bb_data = get_panel_data(item, dshort)
                 
                     if item_counter < 1:
                         BB_Counts[dshort] = bb_data
@@ -895,65 +1288,146 @@ def VSANS_BlockedBeamCountsPerSecond_ListOfFiles(filelist, Config, examplefilenu
                     BB_Unc[dshort] = np.sqrt(BB_Counts[dshort])/BB_Seconds[dshort]
                 item_counter += 1
 
+    if len(BB_CountsPerSecond) > 0:
+        for dshort in BB_CountsPerSecond:
+            BB_CountsPerSecond[dshort].flags.writeable = False
+            BB_Unc[dshort].flags.writeable = False
+        blocked_beam_rates[BB_Key] = (BB_CountsPerSecond, BB_Unc)
+        if SaveBlockedBeamRates > 0:
+            VSANS_SaveBlockedBeamRates(BB_Key, filelist, BB_CountsPerSecond, BB_Unc)
+
     if len(BB_CountsPerSecond) < 1:
         f = get_by_filenumber(examplefilenumber)
         if f is not None:
             for dshort in relevant_detectors:
-                data = np.array(f['entry/instrument/detector_{ds}/data'.format(ds=dshort)])
-                BB_CountsPerSecond[dshort] = np.zeros_like(data)
-                BB_Unc[dshort] = np.zeros_like(data)
+                data_shape, data_type = get_panel_shape(examplefilenumber, dshort)
+                BB_CountsPerSecond[dshort] = np.zeros(data_shape, dtype=data_type)
+                BB_Unc[dshort] = np.zeros(data_shape, dtype=data_type)
 
     return BB_CountsPerSecond, BB_Unc #returns empty list or 2D, detector-panel arrays
 
-def VSANS_CalcABSTrans_BlockBeamList(trans_filenumber, BBList, DetectorPanel):
-    #Uses VSANS_Config_ID(trans_filenumber) and
+def VSANS_BlockBeamList(Config, BlockBeam):
+    #Blocked beam files used for Config: the transmission blocked beams if any were measured, otherwise the scattering ones.
+    BBList = [0]
+    if Config in BlockBeam:
+        if 'NA' not in BlockBeam[Config]['Trans']['File']:
+            BBList = BlockBeam[Config]['Trans']['File']
+        elif 'NA' not in BlockBeam[Config]['Scatt']['File']:
+            BBList = BlockBeam[Config]['Scatt']['File']
+    return BBList
+
+def VSANS_TransMaskKey(filenumber, Config):
+    #Uses f = get_by_filenumber(filenumber)
+    #Transmission files with equal keys (same panel shapes, positions, beam centres and beam stop) get the same VSANS_MakeTransMask result.
+    f = get_by_filenumber(filenumber)
+    relevant_detectors = short_detectors
+    if str(Config).find('CvB') != -1:
+        relevant_detectors = all_detectors
+    Record = [Config]
+    if '/entry/DAS_logs/C2BeamStop/diameter' in f:
+        Record.append(np.array(f['/entry/DAS_logs/C2BeamStop/diameter']).tolist())
+    for dshort in relevant_detectors:
+        data_shape, data_type = get_panel_shape(filenumber, dshort)
+        Record.append((dshort, data_shape))
+        for name in Geometry_DetectorFields:
+            path = 'entry/instrument/detector_{ds}/{name}'.format(ds=dshort, name=name)
+            if path in f:
+                Record.append((name, np.array(f[path]).tolist()))
+    return repr(Record)
+
+trans_results = {}
+
+def VSANS_CalcABSTrans_Batch(Requests, DetectorPanel):
+    #Uses VSANS_Config_ID(trans_filenumber) and VSANS_TransMaskKey(filenumber, Config) and
     #VSANS_MakeTransMask(filenumber, Config, DetectorPanel) and
     #VSANS_BlockedBeamCountsPerSecond_ListOfFiles(filelist, Config) and 
     #VSANS_AttenuatorTable(wavelength, attenuation)
+    #Requests is a list of (trans_filenumber, BBList). The files are grouped by configuration, mask and blocked beam list so each
+    #group needs one mask and one blocked beam rate; the masked pixels of all files in a group are stacked into a
+    #(files x pixels) array and their absolute transmissions are summed together.
+    #Returns {(trans_filenumber, tuple(BBList)) : (abs_trans, abs_trans_unc)}; results are kept in trans_results for later calls.
+    #Files that cannot be opened are left out of the groups and get (nan, nan), which is not kept.
 
-    Config = VSANS_Config_ID(trans_filenumber)
+    Results = {}
+    Groups = {}
+    for trans_filenumber, BBList in Requests:
+        memo_key = (trans_filenumber, tuple(BBList), DetectorPanel)
+        if memo_key in trans_results:
+            Results[(trans_filenumber, tuple(BBList))] = trans_results[memo_key]
+            continue
+        if get_by_filenumber(trans_filenumber) is None:
+            Results[(trans_filenumber, tuple(BBList))] = (np.nan, np.nan)
+            continue
+        Config = VSANS_Config_ID(trans_filenumber)
+        group_key = (Config, VSANS_TransMaskKey(trans_filenumber, Config), tuple(BBList))
+        if group_key not in Groups:
+            Groups[group_key] = []
+        if trans_filenumber not in Groups[group_key]:
+            Groups[group_key].append(trans_filenumber)
+
+    for (Config, Mask_Key, BBTuple), filenumbers in Groups.items():
+        relevant_detectors = short_detectors
+        if str(Config).find('CvB') != -1:
+            relevant_detectors = all_detectors
 
-    relevant_detectors = short_detectors
-    CvBYesNo = 0
-    if str(Config).find('CvB') != -1:
-        relevant_detectors = all_detectors
-        CvBYesNo = 1
-    
-    Mask = VSANS_MakeTransMask(trans_filenumber,Config, DetectorPanel)
-    if Config in BBList:
-        examplefilenumber = BBList[Config]['ExampleFile']
-    else:
-        examplefilenumber = 0
-    BB, BB_Unc = VSANS_BlockedBeamCountsPerSecond_ListOfFiles(BBList, Config, examplefilenumber)
-    f = get_by_filenumber(trans_filenumber)
-    if f is not None:
-        monitor_counts = f['entry/control/monitor_counts'][0]
-        count_time = f['entry/collection_time'][0]
-        wavelength = f['entry/DAS_logs/wavelength/wavelength'][0]
-        desired_attenuation = f['entry/DAS_logs/attenuator/attenuator'][0]
-        attenuation = f['/entry/DAS_logs/counter/actualAttenuatorsDropped'][0]
-        attn_trans = VSANS_AttenuatorTable(wavelength, attenuation)
-        abs_trans = 0
-        abs_trans_unc = 0
+        Mask = VSANS_MakeTransMask(filenumbers[0], Config, DetectorPanel)
+        BB, BB_Unc = VSANS_BlockedBeamCountsPerSecond_ListOfFiles(list(BBTuple), Config, 0)
+
+        monitor_counts = np.zeros(len(filenumbers))
+        count_time = np.zeros(len(filenumbers))
+        attn_trans = np.zeros(len(filenumbers))
+        for row, filenumber in enumerate(filenumbers):
+            f = get_by_filenumber(filenumber)
+            monitor_counts[row] = f['entry/control/monitor_counts'][0]
+            count_time[row] = f['entry/collection_time'][0]
+            wavelength = f['entry/DAS_logs/wavelength/wavelength'][0]
+            attenuation = f['/entry/DAS_logs/counter/actualAttenuatorsDropped'][0]
+            attn_trans[row] = VSANS_AttenuatorTable(wavelength, attenuation)
+
+        abs_trans = np.zeros(len(filenumbers))
+        abs_trans_unc = np.zeros(len(filenumbers))
         for dshort in relevant_detectors:
-            data = np.array(f['entry/instrument/detector_{ds}/data'.format(ds=dshort)])    
+            pixels = np.nonzero(Mask[dshort])
+            if len(pixels[0]) == 0:
+                continue
+            mask_values = Mask[dshort][pixels]
+            data = np.array([get_panel_data(filenumber, dshort)[pixels] for filenumber in filenumbers])
             if dshort in BB and dshort in BB_Unc:
-                trans = (data - BB[dshort]*count_time)*Mask[dshort]
-                unc = np.sqrt(data + BB_Unc[dshort])*Mask[dshort]
+                trans = (data - BB[dshort][pixels]*count_time[:, np.newaxis])*mask_values
+                unc = np.sqrt(data + BB_Unc[dshort][pixels])*mask_values
             else:
-                trans = (data)*Mask[dshort]
-                unc = np.sqrt(data)*Mask[dshort]           
-            abs_trans += (np.sum(trans)*1E8/monitor_counts)/attn_trans
-            abs_trans_unc += (np.sqrt(np.sum(np.power(unc,2)))*1E8/monitor_counts)/attn_trans
+                trans = (data)*mask_values
+                unc = np.sqrt(data)*mask_values
+            abs_trans += (np.sum(trans, axis=1)*1E8/monitor_counts)/attn_trans
+            abs_trans_unc += (np.sqrt(np.sum(np.power(unc,2), axis=1))*1E8/monitor_counts)/attn_trans
 
-        
-    return abs_trans, abs_trans_unc
+        for row, filenumber in enumerate(filenumbers):
+            Results[(filenumber, BBTuple)] = (abs_trans[row], abs_trans_unc[row])
+            trans_results[(filenumber, BBTuple, DetectorPanel)] = Results[(filenumber, BBTuple)]
+
+    return Results
+
+def VSANS_CalcABSTrans_BlockBeamList(trans_filenumber, BBList, DetectorPanel):
+    #Uses VSANS_CalcABSTrans_Batch for a single file
+
+    return VSANS_CalcABSTrans_Batch([(trans_filenumber, BBList)], DetectorPanel)[(trans_filenumber, tuple(BBList))]
 
 def VSANS_ProcessHe3TransCatalog(HE3_Trans, BlockBeam, DetectorPanel):
-    #Uses VSANS_CalcABSTrans_BlockBeamList(trans_filenumber, BlockBeam, DetectorPanel) which uses
+    #Uses VSANS_CalcABSTrans_Batch(Requests, DetectorPanel) which uses
     #VSANS_MakeTransMask(filenumber, Config, DetectorPanel) and
     #VSANS_BlockedBeamCountsPerSecond_ListOfFiles(filelist, Config) and 
     #VSANS_AttenuatorTable(wavelength, attenuation)
+
+    Requests = []
+    for Cell in HE3_Trans:
+        if 'Elasped_time' in HE3_Trans[Cell]:
+            counter = 0
+            for InFile in HE3_Trans[Cell]['HE3_IN_file']:
+                BBList = VSANS_BlockBeamList(HE3_Trans[Cell]['Config'][counter], BlockBeam)
+                Requests.append((InFile, BBList))
+                Requests.append((HE3_Trans[Cell]['HE3_OUT_file'][counter], BBList))
+                counter += 1
+    Trans_Results = VSANS_CalcABSTrans_Batch(Requests, DetectorPanel)
     
     for Cell in HE3_Trans:
         if 'Elasped_time' in HE3_Trans[Cell]:
@@ -961,14 +1435,9 @@ def VSANS_ProcessHe3TransCatalog(HE3_Trans, BlockBeam, DetectorPanel):
             for InFile in HE3_Trans[Cell]['HE3_IN_file']:
                 OutFile = HE3_Trans[Cell]['HE3_OUT_file'][counter]
                 Config = HE3_Trans[Cell]['Config'][counter]
-                BBList = [0]
-                if Config in BlockBeam:
-                    if 'NA' not in BlockBeam[Config]['Trans']['File']:
-                        BBList = BlockBeam[Config]['Trans']['File']
-                    elif 'NA' not in BlockBeam[Config]['Scatt']['File']:
-                        BBList = BlockBeam[Config]['Scatt']['File']
-                IN_trans, IN_trans_unc = VSANS_CalcABSTrans_BlockBeamList(InFile, BBList, DetectorPanel)
-                OUT_trans, OUT_trans_unc = VSANS_CalcABSTrans_BlockBeamList(OutFile, BBList, DetectorPanel)
+                BBList = VSANS_BlockBeamList(Config, BlockBeam)
+                IN_trans, IN_trans_unc = Trans_Results[(InFile, tuple(BBList))]
+                OUT_trans, OUT_trans_unc = Trans_Results[(OutFile, tuple(BBList))]
                 trans = IN_trans / OUT_trans
                 if 'Transmission' not in HE3_Trans[Cell]:
                     HE3_Trans[Cell]['Transmission'] = [trans]
@@ -978,10 +1447,20 @@ def VSANS_ProcessHe3TransCatalog(HE3_Trans, BlockBeam, DetectorPanel):
     return
 
 def VSANS_ProcessPolTransCatalog(Pol_Trans, BlockBeam, DetectorPanel):
-    #Uses VSANS_CalcABSTrans_BlockBeamList(trans_filenumber, BlockBeam, DetectorPanel) which uses
+    #Uses VSANS_CalcABSTrans_Batch(Requests, DetectorPanel) which uses
     #VSANS_MakeTransMask(filenumber, Config, DetectorPanel) and
     #VSANS_BlockedBeamCountsPerSecond_ListOfFiles(filelist, Config) and 
     #VSANS_AttenuatorTable(wavelength, attenuation)
+
+    Requests = []
+    for Samp in Pol_Trans:
+        if 'NA' not in Pol_Trans[Samp]['T_UU']['File']:
+            for counter in range(len(Pol_Trans[Samp]['T_UU']['File'])):
+                BBList = VSANS_BlockBeamList(Pol_Trans[Samp]['Config'][counter], BlockBeam)
+                for Type in ['T_UU', 'T_DU', 'T_DD', 'T_UD', 'T_SM']:
+                    Requests.append((Pol_Trans[Samp][Type]['File'][counter], BBList))
+    Trans_Results = VSANS_CalcABSTrans_Batch(Requests, DetectorPanel) #Masking done within this step
+
     for Samp in Pol_Trans:
         if 'NA' not in Pol_Trans[Samp]['T_UU']['File']:
             counter = 0
@@ -991,17 +1470,12 @@ def VSANS_ProcessPolTransCatalog(Pol_Trans, BlockBeam, DetectorPanel):
                 UDFile = Pol_Trans[Samp]['T_UD']['File'][counter]
                 SMFile = Pol_Trans[Samp]['T_SM']['File'][counter]
                 Config = Pol_Trans[Samp]['Config'][counter]
-                BBList = [0]
-                if Config in BlockBeam:
-                    if 'NA' not in BlockBeam[Config]['Trans']['File']:
-                        BBList = BlockBeam[Config]['Trans']['File']
-                    elif 'NA' not in BlockBeam[Config]['Scatt']['File']:
-                        BBList = BlockBeam[Config]['Scatt']['File']
-                UU_trans, UU_trans_unc = VSANS_CalcABSTrans_BlockBeamList(UUFile, BBList, DetectorPanel) #Masking done within this step
-                DU_trans, DU_trans_unc = VSANS_CalcABSTrans_BlockBeamList(DUFile, BBList, DetectorPanel) #Masking done within this step
-                DD_trans, DD_trans_unc = VSANS_CalcABSTrans_BlockBeamList(DDFile, BBList, DetectorPanel) #Masking done within this step
-                UD_trans, UD_trans_unc = VSANS_CalcABSTrans_BlockBeamList(UDFile, BBList, DetectorPanel) #Masking done within this step
-                SM_trans, SM_trans_unc = VSANS_CalcABSTrans_BlockBeamList(SMFile, BBList, DetectorPanel) #Masking done within this step
+                BBList = VSANS_BlockBeamList(Config, BlockBeam)
+                UU_trans, UU_trans_unc = Trans_Results[(UUFile, tuple(BBList))]
+                DU_trans, DU_trans_unc = Trans_Results[(DUFile, tuple(BBList))]
+                DD_trans, DD_trans_unc = Trans_Results[(DDFile, tuple(BBList))]
+                UD_trans, UD_trans_unc = Trans_Results[(UDFile, tuple(BBList))]
+                SM_trans, SM_trans_unc = Trans_Results[(SMFile, tuple(BBList))]
                 if 'Trans' not in Pol_Trans[Samp]['T_UU']:
                     Pol_Trans[Samp]['T_UU']['Trans'] = [UU_trans/SM_trans]
                     Pol_Trans[Samp]['T_DU']['Trans'] = [DU_trans/SM_trans]
@@ -1018,29 +1492,35 @@ def VSANS_ProcessPolTransCatalog(Pol_Trans, BlockBeam, DetectorPanel):
     return
 
 def VSANS_ProcessTransCatalog(Trans, BlockBeam, DetectorPanel):
-    #Uses VSANS_CalcABSTrans_BlockBeamList(trans_filenumber, BlockBeam, DetectorPanel) which uses
+    #Uses VSANS_CalcABSTrans_Batch(Requests, DetectorPanel) which uses
     #VSANS_MakeTransMask(filenumber, Config, DetectorPanel) and
     #VSANS_BlockedBeamCountsPerSecond_ListOfFiles(filelist, Config) and 
     #VSANS_AttenuatorTable(wavelength, attenuation)
+
+    Requests = []
     for Samp in Trans:
         for Config in Trans[Samp]['Config(s)']:
-            BBList = [0]
-            if Config in BlockBeam:
-                if 'NA' not in BlockBeam[Config]['Trans']['File']:
-                    BBList = BlockBeam[Config]['Trans']['File']
-                elif 'NA' not in BlockBeam[Config]['Scatt']['File']:
-                    BBList = BlockBeam[Config]['Scatt']['File']
+            BBList = VSANS_BlockBeamList(Config, BlockBeam)
+            for Files in ['Unpol_Files', 'U_Files']:
+                if 'NA' not in Trans[Samp]['Config(s)'][Config][Files]:
+                    for filenumber in Trans[Samp]['Config(s)'][Config][Files]:
+                        Requests.append((filenumber, BBList))
+    Trans_Results = VSANS_CalcABSTrans_Batch(Requests, DetectorPanel)
+
+    for Samp in Trans:
+        for Config in Trans[Samp]['Config(s)']:
+            BBList = VSANS_BlockBeamList(Config, BlockBeam)
 
             if 'NA' not in Trans[Samp]['Config(s)'][Config]['Unpol_Files']:
                 for UNF in Trans[Samp]['Config(s)'][Config]['Unpol_Files']:
-                    Unpol_trans, Unpol_trans_unc = VSANS_CalcABSTrans_BlockBeamList(UNF, BBList, DetectorPanel)
+                    Unpol_trans, Unpol_trans_unc = Trans_Results[(UNF, tuple(BBList))]
                     if 'NA' in Trans[Samp]['Config(s)'][Config]['Unpol_Trans_Cts']:
                         Trans[Samp]['Config(s)'][Config]['Unpol_Trans_Cts'] = [Unpol_trans]
                     else:
                         Trans[Samp]['Config(s)'][Config]['Unpol_Trans_Cts'].append(Unpol_trans)   
             if 'NA' not in Trans[Samp]['Config(s)'][Config]['U_Files']:
                     for UF in Trans[Samp]['Config(s)'][Config]['U_Files']:
-                        Halfpol_trans, Halfpol_trans_unc = VSANS_CalcABSTrans_BlockBeamList(UF, BBList, DetectorPanel)
+                        Halfpol_trans, Halfpol_trans_unc = Trans_Results[(UF, tuple(BBList))]
                         if 'NA' in Trans[Samp]['Config(s)'][Config]['U_Trans_Cts']:
                             Trans[Samp]['Config(s)'][Config]['U_Trans_Cts'] = [Halfpol_trans]
                         else:
@@ -1084,15 +1564,11 @@ def Plex_File(start_number):
         print('Reading in ', filename)
         f = h5py.File(fullpath)
         for dshort in all_detectors:
-            data = np.array(f['entry/instrument/detector_{ds}/data'.format(ds=dshort)])
-            if ConvertHighResToSubset > 0:
-                if dshort == 'B':
-                    data_subset = data[HighResMinX:HighResMaxX+1,HighResMinY:HighResMaxY+1]
-                    PlexData[dshort] = data_subset
-                else:
-                    PlexData[dshort] = data
+            dataset = f['entry/instrument/detector_{ds}/data'.format(ds=dshort)]
+            if ConvertHighResToSubset > 0 and dshort == 'B':
+                PlexData[dshort] = read_panel_region(dataset, highres_region())
             else:
-               PlexData[dshort] = data
+                PlexData[dshort] = np.array(dataset)
     else:
         filenumber = start_number
         f = get_by_filenumber(filenumber)
@@ -1100,23 +1576,18 @@ def Plex_File(start_number):
             for dshort in all_detectors:
                 datafieldname = 'entry/instrument/detector_{ds}/data'.format(ds=dshort)
                 if datafieldname in f:
-                    data = np.array(f['entry/instrument/detector_{ds}/data'.format(ds=dshort)])
-                    data_filler = np.ones_like(data)
+                    data_shape, data_type = get_panel_shape(filenumber, dshort)
                 else:
                     x_size = f['entry/instrument/detector_{ds}/pixel_num_x'.format(ds=dshort)][0]
                     y_size = f['entry/instrument/detector_{ds}/pixel_num_y'.format(ds=dshort)][0]
-                    data = np.zeros((x_size, y_size))
-                    data_filler = np.ones_like(data)
-                                          
-                if ConvertHighResToSubset > 0:
-                    if dshort == 'B':
-                        data_subset = data_filler[HighResMinX:HighResMaxX+1,HighResMinY:HighResMaxY+1]
-                        PlexData[dshort] = data_subset
-                    else:
-                        PlexData[dshort] = data_filler
-                else:
-                    PlexData[dshort] = data_filler
+                    data_shape, data_type = (x_size, y_size), np.float64
+                if ConvertHighResToSubset > 0 and dshort == 'B':
+                    data_shape = tuple(len(range(*region.indices(size))) for region, size in zip(highres_region(), data_shape))
+                PlexData[dshort] = np.ones(data_shape, dtype=data_type)
         print('Plex file not found; populated with ones instead')   
+
+    if 'B' in PlexData:
+        PlexData['B'] = highres_rebin(PlexData['B'], HighResRebin, np.mean)
             
     return filename, PlexData
 
@@ -1141,11 +1612,110 @@ def SolidAngle_AllDetectors(representative_filenumber, Config):
             theta_x_step = x_pixel_size / realDistZ
             theta_y_step = y_pixel_size / realDistZ
             Solid_Angle[dshort] = theta_x_step * theta_y_step
+            if dshort == 'B':
+                Solid_Angle[dshort] *= HighResRebin*HighResRebin
 
     return Solid_Angle
 
+Geometry_Names = ['Qx', 'Qy', 'Qz', 'Q_total', 'Q_perp_unc', 'Q_parl_unc', 'InPlaneAngleMap', 'dimXX', 'dimYY', 'Shadow_Mask']
+Geometry_Fields = ['entry/instrument/beam/monochromator/wavelength', 'entry/instrument/beam/monochromator/wavelength_spread',
+                   '/entry/DAS_logs/geometry/internalSampleApertureHeight', '/entry/DAS_logs/geometry/externalSampleApertureHeight',
+                   '/entry/DAS_logs/geometry/sourceApertureHeight', '/entry/DAS_logs/carriage/frontTrans', '/entry/DAS_logs/carriage/middleTrans',
+                   '/entry/DAS_logs/carriage/rearTrans', '/entry/DAS_logs/geometry/sampleToFrontLeftDetector', '/entry/DAS_logs/geometry/sampleToMiddleLeftDetector',
+                   '/entry/DAS_logs/geometry/sampleToRearDetector', '/entry/DAS_logs/geometry/sourceApertureToSample']
+Geometry_DetectorFields = ['pixel_num_x', 'pixel_num_y', 'beam_center_x', 'beam_center_y', 'distance', 'x_pixel_size', 'y_pixel_size',
+                           'panel_gap', 'spatial_calibration', 'setback', 'vertical_offset', 'lateral_offset']
+geometry_cache = {}
+
+def VSANS_GeometryKey(representative_filenumber, Config):
+    #Uses f = get_by_filenumber(representative_filenumber)
+    #Hash of the config ID and every NeXus field QCalculation_AllDetectors uses (wavelength, apertures, carriage distances, and per-panel
+    #distances, offsets, beam centres and pixel sizes) plus the HighRes subset bounds; files with equal keys share one set of maps.
+
+    f = get_by_filenumber(representative_filenumber)
+    if f is None:
+        return None
+    relevant_detectors = short_detectors
+    if str(Config).find('CvB') != -1:
+        relevant_detectors = all_detectors
+
+    Record = [Config, ConvertHighResToSubset, HighResMinX, HighResMaxX, HighResMinY, HighResMaxY, Calc_Q_From_Trans]
+    for path in Geometry_Fields:
+        if path in f:
+            Record.append((path, np.array(f[path]).tolist()))
+    for dshort in relevant_detectors:
+        data_shape, data_type = get_panel_shape(representative_filenumber, dshort)
+        Record.append((dshort, data_shape))
+        for name in Geometry_DetectorFields:
+            path = 'entry/instrument/detector_{ds}/{name}'.format(ds=dshort, name=name)
+            if path in f:
+                Record.append((path, np.array(f[path]).tolist()))
+    if Calc_Q_From_Trans > 0:
+        Sample_Base, Sample_Name, Descrip, Listed_Config, Desired_Temp = VSANS_Sample_BaseNameDescrip(representative_filenumber)
+        Record.append(VSANS_GetBeamCenterForScattFile(Sample_Name, Config, AlignDet_TransCatalog))
+
+    return hashlib.sha256(repr(Record).encode()).hexdigest()
+
+def VSANS_LoadGeometry(Geometry_Key):
+    #Returns the maps for Geometry_Key from geometry_cache or, if SaveGeometryCache > 0, from save_path; otherwise None.
+    if Geometry_Key is None:
+        return None
+    if Geometry_Key in geometry_cache:
+        return geometry_cache[Geometry_Key]
+    geometry_fullpath = os.path.join(save_path, 'GeometryCache', Geometry_Key + '.npz')
+    if SaveGeometryCache > 0 and os.path.isfile(geometry_fullpath):
+        try:
+            Maps = {name : {} for name in Geometry_Names}
+            with np.load(geometry_fullpath, allow_pickle=False) as saved:
+                for entry in saved.files:
+                    name, dshort = entry.rsplit('_', 1)
+                    Maps[name][dshort] = saved[entry][()]
+                    if isinstance(Maps[name][dshort], np.ndarray):
+                        Maps[name][dshort].flags.writeable = False
+            geometry_cache[Geometry_Key] = tuple(Maps[name] for name in Geometry_Names)
+            return geometry_cache[Geometry_Key]
+        except (OSError, ValueError, KeyError):
+            print('Could not read', geometry_fullpath, '; recalculating Q values')
+    return None
+
+def VSANS_SaveGeometry(Geometry_Key, Geometry):
+    #The maps are shared by every sample with the same geometry, so they are made read-only.
+    if Geometry_Key is None:
+        return
+    for Maps in Geometry:
+        for dshort in Maps:
+            if isinstance(Maps[dshort], np.ndarray):
+                Maps[dshort].flags.writeable = False
+    geometry_cache[Geometry_Key] = Geometry
+    if SaveGeometryCache > 0:
+        geometry_path = os.path.join(save_path, 'GeometryCache')
+        try:
+            if not os.path.exists(geometry_path):
+                os.makedirs(geometry_path)
+            Arrays = {}
+            for name, Maps in zip(Geometry_Names, Geometry):
+                for dshort in Maps:
+                    Arrays[name + '_' + dshort] = Maps[dshort]
+            np.savez(os.path.join(geometry_path, Geometry_Key + '.npz'), **Arrays)
+        except OSError:
+            print('Could not save Q values to', geometry_path)
+    return
+
+def VSANS_PixelType():
+    #Type of the per pixel maps and scaled data: float32 with SinglePrecision >= 1, otherwise float64
+    if SinglePrecision >= 1:
+        return np.float32
+    return np.float64
+
 def QCalculation_AllDetectors(representative_filenumber, Config):
     #Uses VSANS_Sample_BaseNameDescrip(representative_filenumber)
+    #Uses VSANS_GeometryKey(representative_filenumber, Config); the maps are only calculated once per distinct geometry
+    #and the returned arrays are shared (read-only) between all samples measured with that geometry.
+
+    Geometry_Key = VSANS_GeometryKey(representative_filenumber, Config)
+    Geometry = VSANS_LoadGeometry(Geometry_Key)
+    if Geometry is not None:
+        return VSANS_GeometryLevel(Geometry_Key, Geometry)
 
     relevant_detectors = short_detectors
     if str(Config).find('CvB') != -1:
@@ -1174,7 +1744,7 @@ def QCalculation_AllDetectors(representative_filenumber, Config):
     f = get_by_filenumber(representative_filenumber)
     if f is not None:
         for dshort in relevant_detectors:
-            data = np.array(f['entry/instrument/detector_{ds}/data'.format(ds=dshort)])
+            data_shape, data_type = get_panel_shape(representative_filenumber, dshort)
             Wavelength = f['entry/instrument/beam/monochromator/wavelength'][0]
             Wavelength_spread = f['entry/instrument/beam/monochromator/wavelength_spread'][0]
             dimX = f['entry/instrument/detector_{ds}/pixel_num_x'.format(ds=dshort)][0]
@@ -1275,7 +1845,7 @@ def QCalculation_AllDetectors(representative_filenumber, Config):
                     realDistX =  x_pixel_size*(0.5) + lateral_offset + panel_gap/2.0
                     realDistY =  coeffs
 
-            X, Y = np.indices(data.shape)
+            X, Y = np.indices(data_shape)
             if dshort == 'B':
                 x0_pos =  realDistX - beam_center_x*x_pixel_size + (X)*x_pixel_size 
                 y0_pos =  realDistY - beam_center_y*y_pixel_size + (Y)*y_pixel_size
@@ -1403,63 +1973,161 @@ def QCalculation_AllDetectors(representative_filenumber, Config):
         Shadow_Mask[dshort] = Shadow
         #print(Config, dshort, "sum", np.sum(Shadow_Mask[dshort]))
 
-    return Qx, Qy, Qz, Q_total, Q_perp_unc, Q_parl_unc, InPlaneAngleMap, dimXX, dimYY, Shadow_Mask
-
-def SectorMask_AllDetectors(InPlaneAngleMap, PrimaryAngle, AngleWidth, BothSides):
+    Geometry = (Qx, Qy, Qz, Q_total, Q_perp_unc, Q_parl_unc, InPlaneAngleMap, dimXX, dimYY, Shadow_Mask)
+    VSANS_SaveGeometry(Geometry_Key, Geometry)
+
+    return VSANS_GeometryLevel(Geometry_Key, Geometry)
+
+def VSANS_GeometryLevel(Geometry_Key, Geometry):
+    #Uses VSANS_HighResPyramid
+    #The maps of the HighResRebin level; with SinglePrecision >= 1 the Q, resolution and angle maps are float32 and the shadow mask
+    #uint8 (0/1 rather than 0/1.2). The float32 maps are kept in the pyramid next to the float64 level they are made from.
+    Pyramid = VSANS_HighResPyramid(Geometry_Key, Geometry)
+    if SinglePrecision < 1:
+        return Pyramid[HighResRebin]
+
+    key = ('float32', HighResRebin)
+    if key not in Pyramid:
+        Maps = []
+        for Map in Pyramid[HighResRebin]:
+            Single = {}
+            for dshort in Map:
+                if Map is Pyramid[HighResRebin][-1]:
+                    Single[dshort] = (Map[dshort] > 0).astype(np.uint8)
+                elif isinstance(Map[dshort], np.ndarray):
+                    Single[dshort] = Map[dshort].astype(np.float32)
+                else:
+                    Single[dshort] = Map[dshort]
+                if isinstance(Single[dshort], np.ndarray):
+                    Single[dshort].flags.writeable = False
+            Maps.append(Single)
+        Pyramid[key] = tuple(Maps)
+    return Pyramid[key]
+
+highres_pyramids = {}
+
+def VSANS_HighResPyramid(Geometry_Key, Geometry):
+    #{level : maps} for each of HighRes_Levels, where the 'B' maps of a level are made from 2x2 blocks of the level below: Q components
+    #averaged, the in-plane angle taken from the averaged Qx and Qy, each resolution widened by the spread of pixel Q within the block
+    #(radial spread into Q_parl_unc, azimuthal into Q_perp_unc) and a block shadowed if any of its pixels is. The other panels are
+    #shared unchanged. Built once per geometry (kept in highres_pyramids) so every level costs one lookup.
+    if Geometry_Key is not None and Geometry_Key in highres_pyramids:
+        return highres_pyramids[Geometry_Key]
+
+    Pyramid = {1 : Geometry}
+    for Level in HighRes_Levels[1:]:
+        Maps = tuple(dict(Map) for Map in Pyramid[Level//2])
+        Qx, Qy, Qz, Q_total, Q_perp_unc, Q_parl_unc, InPlaneAngleMap, dimXX, dimYY, Shadow_Mask = Maps
+        if 'B' in Qx:
+            Fine_Qx = highres_blocks(Qx['B'], 2)
+            Fine_Qy = highres_blocks(Qy['B'], 2)
+            for Map in (Qx, Qy, Qz, Q_total):
+                Map['B'] = highres_rebin(Map['B'], 2, np.mean)
+            Q_inplane = np.sqrt(Qx['B']**2 + Qy['B']**2)
+            Q_inplane[Q_inplane == 0] = 1.0
+            Radial_x = (Qx['B']/Q_inplane)[:, np.newaxis, :, np.newaxis]
+            Radial_y = (Qy['B']/Q_inplane)[:, np.newaxis, :, np.newaxis]
+            Delta_x = Fine_Qx - Qx['B'][:, np.newaxis, :, np.newaxis]
+            Delta_y = Fine_Qy - Qy['B'][:, np.newaxis, :, np.newaxis]
+            Spread_parl = np.mean((Delta_x*Radial_x + Delta_y*Radial_y)**2, axis=(1, 3))
+            Spread_perp = np.mean((Delta_x*Radial_y - Delta_y*Radial_x)**2, axis=(1, 3))
+            Q_parl_unc['B'] = np.sqrt(highres_rebin(Q_parl_unc['B']**2, 2, np.mean) + Spread_parl)
+            Q_perp_unc['B'] = np.sqrt(highres_rebin(Q_perp_unc['B']**2, 2, np.mean) + Spread_perp)
+            InPlaneAngleMap['B'] = np.arctan2(Qy['B'], Qx['B'])*180.0/np.pi
+            Shadow_Mask['B'] = highres_rebin(Shadow_Mask['B'], 2, np.min)
+            dimXX['B'], dimYY['B'] = Qx['B'].shape
+            for Map in (Qx, Qy, Qz, Q_total, Q_perp_unc, Q_parl_unc, InPlaneAngleMap, Shadow_Mask):
+                Map['B'].flags.writeable = False
+        Pyramid[Level] = Maps
+
+    if Geometry_Key is not None:
+        highres_pyramids[Geometry_Key] = Pyramid
+    return Pyramid
+
+sector_masks = OrderedDict()
+sector_mask_entries = 256
+
+def SectorMask_SingleDetector(Angles, PrimaryAngle, AngleWidth, BothSides):
+    #Sector mask of one panel as read-only uint8; kept per angle map (the maps from QCalculation_AllDetectors are shared per geometry)
+    #so the same sector on the same geometry is only built once
+
+    key = (id(Angles), PrimaryAngle, AngleWidth, BothSides >= 1)
+    if key in sector_masks and sector_masks[key][0] is Angles:
+        sector_masks.move_to_end(key)
+        return sector_masks[key][1]
+
+    SM = np.zeros(np.shape(Angles), dtype=np.uint8)
+    if PrimaryAngle > 180.0:
+        PrimaryAngle = PrimaryAngle - 360.0
+    if PrimaryAngle < -180.0:
+        PrimaryAngle = PrimaryAngle + 360.0
+    SM[np.absolute(Angles - PrimaryAngle) <= AngleWidth] = 1
+    SM[np.absolute(Angles + 360 - PrimaryAngle) <= AngleWidth] = 1
+    SM[np.absolute(Angles - 360 - PrimaryAngle) <= AngleWidth] = 1
+    if BothSides >= 1:
+        SecondaryAngle = PrimaryAngle + 180
+        if SecondaryAngle > 180.0:
+            SecondaryAngle = SecondaryAngle - 360.0
+        if SecondaryAngle < -180.0:
+            SecondaryAngle = SecondaryAngle + 360.0
+        SM[np.absolute(Angles - SecondaryAngle) <= AngleWidth] = 1
+        SM[np.absolute(Angles + 360 - SecondaryAngle) <= AngleWidth] = 1
+        SM[np.absolute(Angles - 360 - SecondaryAngle) <= AngleWidth] = 1
+
+    #Kludge for Si Mirror
+    #SM[np.absolute(Angles - 90.0) <= 60.0] = 0
+    SM.setflags(write=False)
+
+    sector_masks[key] = (Angles, SM)
+    while len(sector_masks) > sector_mask_entries:
+        sector_masks.popitem(last=False)
+    return SM
+
+def SectorMask_AllDetectors(InPlaneAngleMap, PrimaryAngle, AngleWidth, BothSides, Config):
+    #Uses SectorMask_SingleDetector
 
     SectorMask = {}
     relevant_detectors = short_detectors
     if str(Config).find('CvB') != -1:
         relevant_detectors = all_detectors
     for dshort in relevant_detectors:
-        Angles = InPlaneAngleMap[dshort]
-        SM = np.zeros_like(Angles)
-
-        if PrimaryAngle > 180.0:
-            PrimaryAngle = PrimaryAngle - 360.0
-        if PrimaryAngle < -180.0:
-            PrimaryAngle = PrimaryAngle + 360.0
-        SM[np.absolute(Angles - PrimaryAngle) <= AngleWidth] = 1.0
-        SM[np.absolute(Angles + 360 - PrimaryAngle) <= AngleWidth] = 1.0
-        SM[np.absolute(Angles - 360 - PrimaryAngle) <= AngleWidth] = 1.0
-        if BothSides >= 1:
-            SecondaryAngle = PrimaryAngle + 180
-            if SecondaryAngle > 180.0:
-                SecondaryAngle = SecondaryAngle - 360.0
-            if SecondaryAngle < -180.0:
-                SecondaryAngle = SecondaryAngle + 360.0
-            SM[np.absolute(Angles - SecondaryAngle) <= AngleWidth] = 1.0
-            SM[np.absolute(Angles + 360 - SecondaryAngle) <= AngleWidth] = 1.0
-            SM[np.absolute(Angles - 360 - SecondaryAngle) <= AngleWidth] = 1.0
-
-        #Kludge for Si Mirror
-        #SM[np.absolute(Angles - 90.0) <= 60.0] = 0.0
-            
-        SectorMask[dshort] = SM
+        SectorMask[dshort] = SectorMask_SingleDetector(InPlaneAngleMap[dshort], PrimaryAngle, AngleWidth, BothSides)
     return SectorMask
-            
+
+def AngularBinIndex(Angles, BinWidth):
+    #Index of the BinWidth (degrees) wide angular sector each pixel falls in; sector n is centred on n*BinWidth
+
+    Sectors = int(round(360.0 / BinWidth))
+    return np.floor((np.ravel(Angles) + 0.5*BinWidth) / BinWidth).astype(np.intp) % Sectors
+
 def He3Decay_func(t, p, gamma):
     return p * np.exp(-t / gamma)
 
-def HE3_Pol_AtGivenTime(entry_time, HE3_Cell_Summary):
+def HE3_CellTimeline(HE3_Cell_Summary):
     '''
     #Predefine HE3_Cell_Summary[HE3_Trans[entry]['Insert_time']] = {'Atomic_P0' : P0, 'Gamma(hours)' : gamma, 'Mu' : Mu, 'Te' : Te}
-    #He3Decay_func must be predefined
+    #Returns the cells sorted by insert time as parallel arrays {'Insert_time', 'Atomic_P0', 'Gamma(hours)', 'Mu', 'Te'} for HE3_Pol_AtTimes;
+    #the parameters keep their own type (Mu and Te read from the files are float32), so the results match the single time calculation
     '''
-    counter = 0
-    for time in HE3_Cell_Summary:
-        if counter == 0:
-            holder_time = time
-            counter += 1
-        if entry_time >= time:
-            holder_time = time
-        if entry_time < time:
-            break
-    delta_time = entry_time - holder_time     
-    P0 = HE3_Cell_Summary[holder_time]['Atomic_P0']
-    gamma = HE3_Cell_Summary[holder_time]['Gamma(hours)']
-    Mu = HE3_Cell_Summary[holder_time]['Mu']
-    Te = HE3_Cell_Summary[holder_time]['Te']
+    Insert_Times = sorted(HE3_Cell_Summary)
+    Timeline = {'Insert_time' : np.array(Insert_Times, dtype=np.float64)}
+    for name in ('Atomic_P0', 'Gamma(hours)', 'Mu', 'Te'):
+        Timeline[name] = np.array([HE3_Cell_Summary[time][name] for time in Insert_Times])
+    return Timeline
+
+def HE3_Pol_AtTimes(entry_times, Timeline):
+    '''
+    #Uses a timeline from HE3_CellTimeline
+    #NeutronPol, UnpolHE3Trans, T_MAJ and T_MIN (arrays shaped like entry_times) from the last cell inserted at or before each time;
+    #times before the first insert use the first cell
+    '''
+    entry_times = np.asarray(entry_times, dtype=np.float64)
+    Cell = np.maximum(np.searchsorted(Timeline['Insert_time'], entry_times, side='right') - 1, 0)
+    delta_time = entry_times - Timeline['Insert_time'][Cell]
+    P0 = Timeline['Atomic_P0'][Cell]
+    gamma = Timeline['Gamma(hours)'][Cell]
+    Mu = Timeline['Mu'][Cell]
+    Te = Timeline['Te'][Cell]
     AtomicPol = P0 * np.exp(-delta_time / gamma)
     NeutronPol = np.tanh(Mu * AtomicPol)
     UnpolHE3Trans = Te * np.exp(-Mu)*np.cosh(Mu * AtomicPol)
@@ -1468,15 +2136,29 @@ def HE3_Pol_AtGivenTime(entry_time, HE3_Cell_Summary):
         
     return NeutronPol, UnpolHE3Trans, T_MAJ, T_MIN
 
+def HE3_Pol_AtGivenTime(entry_time, HE3_Cell_Summary):
+    '''
+    #Uses HE3_CellTimeline and HE3_Pol_AtTimes for a single time; to evaluate many times build the timeline once and use HE3_Pol_AtTimes
+    '''
+    NeutronPol, UnpolHE3Trans, T_MAJ, T_MIN = HE3_Pol_AtTimes(entry_time, HE3_CellTimeline(HE3_Cell_Summary))
+    return NeutronPol[()], UnpolHE3Trans[()], T_MAJ[()], T_MIN[()]
+
+he3_fits = {}
+
 def HE3_DecayCurves(HE3_Trans):
     '''
     #Uses predefined He3Decay_func
     #Creates and returns HE3_Cell_Summary
+    #A cell whose transmissions are unchanged since an earlier call (live reduction) reuses that fit without refitting or replotting
     '''
     HE3_Cell_Summary = {}
     entry_number = 0
     for entry in HE3_Trans:
         entry_number += 1
+        fit_key = repr((HE3_Trans[entry]['Insert_time'], HE3_Trans[entry]['Cell_name'], HE3_Trans[entry]['Mu'], HE3_Trans[entry]['Te'], HE3_Trans[entry]['Elasped_time'], HE3_Trans[entry]['Transmission']))
+        if fit_key in he3_fits:
+            HE3_Cell_Summary[HE3_Trans[entry]['Insert_time']] = he3_fits[fit_key]
+            continue
         Mu = HE3_Trans[entry]['Mu']
         Te = HE3_Trans[entry]['Te']
         xdata = np.array(HE3_Trans[entry]['Elasped_time'])
@@ -1491,7 +2173,8 @@ def HE3_DecayCurves(HE3_Trans):
             gamma_Unc = 'NA'
             PCell0_Unc = 'NA'
         else:
-            popt, pcov = curve_fit(He3Decay_func, xdata, ydata)
+            from scipy import optimize
+            popt, pcov = optimize.curve_fit(He3Decay_func, xdata, ydata)
             P0, gamma = popt
             P0_Unc, gamma_Unc = np.sqrt(np.diag(pcov))
             PCell0 = np.tanh(Mu * P0)
@@ -1501,6 +2184,7 @@ def HE3_DecayCurves(HE3_Trans):
 
         Name = HE3_Trans[entry]['Cell_name'][0]
         HE3_Cell_Summary[HE3_Trans[entry]['Insert_time']] = {'Atomic_P0' : P0, 'Atomic_P0_Unc' : P0_Unc, 'Gamma(hours)' : gamma, 'Gamma_Unc' : gamma_Unc, 'Mu' : Mu, 'Te' : Te, 'Name' : Name, 'Neutron_P0' : PCell0, 'Neutron_P0_Unc' : PCell0_Unc}
+        he3_fits[fit_key] = HE3_Cell_Summary[HE3_Trans[entry]['Insert_time']]
         print('He3Cell Summary for Cell Identity', HE3_Trans[entry]['Cell_name'][0])
         print('PolCell0: ', PCell0, '+/-', PCell0_Unc)
         print('AtomicPol0: ', P0, '+/-', P0_Unc)
@@ -1512,18 +2196,13 @@ def HE3_DecayCurves(HE3_Trans):
             fit = He3Decay_func(xdata, popt[0], popt[1])
             fit_max = He3Decay_func(xdata, popt[0] + P0_Unc, popt[1] + gamma_Unc)
             fit_min = He3Decay_func(xdata, popt[0] - P0_Unc, popt[1] - gamma_Unc)
-            fig = plt.figure()
-            plt.plot(xdata, ydata, 'b*', label='data')
-            plt.plot(xdata, fit_max, 'r-', label='fit of data (upper bounds)')
-            plt.plot(xdata, fit, 'y-', label='fit of data (best)')
-            plt.plot(xdata, fit_min, 'c-', label='fit of data (lower bounds)')
-            plt.xlabel('time (hours)')
-            plt.ylabel('3He atomic polarization')
-            plt.title('He3 Cell Decay for {name}'.format(name = Name))
-            plt.legend()
-            fig.savefig(save_path + 'He3Curve_AtomicPolarization_Cell{name}.png'.format(name = Name))
-            plt.pause(2)
-            plt.close()
+            Figure = VSANS_Figure(save_path + 'He3Curve_AtomicPolarization_Cell{name}.png'.format(name = Name), 'He3 Cell Decay for {name}'.format(name = Name),
+                                  'time (hours)', '3He atomic polarization', 'linear', 'linear')
+            VSANS_FigureSeries(Figure, xdata, ydata, 'b*', 'data')
+            VSANS_FigureSeries(Figure, xdata, fit_max, 'r-', 'fit of data (upper bounds)')
+            VSANS_FigureSeries(Figure, xdata, fit, 'y-', 'fit of data (best)')
+            VSANS_FigureSeries(Figure, xdata, fit_min, 'c-', 'fit of data (lower bounds)')
+            VSANS_QueueFigure(Figure)
 
         if xdata.size >= 2:
             #print('Graphing current and projected decay curves....(close generated plot to continue)')
@@ -1540,63 +2219,32 @@ def HE3_DecayCurves(HE3_Trans):
             TMAJ_fit = Te * np.exp(-Mu*(1.0 - AtomicPol_fitlonger))
             TMIN_fit = Te * np.exp(-Mu*(1.0 + AtomicPol_fitlonger))
             
-            fig = plt.figure()
-            plt.plot(xdata, TMAJ_data, 'b*', label='T_MAJ data')
-            plt.plot(xdataextended, TMAJ_fit, 'c-', label='T_MAJ predicted')
-
-            plt.plot(xdata, TMIN_data, 'r*', label='T_MIN data')
-            plt.plot(xdataextended, TMIN_fit, 'm-', label='T_MIN predicted')
-            
-            plt.xlabel('time (hours)')
-            plt.ylabel('Spin Transmission')
-            plt.title('Predicted He3 Cell Transmission for {name}'.format(name = Name))
-            plt.legend()
-            fig.savefig(save_path + 'He3PredictedDecayCurve_{name}.png'.format(name = Name))
-            plt.pause(2)
-            plt.close()
+            Figure = VSANS_Figure(save_path + 'He3PredictedDecayCurve_{name}.png'.format(name = Name), 'Predicted He3 Cell Transmission for {name}'.format(name = Name),
+                                  'time (hours)', 'Spin Transmission', 'linear', 'linear')
+            VSANS_FigureSeries(Figure, xdata, TMAJ_data, 'b*', 'T_MAJ data')
+            VSANS_FigureSeries(Figure, xdataextended, TMAJ_fit, 'c-', 'T_MAJ predicted')
+            VSANS_FigureSeries(Figure, xdata, TMIN_data, 'r*', 'T_MIN data')
+            VSANS_FigureSeries(Figure, xdataextended, TMIN_fit, 'm-', 'T_MIN predicted')
+            VSANS_QueueFigure(Figure)
 
     return HE3_Cell_Summary
 
 def vSANS_PolarizationSupermirrorAndFlipper(Pol_Trans, HE3_Cell_Summary, UsePolCorr):
     #Uses time of measurement from Pol_Trans and cell history from HE3_Cell_Summary.
     #Saves PSM and PF values into Pol_Trans.
-    #Uses prefefined HE3_Pol_AtGivenTime function.
+    #Uses HE3_CellTimeline and HE3_Pol_AtTimes; the measurement times of every sample and spin state are evaluated in one call.
     #Note: The vSANS RF Flipper polarization has been measured at 1.0 and is, thus, set.
     
-    for ID in Pol_Trans:
-        if 'Meas_Time' in Pol_Trans[ID]['T_UU']:
-            for Time in Pol_Trans[ID]['T_UU']['Meas_Time']:
-                NP, UT, T_MAJ, T_MIN = HE3_Pol_AtGivenTime(Time, HE3_Cell_Summary)
-                if 'Neutron_Pol' not in Pol_Trans[ID]['T_UU']:
-                    Pol_Trans[ID]['T_UU']['Neutron_Pol'] = [NP]
-                    Pol_Trans[ID]['T_UU']['Unpol_Trans'] = [UT]
-                else:
-                    Pol_Trans[ID]['T_UU']['Neutron_Pol'].append(NP)
-                    Pol_Trans[ID]['T_UU']['Unpol_Trans'].append(UT)
-            for Time in Pol_Trans[ID]['T_DD']['Meas_Time']:
-                NP, UT, T_MAJ, T_MIN = HE3_Pol_AtGivenTime(Time, HE3_Cell_Summary)
-                if 'Neutron_Pol' not in Pol_Trans[ID]['T_DD']:
-                    Pol_Trans[ID]['T_DD']['Neutron_Pol'] = [NP]
-                    Pol_Trans[ID]['T_DD']['Unpol_Trans'] = [UT]
-                else:
-                    Pol_Trans[ID]['T_DD']['Neutron_Pol'].append(NP)
-                    Pol_Trans[ID]['T_DD']['Unpol_Trans'].append(UT)       
-            for Time in Pol_Trans[ID]['T_DU']['Meas_Time']:
-                NP, UT, T_MAJ, T_MIN = HE3_Pol_AtGivenTime(Time, HE3_Cell_Summary)
-                if 'Neutron_Pol' not in Pol_Trans[ID]['T_DU']:
-                    Pol_Trans[ID]['T_DU']['Neutron_Pol'] = [NP]
-                    Pol_Trans[ID]['T_DU']['Unpol_Trans'] = [UT]
-                else:
-                    Pol_Trans[ID]['T_DU']['Neutron_Pol'].append(NP)
-                    Pol_Trans[ID]['T_DU']['Unpol_Trans'].append(UT)     
-            for Time in Pol_Trans[ID]['T_UD']['Meas_Time']:
-                NP, UT,T_MAJ, T_MIN = HE3_Pol_AtGivenTime(Time, HE3_Cell_Summary)
-                if 'Neutron_Pol' not in Pol_Trans[ID]['T_UD']:
-                    Pol_Trans[ID]['T_UD']['Neutron_Pol'] = [NP]
-                    Pol_Trans[ID]['T_UD']['Unpol_Trans'] = [UT]
-                else:
-                    Pol_Trans[ID]['T_UD']['Neutron_Pol'].append(NP)
-                    Pol_Trans[ID]['T_UD']['Unpol_Trans'].append(UT)
+    Entries = [(ID, TransType) for ID in Pol_Trans if 'Meas_Time' in Pol_Trans[ID]['T_UU'] for TransType in ('T_UU', 'T_DD', 'T_DU', 'T_UD')]
+    if len(Entries) > 0:
+        Times = [np.asarray(Pol_Trans[ID][TransType]['Meas_Time'], dtype=np.float64) for ID, TransType in Entries]
+        NP, UT, T_MAJ, T_MIN = HE3_Pol_AtTimes(np.concatenate(Times), HE3_CellTimeline(HE3_Cell_Summary))
+        Splits = np.cumsum([len(Time) for Time in Times])[:-1]
+        for (ID, TransType), Entry_NP, Entry_UT in zip(Entries, np.split(NP, Splits), np.split(UT, Splits)):
+            if len(Entry_NP) == 0:
+                continue
+            Pol_Trans[ID][TransType].setdefault('Neutron_Pol', []).extend(Entry_NP)
+            Pol_Trans[ID][TransType].setdefault('Unpol_Trans', []).extend(Entry_UT)
 
     for ID in Pol_Trans:
         if 'Neutron_Pol' in Pol_Trans[ID]['T_UU']:
@@ -1629,12 +2277,15 @@ def vSANS_PolarizationSupermirrorAndFlipper(Pol_Trans, HE3_Cell_Summary, UsePolC
             PSMDU = (1.0 - DU/DU_UnpolHe3Trans)/(DU_NeutronPol)
             PSM_Ave = 0.25*(np.average(PSMUU) + np.average(PSMDD) + np.average(PSMUD) + np.average(PSMDU))
             Pol_Trans[ID]['P_SM'] = np.average(PSM_Ave)
+            PSM_All = np.concatenate((np.ravel(PSMUU), np.ravel(PSMDD), np.ravel(PSMUD), np.ravel(PSMDU)))
+            Pol_Trans[ID]['P_SM_Unc'] = np.std(PSM_All)/np.sqrt(PSM_All.size) if PSM_All.size > 1 else 0.0
             print('Sample Depol * PSM', Pol_Trans[ID]['P_SM'])
             print('Flipping ratios (UU/DU, DD/UD):', int(10000*np.average(UU)/np.average(DU))/10000, int(10000*np.average(DD)/np.average(UD))/10000)
             
             if UsePolCorr == 0:
                 '''#0 Means no, turn it off'''
                 Pol_Trans[ID]['P_SM'] = 1.0
+                Pol_Trans[ID]['P_SM_Unc'] = 0.0
                 Pol_Trans[ID]['P_F'] = 1.0
                 print('Manually reset P_SM and P_F to unity')
 
@@ -1642,11 +2293,14 @@ def vSANS_PolarizationSupermirrorAndFlipper(Pol_Trans, HE3_Cell_Summary, UsePolC
     return
 
 def AbsScale(ScattType, Sample, Config, BlockBeam_per_second, Solid_Angle, Plex, Scatt, Trans):
+    #Uses VSANS_PixelType; the scaled data and uncertainties are float32 with SinglePrecision >= 1
 
     Scaled_Data = {}
     UncScaled_Data = {}
     masks = {}
     BB = {}
+    Denominator = {}
+    Pixel_Type = VSANS_PixelType()
 
     relevant_detectors = short_detectors
     if str(Config).find('CvB') != -1:
@@ -1678,7 +2332,7 @@ def AbsScale(ScattType, Sample, Config, BlockBeam_per_second, Solid_Angle, Plex,
                 at least for shorter count times)'''
                 
             for dshort in relevant_detectors:
-                Holder =  np.array(BlockBeam_per_second[dshort])
+                Holder = BlockBeam_per_second[dshort]
                 '''Optional:
                 if Config in Masks:
                     if 'Scatt_WithSolenoidss' in Masks[Config]:   
@@ -1690,17 +2344,14 @@ def AbsScale(ScattType, Sample, Config, BlockBeam_per_second, Solid_Angle, Plex,
                 else:
                     masks[dshort] = np.ones_like(Holder)
                 '''
-                masks[dshort] = np.ones_like(Holder)
-                Sum = np.sum(Holder[masks[dshort] > 0])
-                Pixels = np.sum(masks[dshort])
-                Unc = np.sqrt(Sum)/Pixels
-                Ave = np.average(Holder[masks[dshort] > 0])
-                BB[dshort] = Ave
                 if ConvertHighResToSubset > 0 and dshort == 'B':
-                    bb_holder = Holder[HighResMinX:HighResMaxX+1,HighResMinY:HighResMaxY+1]
-                    bb_sum = np.sum(bb_holder)
-                    bb_ave = np.average(Holder[HighResMinX:HighResMaxX+1,HighResMinY:HighResMaxY+1])
-                    BB[dshort] = (bb_holder)/HighResGain # Better to subtract BB pixel-by-pixel than average for HighRes detector
+                    BB[dshort] = highres_rebin(Holder[highres_region()], HighResRebin)/HighResGain # Better to subtract BB pixel-by-pixel than average for HighRes detector
+                else:
+                    BB[dshort] = np.average(Holder)
+                    if dshort == 'B':
+                        BB[dshort] *= HighResRebin*HighResRebin
+                BB[dshort] = np.asarray(BB[dshort], dtype=Pixel_Type)
+                Denominator[dshort] = np.asarray(Number_Files*Plex[dshort]*Solid_Angle[dshort], dtype=Pixel_Type)
 
 
             He3Glass_Trans = 1.0
@@ -1721,22 +2372,22 @@ def AbsScale(ScattType, Sample, Config, BlockBeam_per_second, Solid_Angle, Plex,
                                 He3Glass_Trans = f['/entry/DAS_logs/backPolarization/glassTransmission'][0]
                             else:
                                 He3Glass_Trans = TeValues[0]
+                        Scale = Pixel_Type((1E8/MonCounts)/(ABS_Scale*He3Glass_Trans))
                         for dshort in relevant_detectors:
-                            data = np.array(f['entry/instrument/detector_{ds}/data'.format(ds=dshort)])
-                            unc = np.array(f['entry/instrument/detector_{ds}/data'.format(ds=dshort)])
+                            data = np.asarray(get_panel_subset(filenumber, dshort), dtype=Pixel_Type)
+                            unc = data
                             if ConvertHighResToSubset > 0 and dshort == 'B':
-                                data_holder = data/HighResGain
-                                data = data_holder[HighResMinX:HighResMaxX+1,HighResMinY:HighResMaxY+1]
-                                unc = data_holder[HighResMinX:HighResMaxX+1,HighResMinY:HighResMaxY+1]
-                            data = (data - Count_time*BB[dshort])/(Number_Files*Plex[dshort]*Solid_Angle[dshort])
+                                data = data/Pixel_Type(HighResGain)
+                                unc = data
+                            data = (data - Pixel_Type(Count_time)*BB[dshort])/Denominator[dshort]
                             if filecounter < 2:
-                                Scaled_Data[dshort] = ((1E8/MonCounts)/(ABS_Scale*He3Glass_Trans))*data
-                                UncScaled_Data[dshort] = unc
+                                Scaled_Data[dshort] = Scale*data
+                                UncScaled_Data[dshort] = np.array(unc)
                             else:
-                                Scaled_Data[dshort] += ((1E8/MonCounts)/(ABS_Scale*He3Glass_Trans))*data
+                                Scaled_Data[dshort] += Scale*data
                                 UncScaled_Data[dshort] += unc           
                 for dshort in relevant_detectors:
-                    UncScaled_Data[dshort] = np.sqrt(UncScaled_Data[dshort])*((1E8/MonCounts)/(ABS_Scale*He3Glass_Trans))/(Number_Files*Plex[dshort]*Solid_Angle[dshort])
+                    UncScaled_Data[dshort] = np.sqrt(UncScaled_Data[dshort])*Scale/Denominator[dshort]
         else:
             Scaled_Data = 'NA'
             UncScaled_Data = 'NA'
@@ -1762,40 +2413,118 @@ def vSANS_BestSuperMirrorPolarizationValue(Starting_PSM, YesNoBypassBestGuessPSM
 
     return Truest_PSM
 
-def vSANS_PolCorrScattFiles(BestPSM, dimXX, dimYY, Sample, Config, Scatt, Trans, Pol_Trans, UUScaledData, DUScaledData, DDScaledData, UDScaledData, UUScaledData_Unc, DUScaledData_Unc, DDScaledData_Unc, UDScaledData_Unc):
-
-    Scaled_Data = np.zeros((8,4,6144))
-    UncScaled_Data = np.zeros((8,4,6144))
+PolCorr_SpinSigns = np.array([[1.0, 1.0], [-1.0, 1.0], [1.0, -1.0], [-1.0, -1.0]])
 
-    relevant_detectors = short_detectors
-
-    Det_counter = 0
-    for dshort in relevant_detectors:
-        UUD = np.array(UUScaledData[dshort])
-        Scaled_Data[Det_counter][0][:] += UUD.flatten()
-        
-        DUD = np.array(DUScaledData[dshort])
-        Scaled_Data[Det_counter][1][:] += DUD.flatten()
-
-        DDD = np.array(DDScaledData[dshort])
-        Scaled_Data[Det_counter][2][:] += DDD.flatten()
-
-        UDD = np.array(UDScaledData[dshort])
-        Scaled_Data[Det_counter][3][:] += UDD.flatten()
+def vSANS_PolEfficiencyMatrices(Sample, Config, Scatt, PSM, BestPSM, Cell_Summary=None):
+    #Uses HE3_CellTimeline, HE3_Pol_AtTimes and the globals HE3_Cell_Summary (unless Cell_Summary is given) and Minimum_PSM
+    #Returns Pol_Efficiency, Pol_Efficiency_V2, Pol_Efficiency_V3 and HE3_Efficiency, each averaged over the files of every cross-section.
+    #Row i (UU, DU, DD, UD) column j holds (C*(A*s1 + B*s2) + D*s1*s2 + 1)*UT with the spin signs (s1, s2) of entry i^j in PolCorr_SpinSigns.
 
-        UUD_Unc = np.array(UUScaledData_Unc[dshort])
-        UncScaled_Data[Det_counter][0][:] += UUD_Unc.flatten()
-        
-        DUD_Unc = np.array(DUScaledData_Unc[dshort])
-        UncScaled_Data[Det_counter][1][:] += DUD_Unc.flatten()
-
-        DDD_Unc = np.array(DDScaledData_Unc[dshort])
-        UncScaled_Data[Det_counter][2][:] += DDD_Unc.flatten()
+    Pol_Efficiency = np.zeros((4,4))
+    Pol_Efficiency_V2 = np.zeros((4,4))
+    Pol_Efficiency_V3 = np.zeros((4,4))
+    HE3_Efficiency = np.zeros((4,4))
 
-        UDD_Unc = np.array(UDScaledData_Unc[dshort])
-        UncScaled_Data[Det_counter][3][:] += UDD_Unc.flatten()
+    if Cell_Summary is None:
+        Cell_Summary = HE3_Cell_Summary
+    Timeline = HE3_CellTimeline(Cell_Summary)
+    Scatt_Type = ["UU", "DU", "DD", "UD"]
+    C_Values = [[], [], [], []]
+    UT_Values = [[], [], [], []]
+    for CrossSection_Index, type in enumerate(Scatt_Type):
+        type_time = type + "_Time"
+        Number = 1.0*len(Scatt[Sample]['Config(s)'][Config][type])
+        filenumber_counter = 0
+        Times = []
+        for filenumber in Scatt[Sample]['Config(s)'][Config][type]:
+            f = get_by_filenumber(filenumber)
+            if f is not None:
+                Times.append(Scatt[Sample]['Config(s)'][Config][type_time][filenumber_counter])
+        if len(Times) > 0:
+            NP, UT, T_MAJ, T_MIN = HE3_Pol_AtTimes(Times, Timeline)
+            C_Values[CrossSection_Index] = NP
+            UT_Values[CrossSection_Index] = UT / Number
+    if sum(len(values) for values in C_Values) == 0:
+        return Pol_Efficiency, Pol_Efficiency_V2, Pol_Efficiency_V3, HE3_Efficiency
+
+    S = BestPSM
+    if PSM < Minimum_PSM:
+        PSM = Minimum_PSM
+    '''#0.9985 is the highest I've recently gotten at 5.5 Ang from EuSe 60 nm 0.95 V and 2.0 K'''
+    X = np.sqrt(PSM/S)
+    Y = X
+    SX = PSM
+    SY = PSM
+    Terms = [(S*X*Y, Y, S*X), (SX, 1.0, SX), (SY, Y, S)]
+
+    Columns = np.arange(4)
+    for CrossSection_Index in range(4):
+        if len(C_Values[CrossSection_Index]) == 0:
+            continue
+        C = np.array(C_Values[CrossSection_Index])[:, None]
+        UT = np.array(UT_Values[CrossSection_Index])[:, None]
+        S1 = PolCorr_SpinSigns[CrossSection_Index ^ Columns, 0]
+        S2 = PolCorr_SpinSigns[CrossSection_Index ^ Columns, 1]
+        for Matrix, (A, B, D) in zip((Pol_Efficiency, Pol_Efficiency_V2, Pol_Efficiency_V3), Terms):
+            Matrix[CrossSection_Index] += np.sum((C*(A*S1 + B*S2) + D*S1*S2 + 1)*UT, axis=0)
+        HE3_Efficiency[CrossSection_Index][CrossSection_Index] += np.sum(UT)
+
+    return Pol_Efficiency, Pol_Efficiency_V2, Pol_Efficiency_V3, HE3_Efficiency
+
+def vSANS_PolCorrMatrix(Pol_Efficiency, Pol_Efficiency_V2, Pol_Efficiency_V3, HE3_Efficiency):
+    #Efficiency matrix whose inverse is the pol-correction Prefactor for the chosen UsePolCorr and He3CorrectionType
+
+    Matrix = Pol_Efficiency #default for UsePolCorr == 1 and He3CorrectionType == 1
+    if UsePolCorr == 1 and He3CorrectionType == 0: #old way with X depol before sample and Y depol after sample = 1
+        Matrix = Pol_Efficiency_V2
+    if UsePolCorr == 1 and He3CorrectionType == 2: #Y depol after sample and X depol before sample = 1
+        Matrix = Pol_Efficiency_V3
+    if UsePolCorr == 0:
+        Matrix = 4.0*HE3_Efficiency
+    return Matrix
+
+def vSANS_PolCorrSystematics(Sample, Config, Scatt, PSM, PSM_Unc, BestPSM):
+    #Uses vSANS_PolEfficiencyMatrices, vSANS_PolCorrMatrix and the global HE3_Cell_Summary
+    #Returns [(derivative of the efficiency matrix, parameter uncertainty)] for PSM and for the atomic P0 and decay time of each He3 cell
+    #(central differences; parameters that do not affect this sample are left out)
+
+    Parameters = []
+    if PSM_Unc > 0:
+        Parameters.append(('P_SM', None, PSM, PSM_Unc))
+    for cell_time in HE3_Cell_Summary:
+        for name, unc_name in (('Atomic_P0', 'Atomic_P0_Unc'), ('Gamma(hours)', 'Gamma_Unc')):
+            Unc = HE3_Cell_Summary[cell_time][unc_name]
+            if str(Unc).find('NA') == -1 and Unc > 0:
+                Parameters.append((name, cell_time, HE3_Cell_Summary[cell_time][name], Unc))
+
+    Derivatives = []
+    for name, cell_time, Value, Unc in Parameters:
+        Step = 1E-6*abs(Value) if Value != 0 else 1E-6
+        Matrices = []
+        for Shift in (Step, -Step):
+            if cell_time is None:
+                Efficiencies = vSANS_PolEfficiencyMatrices(Sample, Config, Scatt, PSM + Shift, BestPSM)
+            else:
+                Cell_Summary = dict(HE3_Cell_Summary)
+                Cell_Summary[cell_time] = dict(HE3_Cell_Summary[cell_time])
+                Cell_Summary[cell_time][name] = Value + Shift
+                Efficiencies = vSANS_PolEfficiencyMatrices(Sample, Config, Scatt, PSM, BestPSM, Cell_Summary)
+            Matrices.append(vSANS_PolCorrMatrix(*Efficiencies))
+        Derivative = (Matrices[0] - Matrices[1]) / (2.0*Step)
+        if np.any(Derivative != 0):
+            Derivatives.append((Derivative, Unc))
+    return Derivatives
+
+def vSANS_PolCorrScattFiles(BestPSM, dimXX, dimYY, Sample, Config, Scatt, Trans, Pol_Trans, UUScaledData, DUScaledData, DDScaledData, UDScaledData, UUScaledData_Unc, DUScaledData_Unc, DDScaledData_Unc, UDScaledData_Unc, QGridPerDetector, GeneralMask):
+    #Uses vSANS_PolEfficiencyMatrices, vSANS_PolCorrMatrix, vSANS_PolCorrSystematics and VSANS_ActivePixels
+    #The live pixels (GeneralMask > 0) of all panels (and the HighRes 'B' panel for CvB) are stacked into one (4 x Npix) array so the inverse
+    #efficiency matrix is applied in one np.dot (in float32 with SinglePrecision >= 1); the returned per panel arrays are zero outside of
+    #GeneralMask, which every later stage applies.
 
-        Det_counter += 1
+    relevant_detectors = short_detectors
+    stacked_detectors = list(relevant_detectors)
+    if str(Config).find('CvB') != -1:
+        stacked_detectors.append('B')
 
     '''#Full-Pol Reduction:'''
     PolCorr_UU = {}
@@ -1807,13 +2536,6 @@ def vSANS_PolCorrScattFiles(BestPSM, dimXX, dimYY, Sample, Config, Scatt, Trans,
     PolCorr_DD_Unc = {}
     PolCorr_UD_Unc = {}
 
-    Pol_Efficiency = np.zeros((4,4))
-    Pol_Efficiency_V2 = np.zeros((4,4))
-    Pol_Efficiency_V3 = np.zeros((4,4))
-    HE3_Efficiency = np.zeros((4,4))
-    PolCorr_AllDetectors = {}
-    HE3Corr_AllDetectors = {}
-    Uncertainty_PolCorr_AllDetectors = {}
     Have_FullPol = 0
     if Sample in Trans and str(Scatt[Sample]['Config(s)'][Config]['UU']).find('NA') == -1 and str(Scatt[Sample]['Config(s)'][Config]['DU']).find('NA') == -1 and str(Scatt[Sample]['Config(s)'][Config]['DD']).find('NA') == -1 and str(Scatt[Sample]['Config(s)'][Config]['UD']).find('NA') == -1:
         Have_FullPol = 1
@@ -1821,6 +2543,9 @@ def vSANS_PolCorrScattFiles(BestPSM, dimXX, dimYY, Sample, Config, Scatt, Trans,
         if Sample in Pol_Trans:
             PSM = Pol_Trans[Sample]['P_SM']
             PF = Pol_Trans[Sample]['P_F']
+            PSM_Unc = 0.0
+            if 'P_SM_Unc' in Pol_Trans[Sample]:
+                PSM_Unc = Pol_Trans[Sample]['P_SM_Unc']
             print(Sample, Config, 'PSM is', PSM)
             if UsePolCorr >= 1:
                 Have_FullPol = 2
@@ -1828,131 +2553,65 @@ def vSANS_PolCorrScattFiles(BestPSM, dimXX, dimYY, Sample, Config, Scatt, Trans,
             print(Sample, Config, 'missing P_F and P_SM; will proceed without pol-correction!')
             PF = 1.0
             PSM = 1.0
-        '''#Calculating an average block beam counts per pixel and time (seems to work better than a pixel-by-pixel subtraction,
-        at least for shorter count times)'''
-
-        Number_UU = 1.0*len(Scatt[Sample]['Config(s)'][Config]["UU"])
-        Number_DU = 1.0*len(Scatt[Sample]['Config(s)'][Config]["DU"])
-        Number_DD = 1.0*len(Scatt[Sample]['Config(s)'][Config]["DD"])
-        Number_UD = 1.0*len(Scatt[Sample]['Config(s)'][Config]["UD"])      
-            
-        Scatt_Type = ["UU", "DU", "DD", "UD"]
-        for type in Scatt_Type:
-            type_time = type + "_Time"
-            filenumber_counter = 0
-            for filenumber in Scatt[Sample]['Config(s)'][Config][type]:
-                f = get_by_filenumber(representative_filenumber)
-                if f is not None:
-                    entry = Scatt[Sample]['Config(s)'][Config][type_time][filenumber_counter]
-                    NP, UT, T_MAJ, T_MIN = HE3_Pol_AtGivenTime(entry, HE3_Cell_Summary)
-                    C = NP
-                    S = BestPSM
-                    if PSM < Minimum_PSM:
-                        PSM = Minimum_PSM
-                    '''#0.9985 is the highest I've recently gotten at 5.5 Ang from EuSe 60 nm 0.95 V and 2.0 K'''
-                    X = np.sqrt(PSM/S)
-                    Y = X
-                    SX = PSM
-                    SY = PSM
-                    if type == "UU":
-                        CrossSection_Index = 0
-                        UT = UT / Number_UU
-                        Pol_Efficiency[CrossSection_Index][:] += [(C*(S*X*Y + Y) + S*X + 1)*UT, (C*(-S*X*Y + Y) - S*X + 1)*UT, (C*(S*X*Y - Y) - S*X + 1)*UT, (C*(-S*X*Y - Y) + S*X + 1)*UT]
-                        Pol_Efficiency_V2[CrossSection_Index][:] += [(C*(SX + 1) + SX + 1)*UT, (C*(-SX + 1) - SX + 1)*UT, (C*(SX - 1) - SX + 1)*UT, (C*(-SX - 1) + SX + 1)*UT]
-                        Pol_Efficiency_V3[CrossSection_Index][:] += [(C*(SY + Y) + S + 1)*UT, (C*(-SY + Y) - S + 1)*UT, (C*(SY - Y) - S + 1)*UT, (C*(-SY - Y) + S + 1)*UT]
-                        HE3_Efficiency[CrossSection_Index][:] += [ UT, 0.0, 0.0, 0.0]
-                    elif type == "DU":
-                        CrossSection_Index = 1
-                        UT = UT / Number_DU
-                        Pol_Efficiency[CrossSection_Index][:] += [(C*(-S*X*Y + Y) - S*X + 1)*UT, (C*(S*X*Y + Y) + S*X + 1)*UT, (C*(-S*X*Y - Y) + S*X + 1)*UT, (C*(S*X*Y - Y) - S*X + 1)*UT]
-                        Pol_Efficiency_V2[CrossSection_Index][:] += [(C*(-SX + 1) - SX + 1)*UT, (C*(SX + 1) + SX + 1)*UT, (C*(-SX - 1) + SX + 1)*UT, (C*(SX - 1) - SX + 1)*UT]
-                        Pol_Efficiency_V3[CrossSection_Index][:] += [(C*(-SY + Y) - S + 1)*UT, (C*(SY + Y) + S + 1)*UT, (C*(-SY - Y) + S + 1)*UT, (C*(SY - Y) - S + 1)*UT]
-                        HE3_Efficiency[CrossSection_Index][:] += [ 0.0, UT, 0.0, 0.0]
-                    elif type == "DD":
-                        CrossSection_Index = 2
-                        UT = UT / Number_DD
-                        Pol_Efficiency[CrossSection_Index][:] += [(C*(S*X*Y - Y) - S*X + 1)*UT, (C*(-S*X*Y - Y) + S*X + 1)*UT, (C*(S*X*Y + Y) + S*X + 1)*UT, (C*(-S*X*Y + Y) - S*X + 1)*UT]
-                        Pol_Efficiency_V2[CrossSection_Index][:] += [(C*(SX - 1) - SX + 1)*UT, (C*(-SX - 1) + SX + 1)*UT, (C*(SX + 1) + SX + 1)*UT, (C*(-SX + 1) - SX + 1)*UT]
-                        Pol_Efficiency_V3[CrossSection_Index][:] += [(C*(SY - Y) - S + 1)*UT, (C*(-SY - Y) + S + 1)*UT, (C*(SY + Y) + S + 1)*UT, (C*(-SY + Y) - S + 1)*UT]
-                        HE3_Efficiency[CrossSection_Index][:] += [ 0.0, 0.0, UT, 0.0]
-                    elif type == "UD":
-                        CrossSection_Index = 3
-                        UT = UT / Number_UD
-                        Pol_Efficiency[CrossSection_Index][:] += [(C*(-S*X*Y - Y) + S*X + 1)*UT, (C*(S*X*Y - Y) - S*X + 1)*UT, (C*(-S*X*Y + Y) - S*X + 1)*UT, (C*(S*X*Y + Y) + S*X + 1)*UT]
-                        Pol_Efficiency_V2[CrossSection_Index][:] += [(C*(-SX - 1) + SX + 1)*UT, (C*(SX - 1) - SX + 1)*UT, (C*(-SX + 1) - SX + 1)*UT, (C*(SX + 1) + SX + 1)*UT]
-                        Pol_Efficiency_V3[CrossSection_Index][:] += [(C*(-SY - Y) + S + 1)*UT, (C*(SY - Y) - S + 1)*UT, (C*(-SY + Y) - S + 1)*UT, (C*(SY + Y) + S + 1)*UT]
-                        HE3_Efficiency[CrossSection_Index][:] += [ 0.0, 0.0, 0.0, UT]
-
-        Prefactor = inv(Pol_Efficiency) #default for UsePolCorr == 1 and He3CorrectionType == 1
-        if UsePolCorr == 1 and He3CorrectionType == 0: #old way with X depol before sample and Y depol after sample = 1
-            Prefactor = inv(Pol_Efficiency_V2)
-        if UsePolCorr == 1 and He3CorrectionType == 2: #Y depol after sample and X depol before sample = 1
-            Prefactor = inv(Pol_Efficiency_V3)
-        if UsePolCorr == 0:
-            Prefactor = inv(4.0*HE3_Efficiency)
-            
-        if str(Config).find('CvB') != -1:
-            HRX = int(dimXX['B'])
-            HRY = int(dimYY['B'])
-            highrespixels = HRX*HRY
-            RearScaled_Data = np.zeros((4, highrespixels))
-            UncRearScaled_Data = np.zeros((4, highrespixels))
-            
-            UUR = np.array(UUScaledData['B'])
-            RearScaled_Data[0][:] += UUR.flatten()
-            DUR = np.array(DUScaledData['B'])
-            RearScaled_Data[1][:] += DUR.flatten()
-            DDR = np.array(DDScaledData['B'])
-            RearScaled_Data[2][:] += DDR.flatten()
-            UDR = np.array(UDScaledData['B'])
-            RearScaled_Data[3][:] += UDR.flatten()
-            UncRearScaled_Data[0][:] = RearScaled_Data[0][:]
-            UncRearScaled_Data[1][:] = RearScaled_Data[1][:]
-            UncRearScaled_Data[2][:] = RearScaled_Data[2][:]
-            UncRearScaled_Data[3][:] = RearScaled_Data[3][:]
-
-            BackPolCorr = np.dot(Prefactor, RearScaled_Data)
-            BackUncertainty_PolCorr = UncRearScaled_Data
-            
-            PolCorr_UU['B'] = BackPolCorr[0][:][:].reshape((HRX, HRY))
-            PolCorr_UU_Unc['B'] = BackUncertainty_PolCorr[0][:][:].reshape((HRX, HRY))
-            PolCorr_DU['B'] = BackPolCorr[1][:][:].reshape((HRX, HRY))
-            PolCorr_DU_Unc['B'] = BackUncertainty_PolCorr[1][:][:].reshape((HRX, HRY))
-            PolCorr_DD['B'] = BackPolCorr[2][:][:].reshape((HRX, HRY))
-            PolCorr_DD_Unc['B'] = BackUncertainty_PolCorr[2][:][:].reshape((HRX, HRY))
-            PolCorr_UD['B'] = BackPolCorr[3][:][:].reshape((HRX, HRY))
-            PolCorr_UD_Unc['B'] = BackUncertainty_PolCorr[3][:][:].reshape((HRX, HRY))
-
-        
-        Det_Index = 0
-        for dshort in relevant_detectors:
-            UncData_Per_Detector = UncScaled_Data[Det_Index][:][:]
-            Data_Per_Detector = Scaled_Data[Det_Index][:][:]
-            
-            PolCorr_Data = np.dot(2.0*Prefactor, Data_Per_Detector)
-            '''
-            #Below is the code that allows true matrix error propagation, but it takes a while...so may want to optimize more before implementing.
-            #Also will need to uncomment from uncertainties import unumpy (top).
-            Data_Per_Detector2 = unumpy.umatrix(Scaled_Data[Det_Index][:][:], UncScaled_Data[Det_Index][:][:])
-            PolCorr_Data2 = np.dot(Prefactor, Data_Per_Detector2)
-            PolCorr_Data = unumpy.nominal_values(PolCorr_Data2)
-            PolCorr_Unc = unumpy.std_devs(PolCorr_Data2)
-            '''
-            PolCorr_AllDetectors[dshort] = PolCorr_Data
-            Uncertainty_PolCorr_AllDetectors[dshort] = UncData_Per_Detector
-            Det_Index += 1
-
-            dimX = dimXX[dshort]
-            dimY = dimYY[dshort]
-            PolCorr_UU[dshort] = PolCorr_AllDetectors[dshort][0][:][:].reshape((dimX, dimY))
-            PolCorr_DU[dshort] = PolCorr_AllDetectors[dshort][1][:][:].reshape((dimX, dimY))
-            PolCorr_DD[dshort] = PolCorr_AllDetectors[dshort][2][:][:].reshape((dimX, dimY))
-            PolCorr_UD[dshort] = PolCorr_AllDetectors[dshort][3][:][:].reshape((dimX, dimY))
-
-            PolCorr_UU_Unc[dshort] = Uncertainty_PolCorr_AllDetectors[dshort][0][:][:].reshape((dimX, dimY))
-            PolCorr_DU_Unc[dshort] = Uncertainty_PolCorr_AllDetectors[dshort][1][:][:].reshape((dimX, dimY))
-            PolCorr_DD_Unc[dshort] = Uncertainty_PolCorr_AllDetectors[dshort][2][:][:].reshape((dimX, dimY))
-            PolCorr_UD_Unc[dshort] = Uncertainty_PolCorr_AllDetectors[dshort][3][:][:].reshape((dimX, dimY))
+            PSM_Unc = 0.0
+
+        Pixel_Type = VSANS_PixelType()
+        Prefactor = inv(vSANS_PolCorrMatrix(*vSANS_PolEfficiencyMatrices(Sample, Config, Scatt, PSM, BestPSM)))
+
+        Offsets = {}
+        Npix = 0
+        for dshort in stacked_detectors:
+            Index = VSANS_ActivePixels(QGridPerDetector, GeneralMask, dshort)['Index']
+            Offsets[dshort] = (Npix, Index, int(dimXX[dshort]), int(dimYY[dshort]))
+            Npix += len(Index)
+        Short_End = Offsets['B'][0] if 'B' in Offsets else Npix
+
+        Scaled_Data = np.empty((4, Npix), dtype=Pixel_Type)
+        UncScaled_Data = np.empty((4, Npix), dtype=Pixel_Type)
+        for dshort in stacked_detectors:
+            start, Index, dimX, dimY = Offsets[dshort]
+            end = start + len(Index)
+            for CrossSection_Index, (Data, Unc_Data) in enumerate(((UUScaledData, UUScaledData_Unc), (DUScaledData, DUScaledData_Unc), (DDScaledData, DDScaledData_Unc), (UDScaledData, UDScaledData_Unc))):
+                Scaled_Data[CrossSection_Index, start:end] = np.take(np.ravel(Data[dshort]), Index)
+                if dshort == 'B' and PolCorrUncertainty == 0:
+                    '''HighRes uncertainties have always been carried over from the data itself'''
+                    UncScaled_Data[CrossSection_Index, start:end] = Scaled_Data[CrossSection_Index, start:end]
+                else:
+                    UncScaled_Data[CrossSection_Index, start:end] = np.take(np.ravel(Unc_Data[dshort]), Index)
+
+        PolCorr_Data = np.empty((4, Npix), dtype=Pixel_Type)
+        np.dot(Prefactor.astype(Pixel_Type), Scaled_Data, out=PolCorr_Data)
+        PolCorr_Data[:, :Short_End] *= 2.0
+
+        if PolCorrUncertainty >= 1:
+            '''#Counting uncertainties through the (linear) correction: sigma^2 = (Prefactor o Prefactor) . sigma^2 for every pixel'''
+            np.square(UncScaled_Data, out=UncScaled_Data)
+            Variance = np.dot((Prefactor*Prefactor).astype(Pixel_Type), UncScaled_Data)
+            Variance[:, :Short_End] *= 4.0
+            if PolCorrUncertainty >= 2:
+                '''#d(M^-1)/dp = -M^-1 (dM/dp) M^-1 for PSM and the He3 fit parameters, each taken as independent'''
+                for Derivative, Unc in vSANS_PolCorrSystematics(Sample, Config, Scatt, PSM, PSM_Unc, BestPSM):
+                    Shift = np.dot((-Unc*np.dot(np.dot(Prefactor, Derivative), Prefactor)).astype(Pixel_Type), Scaled_Data)
+                    Shift[:, :Short_End] *= 2.0
+                    Variance += np.square(Shift)
+            np.sqrt(Variance, out=UncScaled_Data)
+
+        for dshort in stacked_detectors:
+            start, Index, dimX, dimY = Offsets[dshort]
+            end = start + len(Index)
+            Panels = np.zeros((8, dimX*dimY), dtype=Pixel_Type)
+            Panels[:4, Index] = PolCorr_Data[:, start:end]
+            Panels[4:, Index] = UncScaled_Data[:, start:end]
+            Panels = Panels.reshape((8, dimX, dimY))
+            PolCorr_UU[dshort] = Panels[0]
+            PolCorr_DU[dshort] = Panels[1]
+            PolCorr_DD[dshort] = Panels[2]
+            PolCorr_UD[dshort] = Panels[3]
+
+            PolCorr_UU_Unc[dshort] = Panels[4]
+            PolCorr_DU_Unc[dshort] = Panels[5]
+            PolCorr_DD_Unc[dshort] = Panels[6]
+            PolCorr_UD_Unc[dshort] = Panels[7]
 
     return Have_FullPol, PolCorr_UU, PolCorr_DU, PolCorr_DD, PolCorr_UD, PolCorr_UU_Unc, PolCorr_DU_Unc, PolCorr_DD_Unc, PolCorr_UD_Unc
 
@@ -1982,77 +2641,146 @@ def MinMaxQ(Q_total, Config):
     if str(Config).find('CvB') != -1:
         HR_Q_min = np.amin(Q_total['B'])
         Q_min_HR = np.maximum(HR_Q_min, Absolute_Q_min)
-        HR_bins = int(np.sqrt(np.power((HighResMaxX - HighResMinX + 1)/2, 2) + np.power((HighResMaxY - HighResMinY + 1)/2, 2)))
+        HR_bins = int(np.sqrt(np.power((HighResMaxX - HighResMinX + 1)/2, 2) + np.power((HighResMaxY - HighResMinY + 1)/2, 2))/HighResRebin)
 
         Q_min = Q_min_HR
         Q_bins = 4*(Q_bins + HR_bins)
     
     return Q_min, Q_max, Q_bins
 
-def TwoDimToOneDim(Key, Q_min, Q_max, Q_bins, QGridPerDetector, generalmask, sectormask, PolCorr_AllDetectors, Unc_PolCorr_AllDetectors, ID, Config, PlotYesNo, AverageQRanges):
+q_bin_index = OrderedDict()
+q_bin_index_entries = 64
+
+def VSANS_QBinIndex(Q_tot, Exp_bins):
+    #Q bin of every pixel for the given edges, -1 outside of the histogram range; uses the same [low, high) bins as np.histogram
+    #(the last bin includes its upper edge). The index is kept per Q map so all cuts and data sets on one geometry share it.
+
+    key = (id(Q_tot), Exp_bins[0], Exp_bins[-1], len(Exp_bins))
+    if key in q_bin_index and q_bin_index[key][0] is Q_tot:
+        q_bin_index.move_to_end(key)
+        return q_bin_index[key][1]
+
+    Q_flat = np.ravel(Q_tot)
+    Bin_Index = np.searchsorted(Exp_bins, Q_flat, side='right') - 1
+    Bin_Index[Q_flat == Exp_bins[-1]] = len(Exp_bins) - 2
+    Bin_Index[(Q_flat < Exp_bins[0]) | (Q_flat > Exp_bins[-1])] = -1
+    Bin_Index.setflags(write=False)
+
+    q_bin_index[key] = (Q_tot, Bin_Index)
+    while len(q_bin_index) > q_bin_index_entries:
+        q_bin_index.popitem(last=False)
+    return Bin_Index
+
+active_pixels = OrderedDict()
+active_pixel_entries = 64
+
+def VSANS_ActivePixels(QGridPerDetector, GeneralMask, dshort):
+    #Live pixels of one panel: 'Index' holds the flat positions where GeneralMask > 0 and the geometry columns ('QX', 'QY', 'QZ', 'Q_total',
+    #'Q_parl_unc', 'Q_perp_unc' and 'Q_Unc2', the squared total Q resolution) are gathered at those positions. Kept per (Q map, mask) like the
+    #sector masks, so each config and mask set is compressed once and the binning and 2D output only touch live pixels.
+
+    Q_tot = QGridPerDetector['Q_total'][dshort]
+    Mask = GeneralMask[dshort]
+    key = (id(Q_tot), id(Mask))
+    if key in active_pixels and active_pixels[key][0] is Q_tot and active_pixels[key][1] is Mask:
+        active_pixels.move_to_end(key)
+        return active_pixels[key][2]
+
+    Index = np.flatnonzero(np.ravel(Mask) > 0)
+    Active = {'Index' : Index}
+    for name in ('QX', 'QY', 'QZ', 'Q_total', 'Q_parl_unc', 'Q_perp_unc'):
+        Active[name] = np.take(np.ravel(QGridPerDetector[name][dshort]), Index)
+    Active['Q_Unc2'] = np.power(np.sqrt(np.power(Active['Q_perp_unc'],2) + np.power(Active['Q_parl_unc'],2)),2)
+    for Column in Active.values():
+        Column.setflags(write=False)
+
+    active_pixels[key] = (Q_tot, Mask, Active)
+    while len(active_pixels) > active_pixel_entries:
+        active_pixels.popitem(last=False)
+    return Active
+
+def TwoDimToOneDim_MultiCut(Q_min, Q_max, Q_bins, QGridPerDetector, generalmask, sectormasks, DataSets, Config):
+    #Bins several cuts (sectormasks = {slice_key : sector mask}) of several data sets (list of (Data, Unc_Data) per detector) in one pass.
+    #Each pixel's Q bin is found once per panel; the cut number and data set number are folded into the bin index so every summed quantity
+    #takes a single np.bincount per panel. Only the live pixels of generalmask (VSANS_ActivePixels) are looked at; the sums are float64
+    #whatever the type of the data.
+    #Returns {slice_key : [per data set {'F'/'M'/'B' : (UU, UU_Unc, MeanQ, MeanQUnc, Pixels)}]}.
 
-    masks = {}
     relevant_detectors = short_detectors
     if str(Config).find('CvB') != -1:
         relevant_detectors = all_detectors
-    for dshort in relevant_detectors:
-        masks[dshort] = generalmask[dshort]*sectormask[dshort]
 
-    Q_Values = np.linspace(Q_min, Q_max, Q_bins, endpoint=True)
     Q_step = (Q_max - Q_min) / Q_bins
-    
-    FrontUU = np.zeros_like(Q_Values)
-    FrontUU_Unc = np.zeros_like(Q_Values)
-    FrontMeanQ = np.zeros_like(Q_Values)
-    FrontMeanQUnc = np.zeros_like(Q_Values)
-    FrontPixels = np.zeros_like(Q_Values)
-    
-    MiddleUU = np.zeros_like(Q_Values)
-    MiddleUU_Unc = np.zeros_like(Q_Values)
-    MiddleMeanQ = np.zeros_like(Q_Values)
-    MiddleMeanQUnc = np.zeros_like(Q_Values)
-    MiddlePixels = np.zeros_like(Q_Values)
-
-    BackUU = np.zeros_like(Q_Values)
-    BackUU_Unc = np.zeros_like(Q_Values)
-    BackMeanQ = np.zeros_like(Q_Values)
-    BackMeanQUnc = np.zeros_like(Q_Values)
-    BackPixels = np.zeros_like(Q_Values)
-    
+    Exp_bins = np.linspace(Q_min, Q_max + Q_step, Q_bins + 1, endpoint=True)
+    slice_keys = list(sectormasks)
+    Cuts = len(slice_keys)
+    Sets = len(DataSets)
+    Length = Cuts*Q_bins
+
+    Sums = {}
+    for carriage_key in ('F', 'M', 'B'):
+        Sums[carriage_key] = np.zeros((5, Sets, Cuts, Q_bins))
+
     for dshort in relevant_detectors:
-        Q_tot = QGridPerDetector['Q_total'][dshort][:][:]
-        Q_unc = np.sqrt(np.power(QGridPerDetector['Q_perp_unc'][dshort][:][:],2) + np.power(QGridPerDetector['Q_parl_unc'][dshort][:][:],2))
-        UU = PolCorr_AllDetectors[dshort][:][:]
-        UU_Unc = Unc_PolCorr_AllDetectors[dshort][:][:]
+        Active = VSANS_ActivePixels(QGridPerDetector, generalmask, dshort)
+        Live_Bins = np.take(VSANS_QBinIndex(QGridPerDetector['Q_total'][dshort], Exp_bins), Active['Index'])
+        In_Range = Live_Bins >= 0
+
+        Selected = []
+        Combined = []
+        for cut_number, slice_key in enumerate(slice_keys):
+            selected = np.flatnonzero((np.take(np.ravel(sectormasks[slice_key][dshort]), Active['Index']) > 0) & In_Range)
+            Selected.append(selected)
+            Combined.append(Live_Bins[selected] + cut_number*Q_bins)
+        Selected = np.concatenate(Selected)
+        Combined = np.concatenate(Combined)
+        Positions = Active['Index'][Selected]
+
+        MeanQSum = np.bincount(Combined, weights=Active['Q_total'][Selected], minlength=Length).reshape(Cuts, Q_bins)
+        MeanQUnc = np.bincount(Combined, weights=Active['Q_Unc2'][Selected], minlength=Length).reshape(Cuts, Q_bins)
+        pixels = np.bincount(Combined, minlength=Length).reshape(Cuts, Q_bins)
+
+        Cube = np.empty((Sets, len(Positions)))
+        UncCube = np.empty((Sets, len(Positions)))
+        for set_number, (Data, Unc_Data) in enumerate(DataSets):
+            Cube[set_number] = np.take(np.ravel(Data[dshort]), Positions)
+            UncCube[set_number] = np.take(np.ravel(Unc_Data[dshort]), Positions)
+        np.square(UncCube, out=UncCube)
+        Stacked = (np.arange(Sets)[:, None]*Length + Combined[None, :]).ravel()
+        countsUU = np.bincount(Stacked, weights=Cube.ravel(), minlength=Sets*Length).reshape(Sets, Cuts, Q_bins)
+        UncUU = np.bincount(Stacked, weights=UncCube.ravel(), minlength=Sets*Length).reshape(Sets, Cuts, Q_bins)
 
-        Exp_bins = np.linspace(Q_min, Q_max + Q_step, Q_bins + 1, endpoint=True)
-        countsUU, _ = np.histogram(Q_tot[masks[dshort] > 0], bins=Exp_bins, weights=UU[masks[dshort] > 0])
-        
-        UncUU, _ = np.histogram(Q_tot[masks[dshort] > 0], bins=Exp_bins, weights=np.power(UU_Unc[masks[dshort] > 0],2))
-        
-        MeanQSum, _ = np.histogram(Q_tot[masks[dshort] > 0], bins=Exp_bins, weights=Q_tot[masks[dshort] > 0])
-        MeanQUnc, _ = np.histogram(Q_tot[masks[dshort] > 0], bins=Exp_bins, weights=np.power(Q_unc[masks[dshort] > 0],2)) 
-        pixels, _ = np.histogram(Q_tot[masks[dshort] > 0], bins=Exp_bins, weights=np.ones_like(UU)[masks[dshort] > 0])
-        
         carriage_key = dshort[0]
-        if carriage_key == 'F':
-            FrontUU += countsUU
-            FrontUU_Unc += UncUU
-            FrontMeanQ += MeanQSum
-            FrontMeanQUnc += MeanQUnc
-            FrontPixels += pixels
-        elif carriage_key == 'M':
-            MiddleUU += countsUU
-            MiddleUU_Unc += UncUU
-            MiddleMeanQ += MeanQSum
-            MiddleMeanQUnc += MeanQUnc
-            MiddlePixels += pixels
-        else:
-            BackUU += countsUU
-            BackUU_Unc += UncUU
-            BackMeanQ += MeanQSum
-            BackMeanQUnc += MeanQUnc
-            BackPixels += pixels
+        if carriage_key not in ('F', 'M'):
+            carriage_key = 'B'
+        Sums[carriage_key][0] += countsUU
+        Sums[carriage_key][1] += UncUU
+        Sums[carriage_key][2] += MeanQSum
+        Sums[carriage_key][3] += MeanQUnc
+        Sums[carriage_key][4] += pixels
+
+    Output = {}
+    for cut_number, slice_key in enumerate(slice_keys):
+        Output[slice_key] = []
+        for set_number in range(Sets):
+            Carriages = {}
+            for carriage_key in ('F', 'M', 'B'):
+                Carriages[carriage_key] = tuple(Sums[carriage_key][:, set_number, cut_number])
+            Output[slice_key].append(Carriages)
+    return Output
+
+def TwoDimToOneDim(Key, Q_min, Q_max, Q_bins, QGridPerDetector, generalmask, sectormask, PolCorr_AllDetectors, Unc_PolCorr_AllDetectors, ID, Config, PlotYesNo, AverageQRanges):
+
+    Sums = TwoDimToOneDim_MultiCut(Q_min, Q_max, Q_bins, QGridPerDetector, generalmask, {Key : sectormask}, [(PolCorr_AllDetectors, Unc_PolCorr_AllDetectors)], Config)
+    return OneDimFromCarriageSums(Key, Q_min, Q_max, Q_bins, Sums[Key][0], ID, Config, PlotYesNo, AverageQRanges)
+
+def OneDimFromCarriageSums(Key, Q_min, Q_max, Q_bins, Sums, ID, Config, PlotYesNo, AverageQRanges):
+    #Uses the per carriage sums of TwoDimToOneDim_MultiCut
+
+    Q_Values = np.linspace(Q_min, Q_max, Q_bins, endpoint=True)
+    FrontUU, FrontUU_Unc, FrontMeanQ, FrontMeanQUnc, FrontPixels = Sums['F']
+    MiddleUU, MiddleUU_Unc, MiddleMeanQ, MiddleMeanQUnc, MiddlePixels = Sums['M']
+    BackUU, BackUU_Unc, BackMeanQ, BackMeanQUnc, BackPixels = Sums['B']
 
     CombinedPixels = FrontPixels + MiddlePixels + BackPixels
     nonzero_front_mask = (FrontPixels > 0) #True False map
@@ -2081,27 +2809,18 @@ def TwoDimToOneDim(Key, Q_min, Q_max, Q_bins, QGridPerDetector, generalmask, sec
 
     ErrorBarsYesNo = 0
     if PlotYesNo == 1:
-        fig = plt.figure()
+        Figure = VSANS_Figure('{keyword}_{idnum},CF{cf}.png'.format(keyword=Key, idnum=ID, cf = Config), '{keyword}_{idnum},{cf}'.format(keyword=Key, idnum=ID, cf = Config), 'Q', 'Intensity')
         if ErrorBarsYesNo == 1:
-            ax = plt.axes()
-            ax.set_xscale("log")
-            ax.set_yscale("log")
-            ax.errorbar(Q_Front, UUF, yerr=Sigma_UUF, fmt = 'b*', label='Front')
-            ax.errorbar(Q_Middle, UUM, yerr=Sigma_UUM, fmt = 'g*', label='Middle')
+            VSANS_FigureSeries(Figure, Q_Front, UUF, 'b*', 'Front', Sigma_UUF)
+            VSANS_FigureSeries(Figure, Q_Middle, UUM, 'g*', 'Middle', Sigma_UUM)
             if str(Config).find('CvB') != -1:
-                ax.errorbar(Q_Back, UUB, yerr=Sigma_UUB, fmt = 'r*', label='HighRes')
+                VSANS_FigureSeries(Figure, Q_Back, UUB, 'r*', 'HighRes', Sigma_UUB)
         else:
-            plt.loglog(Q_Front, UUF, 'b*', label='Front')
-            plt.loglog(Q_Middle, UUM, 'g*', label='Middle')
+            VSANS_FigureSeries(Figure, Q_Front, UUF, 'b*', 'Front')
+            VSANS_FigureSeries(Figure, Q_Middle, UUM, 'g*', 'Middle')
             if str(Config).find('CvB') != -1:
-                plt.loglog(Q_Back, UUB, 'r*', label='High Res')
-                
-        plt.xlabel('Q')
-        plt.ylabel('Intensity')
-        plt.title('{keyword}_{idnum},{cf}'.format(keyword=Key, idnum=ID, cf = Config))
-        plt.legend()
-        fig.savefig('{keyword}_{idnum},CF{cf}.png'.format(keyword=Key, idnum=ID, cf = Config))
-        plt.show()
+                VSANS_FigureSeries(Figure, Q_Back, UUB, 'r*', 'High Res')
+        VSANS_QueueFigure(Figure)
 
     if AverageQRanges == 0:
         '''Remove points overlapping in Q space before joining'''
@@ -2167,13 +2886,153 @@ def Raw_Data(filenumber):
     f = get_by_filenumber(filenumber)
     if f is not None:
         for dshort in short_detectors:
-            data = np.array(f['entry/instrument/detector_{ds}/data'.format(ds=dshort)])
+            data = get_panel_data(filenumber, dshort)
             RawData_AllDetectors[dshort] = data
             Unc_RawData_AllDetectors[dshort] = np.sqrt(data)
                     
     return RawData_AllDetectors, Unc_RawData_AllDetectors
 
+ASCII_ChunkRows = 65536
+ASCII_Header = 'ASCII data created Mon, Jan 13, 2020 2:39:54 PM'
+
+def VSANS_WriteASCIIRows(OutFiles, Columns, Positions, Buffer):
+    #Writes the rows Columns[k][Positions] to every open file in OutFiles, ASCII_ChunkRows rows at a time through Buffer (ASCII_ChunkRows x columns);
+    #rows are formatted exactly as np.savetxt does with its default '%.18e' and ' ' delimiter. Positions = None writes every row in order.
+
+    Row_Format = ' '.join(['%.18e']*len(Columns)) + '\n'
+    Flat_Columns = [np.ravel(Column) for Column in Columns]
+    if Positions is None:
+        Positions = np.arange(len(Flat_Columns[0]))
+    for start in range(0, len(Positions), ASCII_ChunkRows):
+        Chunk = Positions[start:start + ASCII_ChunkRows]
+        Rows = len(Chunk)
+        for column_number, Column in enumerate(Flat_Columns):
+            np.take(Column, Chunk, out=Buffer[:Rows, column_number])
+        Text = (Row_Format*Rows) % tuple(Buffer[:Rows].ravel().tolist())
+        for OutFile in OutFiles:
+            OutFile.write(Text)
+    return
+
+HDF5Output_Run = datetime.datetime.now().isoformat()
+
+def VSANS_HDF5OutputFile(Sample, Config):
+    #Uses the globals HDF5Output_Run and IncrementalCache_Parameters
+    #Opens save_path/Reduced_{Sample},{Config}.h5 for writing. The first time it is opened in a run (or live pass) its header is rewritten;
+    #the data groups are only replaced one by one as they are written again, so the 2D data of a sample reused by the incremental
+    #reduction is kept. A file written with other IncrementalCache_Parameters is emptied, since nothing in it can be reused.
+
+    Out = h5py.File(save_path + 'Reduced_{samp},{cf}.h5'.format(samp=Sample, cf=Config), 'a')
+    if Out.attrs.get('run_stamp', '') != HDF5Output_Run:
+        Current = {name : str(globals()[name]) for name in IncrementalCache_Parameters if name in globals()}
+        Recorded = {}
+        if 'sasentry01/sasprocess01/settings' in Out:
+            Recorded = {name : value for name, value in Out['sasentry01/sasprocess01/settings'].attrs.items() if name != 'NX_class'}
+        if Recorded != Current:
+            for name in list(Out.keys()):
+                del Out[name]
+        Out.attrs['NX_class'] = 'NXroot'
+        Out.attrs['default'] = 'sasentry01'
+        Out.attrs['run_stamp'] = HDF5Output_Run
+        Entry = Out.require_group('sasentry01')
+        Entry.attrs['NX_class'] = 'NXentry'
+        Entry.attrs['canSAS_class'] = 'SASentry'
+        Entry.attrs['version'] = '1.1'
+        for name in ['definition', 'title', 'run', 'sasprocess01']:
+            if name in Entry:
+                del Entry[name]
+        Entry.create_dataset('definition', data='NXcanSAS')
+        Entry.create_dataset('title', data='{samp}, {cf}'.format(samp=Sample, cf=Config))
+        Entry.create_dataset('run', data=str(Config))
+        Process = Entry.create_group('sasprocess01')
+        Process.attrs['NX_class'] = 'NXprocess'
+        Process.attrs['canSAS_class'] = 'SASprocess'
+        Process.create_dataset('name', data='VSANS_ReductionHighRes')
+        Process.create_dataset('date', data=HDF5Output_Run)
+        Settings = Process.create_group('settings')
+        Settings.attrs['NX_class'] = 'NXnote'
+        for name in Current:
+            Settings.attrs[name] = Current[name]
+    return Out
+
+def VSANS_HDF5DataGroup(Entry, Name):
+    #Fresh NXdata (SASdata) group Name in Entry
+
+    if Name in Entry:
+        del Entry[Name]
+    Group = Entry.create_group(Name)
+    Group.attrs['NX_class'] = 'NXdata'
+    Group.attrs['canSAS_class'] = 'SASdata'
+    return Group
+
+def VSANS_HDF5Columns(Sample, Config, FileName, text_output, header):
+    #Uses VSANS_HDF5OutputFile and VSANS_HDF5DataGroup
+    #Stores the columns of one text product as compressed datasets named after its header; the group is named after the text file.
+    #Q is the axis (with Q_Unc as its resolution), the first intensity column is the signal and each DelX is recorded as the uncertainty of X.
+
+    Columns = np.atleast_2d(np.array(text_output, dtype=float))
+    Names = [name.strip() for name in header.split(',')] if header.find(',') != -1 else header.split()
+    if len(Names) != len(Columns):
+        Names = ['Column{num}'.format(num=number) for number in range(len(Columns))]
+    Unique_Names = []
+    for name in Names:
+        unique = name
+        counter = 1
+        while unique in Unique_Names:
+            unique = '{name}_{num}'.format(name=name, num=counter)
+            counter += 1
+        Unique_Names.append(unique)
+
+    with VSANS_HDF5OutputFile(Sample, Config) as Out:
+        Group = VSANS_HDF5DataGroup(Out['sasentry01'], os.path.splitext(FileName)[0])
+        for name, Column in zip(Unique_Names, Columns):
+            Group.create_dataset(name, data=Column, chunks=True, compression='gzip', shuffle=True)
+        for name in Unique_Names:
+            if 'Del' + name in Group:
+                Group[name].attrs['uncertainties'] = 'Del' + name
+        if 'Q' in Group:
+            Group['Q'].attrs['units'] = '1/angstrom'
+            Group.attrs['Q_indices'] = 0
+            if 'Q_Unc' in Group:
+                Group['Q'].attrs['resolutions'] = 'Q_Unc'
+                Group['Q_Unc'].attrs['units'] = '1/angstrom'
+            Signals = [name for name in Unique_Names if name not in ('Q', 'Q_Unc', 'Q_mean', 'Shadow') and not name.startswith('Del')]
+            if len(Signals) > 0:
+                Group.attrs['signal'] = Signals[0]
+                Group.attrs['I_axes'] = 'Q'
+    return
+
+saved_columns = None
+
+def VSANS_SaveColumns(FileName, text_output, header, Sample, Config):
+    #Uses VSANS_HDF5Columns
+    #Writes a 1D product (one row per column in text_output) as save_path/FileName text (YesNo_TextOutput) and/or into the HDF5 file (YesNo_HDF5Output);
+    #while saved_columns is a dict (check_precision) the unrounded columns are also kept there as {FileName : (header, columns)}
+
+    if saved_columns is not None:
+        saved_columns[FileName] = (header, np.array(text_output, dtype=np.float64))
+    if YesNo_TextOutput > 0:
+        np.savetxt(save_path + FileName, np.array(text_output).T, delimiter = ' ', comments = '', header = header, fmt='%1.4e')
+    if YesNo_HDF5Output > 0:
+        VSANS_HDF5Columns(Sample, Config, FileName, text_output, header)
+    return
+
+def VSANS_HDF5AppendRows(Group, Names, Columns, Positions):
+    #Appends Columns[k][Positions] (every row if Positions is None) to the resizable datasets Group[Names[k]], ASCII_ChunkRows rows at a time
+
+    Flat_Columns = [np.ravel(Column) for Column in Columns]
+    if Positions is None:
+        Positions = np.arange(len(Flat_Columns[0]))
+    for start in range(0, len(Positions), ASCII_ChunkRows):
+        Chunk = Positions[start:start + ASCII_ChunkRows]
+        for name, Column in zip(Names, Flat_Columns):
+            Dataset = Group[name]
+            Dataset.resize((Dataset.shape[0] + len(Chunk),))
+            Dataset[-len(Chunk):] = Column[Chunk]
+    return
+
 def ASCIIlike_Output(Type, ID, Config, Data_AllDetectors, Unc_Data_AllDetectors, QGridPerDetector, GeneralMask):
+    #Uses VSANS_WriteASCIIRows, VSANS_HDF5OutputFile and VSANS_HDF5AppendRows; the combined file (and the per detector files) are streamed panel by panel
+    #so memory use does not grow with the pixel count. Only the live pixels of GeneralMask are gathered (VSANS_ActivePixels).
 
     relevant_detectors = short_detectors
     if str(Config).find('CvB') != -1:
@@ -2181,83 +3040,48 @@ def ASCIIlike_Output(Type, ID, Config, Data_AllDetectors, Unc_Data_AllDetectors,
 
     if 'NA' not in Data_AllDetectors and 'NA' not in Unc_Data_AllDetectors:
 
+        print('Outputting {TP} 2D data, {idnum}, {CF} '.format(TP=Type, idnum=ID, CF=Config))
+        Buffer = np.empty((ASCII_ChunkRows, 8))
+        Combined_Files = []
+        if YesNo_TextOutput > 0:
+            Combined_Files.append(open(save_path + 'Dim2Scatt_{Samp}_{CF}_{TP}.DAT'.format(Samp=ID, CF=Config, TP=Type,), 'w'))
+            Combined_Files[0].write(ASCII_Header + '\n')
+        Names = ['Qx', 'Qy', 'I', 'Idev', 'Qz', 'dQl', 'dQw', 'Shadow']
+        Out = None
+        if YesNo_HDF5Output > 0:
+            Out = VSANS_HDF5OutputFile(ID, Config)
+            Group = VSANS_HDF5DataGroup(Out['sasentry01'], 'Dim2Scatt_{TP}'.format(TP=Type))
+            for name in Names:
+                Group.create_dataset(name, shape=(0,), maxshape=(None,), dtype='f8', chunks=(ASCII_ChunkRows,), compression='gzip', shuffle=True)
+            Group.attrs['signal'] = 'I'
+            Group.attrs['I_axes'] = 'Q'
+            Group['I'].attrs['uncertainties'] = 'Idev'
+            Group['Qx'].attrs['resolutions'] = 'dQl'
+            Group['Qy'].attrs['resolutions'] = 'dQw'
+
         for dshort in relevant_detectors:
 
-            Mask = np.array(GeneralMask[dshort])
-            mini_mask = Mask > 0
-
-            Q_tot = QGridPerDetector['Q_total'][dshort][:][:]
-            Q_unc = np.sqrt(np.power(QGridPerDetector['Q_perp_unc'][dshort][:][:],2) + np.power(QGridPerDetector['Q_parl_unc'][dshort][:][:],2))
-
-            QQX = QGridPerDetector['QX'][dshort][:][:]
-            QQX = QQX[mini_mask,...]
-            QQX = QQX.T
-            QXData = QQX.flatten()
-            QQY = QGridPerDetector['QY'][dshort][:][:]
-            QQY = QQY[mini_mask,...]
-            QQY = QQY.T
-            QYData = QQY.flatten()
-            QQZ = QGridPerDetector['QZ'][dshort][:][:]
-            QQZ = QQZ[mini_mask,...]
-            QQZ = QQZ.T
-            QZData = QQZ.flatten()
-            QPP = QGridPerDetector['Q_perp_unc'][dshort][:][:]
-            QPP = QPP[mini_mask,...]
-            QPP = QPP.T
-            QPerpUnc = QPP.flatten()
-            QPR = QGridPerDetector['Q_parl_unc'][dshort][:][:]
-            QPR = QPR[mini_mask,...]
-            QPR = QPR.T
-            QParlUnc = QPR.flatten()
-            Shadow = np.ones_like(Q_tot)
-            Shadow = Shadow[mini_mask,...]
-            Shadow = Shadow.T
-            ShadowHolder = Shadow.flatten()
-
-            Intensity = Data_AllDetectors[dshort]
-            Intensity = Intensity[mini_mask,...]
-            Intensity = Intensity.T
-            Int = Intensity.flatten()
-            Intensity = Intensity.flatten()
-            IntensityUnc = Unc_Data_AllDetectors[dshort]
-            IntensityUnc = IntensityUnc[mini_mask,...]
-            IntensityUnc = IntensityUnc.T
-            DeltaInt = IntensityUnc.flatten()
-            IntensityUnc = IntensityUnc.flatten()
-            if YesNo_2DFilesPerDetector > 0:
+            Active = VSANS_ActivePixels(QGridPerDetector, GeneralMask, dshort)
+            Positions = Active['Index']
+            Columns = [Active['QX'], Active['QY'], np.take(np.ravel(Data_AllDetectors[dshort]), Positions), np.take(np.ravel(Unc_Data_AllDetectors[dshort]), Positions),
+                       Active['QZ'], Active['Q_parl_unc'], Active['Q_perp_unc'], np.ones(len(Positions))]
+
+            OutFiles = list(Combined_Files)
+            if YesNo_2DFilesPerDetector > 0 and YesNo_TextOutput > 0:
                 print('Outputting Unpol data into ASCII-like format for {det}, GroupID = {idnum} '.format(det=dshort, idnum=ID))
-                ASCII_like = np.array([QXData, QYData, Int, DeltaInt, QZData, QParlUnc, QPerpUnc, ShadowHolder])
-                ASCII_like = ASCII_like.T
-                np.savetxt('{TP}Scatt_{Samp}_{CF}_{det}.DAT'.format(TP=Type, Samp=ID, CF=Config, det=dshort), ASCII_like, delimiter = ' ', comments = '', header = 'ASCII data created Mon, Jan 13, 2020 2:39:54 PM')
-           
-
-            if dshort == relevant_detectors[0]:
-                Int_Combined = Intensity
-                DeltaInt_Combined = IntensityUnc
-                QXData_Combined = QXData
-                QYData_Combined = QYData
-                QZData_Combined = QZData
-                QPP_Combined = QPP
-                QPerpUnc_Combined = QPerpUnc
-                QPR_Combined = QPR
-                QParlUnc_Combined = QParlUnc
-                Shadow_Combined = ShadowHolder
-            else:
-                Int_Combined = np.concatenate((Int_Combined, Intensity), axis=0)
-                DeltaInt_Combined = np.concatenate((DeltaInt_Combined, IntensityUnc), axis=0)
-                QXData_Combined = np.concatenate((QXData_Combined, QXData), axis=0)
-                QYData_Combined = np.concatenate((QYData_Combined, QYData), axis=0)
-                QZData_Combined = np.concatenate((QZData_Combined, QZData), axis=0)
-                QPP_Combined = np.concatenate((QPP_Combined, QPP), axis=0)
-                QPerpUnc_Combined = np.concatenate((QPerpUnc_Combined, QPerpUnc), axis=0)
-                QPR_Combined = np.concatenate((QPR_Combined, QPR), axis=0)
-                QParlUnc_Combined = np.concatenate((QParlUnc_Combined, QParlUnc), axis=0)
-                Shadow_Combined = np.concatenate((Shadow_Combined, ShadowHolder), axis=0)
-
-        print('Outputting {TP} 2D data, {idnum}, {CF} '.format(TP=Type, idnum=ID, CF=Config))        
-        ASCII_Combined = np.array([QXData_Combined, QYData_Combined, Int_Combined, DeltaInt_Combined, QZData_Combined, QParlUnc_Combined, QPerpUnc_Combined, Shadow_Combined])
-        ASCII_Combined = ASCII_Combined.T
-        np.savetxt(save_path + 'Dim2Scatt_{Samp}_{CF}_{TP}.DAT'.format(Samp=ID, CF=Config, TP=Type,), ASCII_Combined, delimiter = ' ', comments = '', header = 'ASCII data created Mon, Jan 13, 2020 2:39:54 PM')
+                OutFiles.append(open('{TP}Scatt_{Samp}_{CF}_{det}.DAT'.format(TP=Type, Samp=ID, CF=Config, det=dshort), 'w'))
+                OutFiles[-1].write(ASCII_Header + '\n')
+            if len(OutFiles) > 0:
+                VSANS_WriteASCIIRows(OutFiles, Columns, None, Buffer)
+            for OutFile in OutFiles[len(Combined_Files):]:
+                OutFile.close()
+            if Out is not None:
+                VSANS_HDF5AppendRows(Group, Names, Columns, None)
+
+        for OutFile in Combined_Files:
+            OutFile.close()
+        if Out is not None:
+            Out.close()
 
     return
 
@@ -2271,8 +3095,7 @@ def SaveTextData(Type, Slice, Sample, Config, DataMatrix):
     Shadow = np.ones_like(Q)
     text_output = np.array([Q, Int, IntUnc, Q_Unc, Q_mean, Shadow])
     #text_output = np.array([Q, Int, IntUnc, Q_mean, Q_Unc, Shadow])
-    text_output = text_output.T
-    np.savetxt(save_path + 'SixCol_{samp},{cf}_{key}{cut}.txt'.format(samp=Sample, cf = Config, key = Type, cut = Slice), text_output, delimiter = ' ', comments = '', header= 'Q, I, DelI, Q_Unc, Q_mean, Shadow', fmt='%1.4e')
+    VSANS_SaveColumns('SixCol_{samp},{cf}_{key}{cut}.txt'.format(samp=Sample, cf = Config, key = Type, cut = Slice), text_output, 'Q, I, DelI, Q_Unc, Q_mean, Shadow', Sample, Config)
   
     return
 
@@ -2286,8 +3109,7 @@ def SaveTextDataUnpol(Sub, Slice, Sample, Config, DataMatrix):
     Shadow = DataMatrix['Shadow']
     text_output = np.array([Q, Int, IntUnc, Q_Unc, Q_mean, Shadow])
     #text_output = np.array([Q, Int, IntUnc, Q_mean, Q_Unc, Shadow])
-    text_output = text_output.T
-    np.savetxt(save_path + 'SliceUnpol_{samp},{cf}_{cut}{key}.txt'.format(samp=Sample, cf = Config, cut = Slice, key = Sub), text_output, delimiter = ' ', comments = '', header= 'Q, I, DelI, Q_Unc, Q_mean, Shadow', fmt='%1.4e')
+    VSANS_SaveColumns('SliceUnpol_{samp},{cf}_{cut}{key}.txt'.format(samp=Sample, cf = Config, cut = Slice, key = Sub), text_output, 'Q, I, DelI, Q_Unc, Q_mean, Shadow', Sample, Config)
   
     return
 
@@ -2307,9 +3129,7 @@ def SaveTextDataFourCrossSections(Type, Slice, Sample, Config, UUMatrix, DUMatri
     Q_Unc = UUMatrix['Q_Uncertainty']
     Shadow = np.ones_like(Q)
     text_output = np.array([Q, UU, UU_Unc, DU, DU_Unc, DD, DD_Unc, UD, UD_Unc, Q_Unc, Q_mean, Shadow])
-    text_output = text_output.T
-    np.savetxt(save_path + 'SliceFullPol_{samp},{cf}_{key}{cut}.txt'.format(samp=Sample, cf = Config, key = Type, cut = Slice), text_output,
-               delimiter = ' ', comments = '', header= 'Q, UU, DelUU, DU, DelDU, DD, DelDD, UD, DelUD, Q_Unc, Q_mean, Shadow', fmt='%1.4e')
+    VSANS_SaveColumns('SliceFullPol_{samp},{cf}_{key}{cut}.txt'.format(samp=Sample, cf = Config, key = Type, cut = Slice), text_output, 'Q, UU, DelUU, DU, DelDU, DD, DelDD, UD, DelUD, Q_Unc, Q_mean, Shadow', Sample, Config)
   
     return
 
@@ -2328,59 +3148,123 @@ def SaveTextDataFourCombinedCrossSections(Type, Slice, Sub, Sample, Config, Matr
     Q_Unc = Matrix['Q_Unc']
     Shadow = Matrix['Shadow']
     text_output = np.array([Q, UU, UU_Unc, DU, DU_Unc, DD, DD_Unc, UD, UD_Unc, Q_Unc, Q_mean, Shadow])
-    text_output = text_output.T
-    np.savetxt(save_path + 'SliceFullPol_{samp},{cf}_{key}{cut}{sub}.txt'.format(samp=Sample, cf = Config, key = Type, cut = Slice, sub = Sub), text_output,
-               delimiter = ' ', comments = '', header= 'Q, UU, DelUU, DU, DelDU, DD, DelDD, UD, DelUD, Q_Unc, Q_mean, Shadow', fmt='%1.4e')
+    VSANS_SaveColumns('SliceFullPol_{samp},{cf}_{key}{cut}{sub}.txt'.format(samp=Sample, cf = Config, key = Type, cut = Slice, sub = Sub), text_output, 'Q, UU, DelUU, DU, DelDU, DD, DelDD, UD, DelUD, Q_Unc, Q_mean, Shadow', Sample, Config)
   
     return
 
-def PlotFourCrossSections(Type, Slice, Sample, Config, UU, DU, DD, UD):
+figure_queue = []
+
+def VSANS_Figure(FileName, Title, XLabel, YLabel, XScale = 'log', YScale = 'log', UserRanges = 0):
+    #Description of one plot (a plain dict that pickles cheaply); add data with VSANS_FigureSeries and pass it to VSANS_QueueFigure.
+    #UserRanges = 1 applies the YesNoSetPlotXRange/YesNoSetPlotYRange axis limits.
+    Figure = {'FileName' : FileName, 'Title' : Title, 'XLabel' : XLabel, 'YLabel' : YLabel, 'XScale' : XScale, 'YScale' : YScale,
+              'XLim' : None, 'YLim' : None, 'Series' : []}
+    if UserRanges > 0 and YesNoSetPlotXRange > 0:
+        Figure['XLim'] = (PlotXmin, PlotXmax)
+    if UserRanges > 0 and YesNoSetPlotYRange > 0:
+        Figure['YLim'] = (PlotYmin, PlotYmax)
+    return Figure
+
+def VSANS_FigureSeries(Figure, X, Y, Fmt, Label, YErr = None):
+    #Adds one data set, drawn with error bars if YErr is given
+    if YErr is not None:
+        YErr = np.array(YErr)
+    Figure['Series'].append((np.array(X), np.array(Y), YErr, Fmt, Label))
+    return
 
-    fig = plt.figure()
-    ax = plt.axes()
-    ax.set_xscale("log")
-    ax.set_yscale("log")
-    if YesNoSetPlotYRange > 0:
-        ax.set_ylim(bottom = PlotYmin, top = PlotYmax)
-    if YesNoSetPlotXRange > 0:
-        ax.set_xlim(left = PlotXmin, right = PlotXmax)
-    ax.errorbar(UU['Q'], UU['I'], yerr=UU['I_Unc'], fmt = 'b*', label='UU')
-    ax.errorbar(DU['Q'], DU['I'], yerr=DU['I_Unc'], fmt = 'g*', label='DU')
-    ax.errorbar(DD['Q'], DD['I'], yerr=DD['I_Unc'], fmt = 'r*', label='DD')
-    ax.errorbar(UD['Q'], UD['I'], yerr=UD['I_Unc'], fmt = 'm*', label='UD')
-    plt.xlabel('Q (inverse angstroms)')
-    plt.ylabel('Intensity')
-    plt.title('{slice_type}_{idnum},{cf}'.format(slice_type = Slice, idnum=Sample, cf = Config))
-    plt.legend()
-    fig.savefig(save_path + 'SliceFullPol_{samp},{cf}_{corr}{slice_type}.png'.format(samp=Sample, cf = Config, corr = Type, slice_type = Slice))
-    if YesNoShowPlots > 0:
+def VSANS_DrawFigure(Figure, fig):
+    ax = fig.add_subplot(1, 1, 1)
+    ax.set_xscale(Figure['XScale'])
+    ax.set_yscale(Figure['YScale'])
+    if Figure['YLim'] is not None:
+        ax.set_ylim(bottom = Figure['YLim'][0], top = Figure['YLim'][1])
+    if Figure['XLim'] is not None:
+        ax.set_xlim(left = Figure['XLim'][0], right = Figure['XLim'][1])
+    for X, Y, YErr, Fmt, Label in Figure['Series']:
+        if YErr is None:
+            ax.plot(X, Y, Fmt, label=Label)
+        else:
+            ax.errorbar(X, Y, yerr=YErr, fmt = Fmt, label=Label)
+    ax.set_xlabel(Figure['XLabel'])
+    ax.set_ylabel(Figure['YLabel'])
+    ax.set_title(Figure['Title'])
+    ax.legend()
+    fig.savefig(Figure['FileName'])
+    return
+
+def VSANS_RenderFigure(Figure):
+    #Draws and saves one queued figure with the Agg canvas directly (no pyplot, so never a window or a pause); runs in the plot workers
+    from matplotlib.figure import Figure as MatplotlibFigure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = MatplotlibFigure()
+    FigureCanvasAgg(fig)
+    VSANS_DrawFigure(Figure, fig)
+    return Figure['FileName']
+
+def VSANS_QueueFigure(Figure):
+    #Figures are only drawn straight away (and shown for 2 seconds) when YesNoShowPlots = 1 without Headless;
+    #otherwise they wait in figure_queue for VSANS_RenderQueuedFigures. SavePlots = 0 drops them.
+    if SavePlots <= 0:
+        return
+    if YesNoShowPlots > 0 and Headless <= 0:
+        import matplotlib.pyplot as plt
+        fig = plt.figure()
+        VSANS_DrawFigure(Figure, fig)
         plt.pause(2)
-    plt.close()
+        plt.close(fig)
+    else:
+        figure_queue.append(Figure)
+    return
+
+def VSANS_RenderQueuedFigures(Workers = None):
+    #Draws everything in figure_queue, spread over Workers (default PlotWorkers) processes (0 = one per CPU core, 1 = in this process);
+    #off Linux (where forking is not safe or not available) they are always drawn in this process
+    if len(figure_queue) == 0:
+        return
+    if Workers is None:
+        Workers = int(PlotWorkers)
+    if Workers == 0:
+        Workers = os.cpu_count()
+    Workers = min(Workers, len(figure_queue))
+    if Workers > 1 and not sys.platform.startswith('linux'):
+        #spawning workers (importing numpy, h5py and matplotlib in each) costs more than drawing the plots here
+        Workers = 1
+    try:
+        if Workers > 1:
+            import matplotlib.figure, matplotlib.backends.backend_agg #loaded once here rather than in every forked worker
+            with ProcessPoolExecutor(max_workers=Workers, mp_context=multiprocessing.get_context('fork')) as executor:
+                for FileName in executor.map(VSANS_RenderFigure, figure_queue):
+                    pass
+        else:
+            for Figure in figure_queue:
+                VSANS_RenderFigure(Figure)
+        print('Saved', len(figure_queue), 'plots')
+    finally:
+        #a figure that fails to draw is not retried by the next call
+        del figure_queue[:]
+    return
+
+def PlotFourCrossSections(Type, Slice, Sample, Config, UU, DU, DD, UD):
+
+    Figure = VSANS_Figure(save_path + 'SliceFullPol_{samp},{cf}_{corr}{slice_type}.png'.format(samp=Sample, cf = Config, corr = Type, slice_type = Slice),
+                          '{slice_type}_{idnum},{cf}'.format(slice_type = Slice, idnum=Sample, cf = Config), 'Q (inverse angstroms)', 'Intensity', UserRanges = 1)
+    VSANS_FigureSeries(Figure, UU['Q'], UU['I'], 'b*', 'UU', UU['I_Unc'])
+    VSANS_FigureSeries(Figure, DU['Q'], DU['I'], 'g*', 'DU', DU['I_Unc'])
+    VSANS_FigureSeries(Figure, DD['Q'], DD['I'], 'r*', 'DD', DD['I_Unc'])
+    VSANS_FigureSeries(Figure, UD['Q'], UD['I'], 'm*', 'UD', UD['I_Unc'])
+    VSANS_QueueFigure(Figure)
 
     return
 
 def PlotFourCombinedCrossSections(Type, Slice, Sub, Sample, Config, Matrix):
 
-    fig = plt.figure()
-    ax = plt.axes()
-    ax.set_xscale("log")
-    ax.set_yscale("log")
-    if YesNoSetPlotYRange > 0:
-        ax.set_ylim(bottom = PlotYmin, top = PlotYmax)
-    if YesNoSetPlotXRange > 0:
-        ax.set_xlim(left = PlotXmin, right = PlotXmax)
-    ax.errorbar(Matrix['Q'], Matrix['UU'], yerr=Matrix['UU_Unc'], fmt = 'b*', label='UU')
-    ax.errorbar(Matrix['Q'], Matrix['DU'], yerr=Matrix['DU_Unc'], fmt = 'g*', label='DU')
-    ax.errorbar(Matrix['Q'], Matrix['DD'], yerr=Matrix['DD_Unc'], fmt = 'r*', label='DD')
-    ax.errorbar(Matrix['Q'], Matrix['UD'], yerr=Matrix['UD_Unc'], fmt = 'm*', label='UD')
-    plt.xlabel('Q (inverse angstroms)')
-    plt.ylabel('Intensity')
-    plt.title('{slice_type}_{idnum},{cf}'.format(slice_type = Slice, idnum=Sample, cf = Config))
-    plt.legend()
-    fig.savefig(save_path + 'SliceFullPol_{samp},{cf}_{corr}{slice_type}{sub}.png'.format(samp=Sample, cf = Config, corr = Type, slice_type = Slice, sub = Sub))
-    if YesNoShowPlots > 0:
-        plt.pause(2)
-    plt.close()
+    Figure = VSANS_Figure(save_path + 'SliceFullPol_{samp},{cf}_{corr}{slice_type}{sub}.png'.format(samp=Sample, cf = Config, corr = Type, slice_type = Slice, sub = Sub),
+                          '{slice_type}_{idnum},{cf}'.format(slice_type = Slice, idnum=Sample, cf = Config), 'Q (inverse angstroms)', 'Intensity', UserRanges = 1)
+    VSANS_FigureSeries(Figure, Matrix['Q'], Matrix['UU'], 'b*', 'UU', Matrix['UU_Unc'])
+    VSANS_FigureSeries(Figure, Matrix['Q'], Matrix['DU'], 'g*', 'DU', Matrix['DU_Unc'])
+    VSANS_FigureSeries(Figure, Matrix['Q'], Matrix['DD'], 'r*', 'DD', Matrix['DD_Unc'])
+    VSANS_FigureSeries(Figure, Matrix['Q'], Matrix['UD'], 'm*', 'UD', Matrix['UD_Unc'])
+    VSANS_QueueFigure(Figure)
 
     return
 
@@ -2401,17 +3285,18 @@ def vSANS_FullPolSlices(AverageQRanges, PolCorrDegree, Sample, Config, InPlaneAn
 
     PlotYesNo = 0
     BothSides = 1
-    HorzMask = SectorMask_AllDetectors(InPlaneAngleMap, 0, SectorCutAngles, BothSides)
-    VertMask = SectorMask_AllDetectors(InPlaneAngleMap, 90, SectorCutAngles, BothSides)
-    CircMask = SectorMask_AllDetectors(InPlaneAngleMap, 0, 180, BothSides)
-    DiagMaskA = SectorMask_AllDetectors(InPlaneAngleMap, 45, SectorCutAngles, BothSides)
-    DiagMaskB = SectorMask_AllDetectors(InPlaneAngleMap, -45, SectorCutAngles, BothSides)
+    HorzMask = SectorMask_AllDetectors(InPlaneAngleMap, 0, SectorCutAngles, BothSides, Config)
+    VertMask = SectorMask_AllDetectors(InPlaneAngleMap, 90, SectorCutAngles, BothSides, Config)
+    CircMask = SectorMask_AllDetectors(InPlaneAngleMap, 0, 180, BothSides, Config)
+    DiagMaskA = SectorMask_AllDetectors(InPlaneAngleMap, 45, SectorCutAngles, BothSides, Config)
+    DiagMaskB = SectorMask_AllDetectors(InPlaneAngleMap, -45, SectorCutAngles, BothSides, Config)
     DiagMask = {}
     for dshort in relevant_detectors:
         DiagMask[dshort] = DiagMaskA[dshort] + DiagMaskB[dshort]
 
     ReturnSlices = {}
     
+    SliceMasks = {}
     for slices in Slices:
         if slices == "Circ":
             slice_key = "CircAve"
@@ -2425,11 +3310,14 @@ def vSANS_FullPolSlices(AverageQRanges, PolCorrDegree, Sample, Config, InPlaneAn
         elif slices == "Diag":
             slice_key = "Diag"+str(SectorCutAngles)
             local_mask = DiagMask
+        SliceMasks[slice_key] = local_mask
 
-        UU = TwoDimToOneDim(slice_key, Q_min, Q_max, Q_bins, QValues_All, GeneralMaskWSolenoid, local_mask, PolCorrUU, PolCorrUU_Unc, Sample, Config, PlotYesNo, AverageQRanges)
-        DU = TwoDimToOneDim(slice_key, Q_min, Q_max, Q_bins, QValues_All, GeneralMaskWSolenoid, local_mask, PolCorrDU, PolCorrDU_Unc, Sample, Config, PlotYesNo, AverageQRanges)
-        DD = TwoDimToOneDim(slice_key, Q_min, Q_max, Q_bins, QValues_All, GeneralMaskWSolenoid, local_mask, PolCorrDD, PolCorrDD_Unc, Sample, Config, PlotYesNo, AverageQRanges)
-        UD = TwoDimToOneDim(slice_key, Q_min, Q_max, Q_bins, QValues_All, GeneralMaskWSolenoid, local_mask, PolCorrUD, PolCorrUD_Unc, Sample, Config, PlotYesNo, AverageQRanges)
+    Sums = TwoDimToOneDim_MultiCut(Q_min, Q_max, Q_bins, QValues_All, GeneralMaskWSolenoid, SliceMasks, [(PolCorrUU, PolCorrUU_Unc), (PolCorrDU, PolCorrDU_Unc), (PolCorrDD, PolCorrDD_Unc), (PolCorrUD, PolCorrUD_Unc)], Config)
+    for slice_key in SliceMasks:
+        UU = OneDimFromCarriageSums(slice_key, Q_min, Q_max, Q_bins, Sums[slice_key][0], Sample, Config, PlotYesNo, AverageQRanges)
+        DU = OneDimFromCarriageSums(slice_key, Q_min, Q_max, Q_bins, Sums[slice_key][1], Sample, Config, PlotYesNo, AverageQRanges)
+        DD = OneDimFromCarriageSums(slice_key, Q_min, Q_max, Q_bins, Sums[slice_key][2], Sample, Config, PlotYesNo, AverageQRanges)
+        UD = OneDimFromCarriageSums(slice_key, Q_min, Q_max, Q_bins, Sums[slice_key][3], Sample, Config, PlotYesNo, AverageQRanges)
 
         #SaveTextDataFourCrossSections('{corr}'.format(corr = Corr), slice_key, Sample, Config, UU, DU, DD, UD)
         '''saves data as SliceFullPol_{samp},{cf}_{corr}{slice_key}.txt'''
@@ -2450,17 +3338,18 @@ def vSANS_HalfPolSlices(AverageQRanges, PolType, Sample, Config, InPlaneAngleMap
 
     PlotYesNo = 0
     BothSides = 1
-    HorzMask = SectorMask_AllDetectors(InPlaneAngleMap, 0, SectorCutAngles, BothSides)
-    VertMask = SectorMask_AllDetectors(InPlaneAngleMap, 90, SectorCutAngles, BothSides)
-    CircMask = SectorMask_AllDetectors(InPlaneAngleMap, 0, 180, BothSides)
-    DiagMaskA = SectorMask_AllDetectors(InPlaneAngleMap, 45, SectorCutAngles, BothSides)
-    DiagMaskB = SectorMask_AllDetectors(InPlaneAngleMap, -45, SectorCutAngles, BothSides)
+    HorzMask = SectorMask_AllDetectors(InPlaneAngleMap, 0, SectorCutAngles, BothSides, Config)
+    VertMask = SectorMask_AllDetectors(InPlaneAngleMap, 90, SectorCutAngles, BothSides, Config)
+    CircMask = SectorMask_AllDetectors(InPlaneAngleMap, 0, 180, BothSides, Config)
+    DiagMaskA = SectorMask_AllDetectors(InPlaneAngleMap, 45, SectorCutAngles, BothSides, Config)
+    DiagMaskB = SectorMask_AllDetectors(InPlaneAngleMap, -45, SectorCutAngles, BothSides, Config)
     DiagMask = {}
     for dshort in relevant_detectors:
         DiagMask[dshort] = DiagMaskA[dshort] + DiagMaskB[dshort]
 
     ReturnSlices = {}
     
+    SliceMasks = {}
     for slices in Slices:
         if slices == "Circ":
             slice_key = "CircAve"
@@ -2474,9 +3363,12 @@ def vSANS_HalfPolSlices(AverageQRanges, PolType, Sample, Config, InPlaneAngleMap
         elif slices == "Diag":
             slice_key = "Diag"+str(SectorCutAngles)
             local_mask = DiagMask
+        SliceMasks[slice_key] = local_mask
 
-        UCut = TwoDimToOneDim(slice_key, Q_min, Q_max, Q_bins, QValues_All, GeneralMaskWSolenoid, local_mask, U, U_Unc, Sample, Config, PlotYesNo, AverageQRanges)
-        DCut = TwoDimToOneDim(slice_key, Q_min, Q_max, Q_bins, QValues_All, GeneralMaskWSolenoid, local_mask, D, D_Unc, Sample, Config, PlotYesNo, AverageQRanges)
+    Sums = TwoDimToOneDim_MultiCut(Q_min, Q_max, Q_bins, QValues_All, GeneralMaskWSolenoid, SliceMasks, [(U, U_Unc), (D, D_Unc)], Config)
+    for slice_key in SliceMasks:
+        UCut = OneDimFromCarriageSums(slice_key, Q_min, Q_max, Q_bins, Sums[slice_key][0], Sample, Config, PlotYesNo, AverageQRanges)
+        DCut = OneDimFromCarriageSums(slice_key, Q_min, Q_max, Q_bins, Sums[slice_key][1], Sample, Config, PlotYesNo, AverageQRanges)
 
         ReturnSlices[slice_key] = {'PolType' : PolType, 'U' : UCut, 'D' : DCut}
 
@@ -2491,17 +3383,18 @@ def vSANS_UnpolSlices(AverageQRanges, PolType, Sample, Config, InPlaneAngleMap,
 
     PlotYesNo = 0
     BothSides = 1
-    HorzMask = SectorMask_AllDetectors(InPlaneAngleMap, 0, SectorCutAngles, BothSides)
-    VertMask = SectorMask_AllDetectors(InPlaneAngleMap, 90, SectorCutAngles, BothSides)
-    CircMask = SectorMask_AllDetectors(InPlaneAngleMap, 0, 180, BothSides)
-    DiagMaskA = SectorMask_AllDetectors(InPlaneAngleMap, 45, SectorCutAngles, BothSides)
-    DiagMaskB = SectorMask_AllDetectors(InPlaneAngleMap, -45, SectorCutAngles, BothSides)
+    HorzMask = SectorMask_AllDetectors(InPlaneAngleMap, 0, SectorCutAngles, BothSides, Config)
+    VertMask = SectorMask_AllDetectors(InPlaneAngleMap, 90, SectorCutAngles, BothSides, Config)
+    CircMask = SectorMask_AllDetectors(InPlaneAngleMap, 0, 180, BothSides, Config)
+    DiagMaskA = SectorMask_AllDetectors(InPlaneAngleMap, 45, SectorCutAngles, BothSides, Config)
+    DiagMaskB = SectorMask_AllDetectors(InPlaneAngleMap, -45, SectorCutAngles, BothSides, Config)
     DiagMask = {}
     for dshort in relevant_detectors:
         DiagMask[dshort] = DiagMaskA[dshort] + DiagMaskB[dshort]
 
     ReturnSlices = {}
     
+    SliceMasks = {}
     for slices in Slices:
         if slices == "Circ":
             slice_key = "CircAve"
@@ -2515,8 +3408,11 @@ def vSANS_UnpolSlices(AverageQRanges, PolType, Sample, Config, InPlaneAngleMap,
         elif slices == "Diag":
             slice_key = "Diag"+str(SectorCutAngles)
             local_mask = DiagMask
+        SliceMasks[slice_key] = local_mask
 
-        UnpolCut = TwoDimToOneDim(slice_key, Q_min, Q_max, Q_bins, QValues_All, GeneralMaskWSolenoid, local_mask, Unpol, Unpol_Unc, Sample, Config, PlotYesNo, AverageQRanges)
+    Sums = TwoDimToOneDim_MultiCut(Q_min, Q_max, Q_bins, QValues_All, GeneralMaskWSolenoid, SliceMasks, [(Unpol, Unpol_Unc)], Config)
+    for slice_key in SliceMasks:
+        UnpolCut = OneDimFromCarriageSums(slice_key, Q_min, Q_max, Q_bins, Sums[slice_key][0], Sample, Config, PlotYesNo, AverageQRanges)
         
         ReturnSlices[slice_key] = {'PolType' : PolType, 'Unpol' : UnpolCut}
 
@@ -2854,28 +3750,15 @@ def vSANS_ProcessFullPolSlices(PolSampleSlices, Sample, PolEmptySlices):
             M_Parl_SF_Unc = (np.sqrt(np.power(HorzAndVert_Data['DU_Unc'],2) + np.power(HorzAndVert_Data['UD_Unc'],2) + np.power(Diag_Data['DU_Unc'],2) + np.power(Diag_Data['UD_Unc'],2)))/2.0
 
         Width = str(SectorCutAngles) + "Deg"
-        fig = plt.figure()
-        ax = plt.axes()
-        ax.set_xscale("log")
-        ax.set_yscale("log")
-        if YesNoSetPlotYRange > 0:
-            ax.set_ylim(bottom = PlotYmin, top = PlotYmax)
-        if YesNoSetPlotXRange > 0:
-            ax.set_xlim(left = PlotXmin, right = PlotXmax)
-        ax.errorbar(Horz_Data['Q'], M_Perp, yerr=M_Perp_Unc, fmt = 'b*', label='M_Perp (spin-flip)')
-        ax.errorbar(Horz_Data['Q'], M_Parl_NSF, yerr=M_Parl_NSF_Unc, fmt = 'g*', label='M_Parl (non spin-flip)')
-        ax.errorbar(Horz_Data['Q'], M_Parl_NSFAllVert, yerr=M_Parl_NSFAllVert_Unc, fmt = 'c*', label='M_Parl (non spin-flip, all vertical)')
+        Figure = VSANS_Figure(save_path + 'ResultsFullPol_{samp},{cf}_{key}{width}{sub}.png'.format(samp=Sample, cf = Config,  key = PolType, width = Width, sub = Sub),
+                              'Full-Pol Magnetic and Structural Scattering of {samp}'.format(samp=Sample), 'Q (inverse angstroms)', 'Intensity', UserRanges = 1)
+        VSANS_FigureSeries(Figure, Horz_Data['Q'], M_Perp, 'b*', 'M_Perp (spin-flip)', M_Perp_Unc)
+        VSANS_FigureSeries(Figure, Horz_Data['Q'], M_Parl_NSF, 'g*', 'M_Parl (non spin-flip)', M_Parl_NSF_Unc)
+        VSANS_FigureSeries(Figure, Horz_Data['Q'], M_Parl_NSFAllVert, 'c*', 'M_Parl (non spin-flip, all vertical)', M_Parl_NSFAllVert_Unc)
         if HaveDiagData == 1:
-            ax.errorbar(Diag_Data['Q'], M_Parl_SF, yerr=M_Parl_SF_Unc, fmt = 'm*', label='M_Parl (spin-flip)')
-        ax.errorbar(Horz_Data['Q'], Struc, yerr=Struc_Unc, fmt = 'r*', label='Structural (non spin-flip)')
-        plt.xlabel('Q (inverse angstroms)')
-        plt.ylabel('Intensity')
-        plt.title('Full-Pol Magnetic and Structural Scattering of {samp}'.format(samp=Sample))
-        plt.legend()
-        fig.savefig(save_path + 'ResultsFullPol_{samp},{cf}_{key}{width}{sub}.png'.format(samp=Sample, cf = Config,  key = PolType, width = Width, sub = Sub))
-        if YesNoShowPlots > 0:
-            plt.pause(2)
-        plt.close()              
+            VSANS_FigureSeries(Figure, Diag_Data['Q'], M_Parl_SF, 'm*', 'M_Parl (spin-flip)', M_Parl_SF_Unc)
+        VSANS_FigureSeries(Figure, Horz_Data['Q'], Struc, 'r*', 'Structural (non spin-flip)', Struc_Unc)
+        VSANS_QueueFigure(Figure)
 
         Q = Horz_Data['Q']
         Q_mean = Horz_Data['Q_Mean']
@@ -2883,14 +3766,10 @@ def vSANS_ProcessFullPolSlices(PolSampleSlices, Sample, PolEmptySlices):
         Shadow = Horz_Data['Shadow']
         if HaveDiagData == 1:
             text_output = np.array([Q, Struc, Struc_Unc, M_Perp, M_Perp_Unc, M_Parl_NSF, M_Parl_NSF_Unc, M_Parl_NSFAllVert, M_Parl_NSFAllVert_Unc, M_Parl_SF, M_Parl_SF_Unc, Q_Unc, Q_mean, Shadow])
-            text_output = text_output.T
-            np.savetxt(save_path + 'ResultsFullPol_{samp},{cf}_{key}{width}{sub}.txt'.format(samp=Sample, cf = Config, key = PolType, width = Width, sub = Sub), text_output,
-                   delimiter = ' ', comments = '', header= 'Q, Struc, DelStruc, M_Perp, DelM_Perp, M_Parl_NSF, DelM_Parl_NSF, M_Parl_NSFVert, DelM_Parl_NSFVert, M_Parl_SF, DelM_Parl_SF, Q_Unc, Q_mean, Shadow', fmt='%1.4e')
+            VSANS_SaveColumns('ResultsFullPol_{samp},{cf}_{key}{width}{sub}.txt'.format(samp=Sample, cf = Config, key = PolType, width = Width, sub = Sub), text_output, 'Q, Struc, DelStruc, M_Perp, DelM_Perp, M_Parl_NSF, DelM_Parl_NSF, M_Parl_NSFVert, DelM_Parl_NSFVert, M_Parl_SF, DelM_Parl_SF, Q_Unc, Q_mean, Shadow', Sample, Config)
         else:
             text_output = np.array([Q, Struc, Struc_Unc, M_Perp, M_Perp_Unc, M_Parl_NSF, M_Parl_NSF_Unc, M_Parl_NSFAllVert, M_Parl_NSFAllVert_Unc, Q_Unc, Q_mean, Shadow])
-            text_output = text_output.T
-            np.savetxt(save_path + 'ResultsFullPol_{samp},{cf}_{key}{width}{sub}.txt'.format(samp=Sample, cf = Config, key = PolType, width = Width, sub = Sub), text_output,
-                   delimiter = ' ', comments = '', header= 'Q, Struc, DelStruc, M_Perp, DelM_Perp, M_Parl_NSF, DelM_Parl_NSF, M_Parl_NSFVert, DelM_Parl_NSFVert, Q_Unc, Q_mean, Shadow', fmt='%1.4e')
+            VSANS_SaveColumns('ResultsFullPol_{samp},{cf}_{key}{width}{sub}.txt'.format(samp=Sample, cf = Config, key = PolType, width = Width, sub = Sub), text_output, 'Q, Struc, DelStruc, M_Perp, DelM_Perp, M_Parl_NSF, DelM_Parl_NSF, M_Parl_NSFVert, DelM_Parl_NSFVert, Q_Unc, Q_mean, Shadow', Sample, Config)
             
     Results = {}
     if 'Circ' in Slices:
@@ -3062,34 +3941,19 @@ def vSANS_ProcessHalfPolSlices(PolSampleSlices, Sample, PolEmptySlices):
         M_Parl_Div_Unc = M_Parl_Div * np.sqrt( np.power(Num_Unc,2)/np.power(Num,2) + np.power(Denom_Unc,2)/np.power(Denom,2))
 
         Width = str(SectorCutAngles) + "Deg"
-        fig = plt.figure()
-        ax = plt.axes()
-        ax.set_xscale("log")
-        ax.set_yscale("log")
-        if YesNoSetPlotYRange > 0:
-            ax.set_ylim(bottom = PlotYmin, top = PlotYmax)
-        if YesNoSetPlotXRange > 0:
-            ax.set_xlim(left = PlotXmin, right = PlotXmax)
-        ax.errorbar(Horz_Data['Q'], M_Parl_Sub, yerr=M_Parl_Sub_Unc, fmt = 'b*', label='M_Parl (subtraction)')
-        ax.errorbar(Horz_Data['Q'], M_Parl_Div, yerr=M_Parl_Div_Unc, fmt = 'g*', label='M_Parl (dividion)')
-        ax.errorbar(Horz_Data['Q'], Struc, yerr=Struc_Unc, fmt = 'r*', label='Structural (horizontal)')
-        plt.xlabel('Q (inverse angstroms)')
-        plt.ylabel('Intensity')
-        plt.title('Halp-Pol Magnetic and Structural Scattering of {samp}'.format(samp=Sample))
-        plt.legend()
-        fig.savefig(save_path + 'ResultsHalfPol_{samp},{cf}_{width}{sub}.png'.format(samp=Sample, cf = Config, width = Width, sub = Sub))
-        if YesNoShowPlots > 0:
-            plt.pause(2)
-        plt.close()              
+        Figure = VSANS_Figure(save_path + 'ResultsHalfPol_{samp},{cf}_{width}{sub}.png'.format(samp=Sample, cf = Config, width = Width, sub = Sub),
+                              'Halp-Pol Magnetic and Structural Scattering of {samp}'.format(samp=Sample), 'Q (inverse angstroms)', 'Intensity', UserRanges = 1)
+        VSANS_FigureSeries(Figure, Horz_Data['Q'], M_Parl_Sub, 'b*', 'M_Parl (subtraction)', M_Parl_Sub_Unc)
+        VSANS_FigureSeries(Figure, Horz_Data['Q'], M_Parl_Div, 'g*', 'M_Parl (dividion)', M_Parl_Div_Unc)
+        VSANS_FigureSeries(Figure, Horz_Data['Q'], Struc, 'r*', 'Structural (horizontal)', Struc_Unc)
+        VSANS_QueueFigure(Figure)
 
         Q = Horz_Data['Q']
         Q_mean = Horz_Data['Q_Mean']
         Q_Unc = Horz_Data['Q_Unc']
         Shadow = Horz_Data['Shadow']
         text_output = np.array([Q, Struc, Struc_Unc, M_Parl_Div, M_Parl_Div_Unc, M_Parl_Sub, M_Parl_Sub_Unc, Q_Unc, Q_mean, Shadow])
-        text_output = text_output.T
-        np.savetxt(save_path + 'ResultsHalfPol_{samp},{cf}_{width}{sub}.txt'.format(samp=Sample, cf = Config, width = Width, sub = Sub), text_output,
-               delimiter = ' ', comments = '', header= 'Q, Struc, DelStruc, M_Parl_Div, DelM_Parl_Div, M_Parl_Sub, DelM_Parl_Sub, Q_Unc, Q_mean, Shadow', fmt='%1.4e')
+        VSANS_SaveColumns('ResultsHalfPol_{samp},{cf}_{width}{sub}.txt'.format(samp=Sample, cf = Config, width = Width, sub = Sub), text_output, 'Q, Struc, DelStruc, M_Parl_Div, DelM_Parl_Div, M_Parl_Sub, DelM_Parl_Sub, Q_Unc, Q_mean, Shadow', Sample, Config)
 
     Results = {}
     if 'Circ' in Slices:
@@ -3218,33 +4082,18 @@ def vSANS_ProcessUnpolSlices(PolSampleSlices, Sample, PolEmptySlices):
         Struc_Unc = Horz_Data['Unpol_Unc']
 
         Width = str(SectorCutAngles) + "Deg"
-        fig = plt.figure()
-        ax = plt.axes()
-        ax.set_xscale("log")
-        ax.set_yscale("log")
-        if YesNoSetPlotYRange > 0:
-            ax.set_ylim(bottom = PlotYmin, top = PlotYmax)
-        if YesNoSetPlotXRange > 0:
-            ax.set_xlim(left = PlotXmin, right = PlotXmax)
-        ax.errorbar(Horz_Data['Q'], M_Parl_Sub, yerr=M_Parl_Sub_Unc, fmt = 'b*', label='M_Parl (subtraction)')
-        ax.errorbar(Horz_Data['Q'], Struc, yerr=Struc_Unc, fmt = 'r*', label='Structural (horizontal)')
-        plt.xlabel('Q (inverse angstroms)')
-        plt.ylabel('Intensity')
-        plt.title('Unpol Magnetic and Structural Scattering of {samp}'.format(samp=Sample))
-        plt.legend()
-        fig.savefig(save_path + 'ResultsUnpol_{samp},{cf}_{width}{sub}.png'.format(samp=Sample, cf = Config, width = Width, sub = Sub))
-        if YesNoShowPlots > 0:
-            plt.pause(2)
-        plt.close()              
+        Figure = VSANS_Figure(save_path + 'ResultsUnpol_{samp},{cf}_{width}{sub}.png'.format(samp=Sample, cf = Config, width = Width, sub = Sub),
+                              'Unpol Magnetic and Structural Scattering of {samp}'.format(samp=Sample), 'Q (inverse angstroms)', 'Intensity', UserRanges = 1)
+        VSANS_FigureSeries(Figure, Horz_Data['Q'], M_Parl_Sub, 'b*', 'M_Parl (subtraction)', M_Parl_Sub_Unc)
+        VSANS_FigureSeries(Figure, Horz_Data['Q'], Struc, 'r*', 'Structural (horizontal)', Struc_Unc)
+        VSANS_QueueFigure(Figure)
 
         Q = Horz_Data['Q']
         Q_mean = Horz_Data['Q_Mean']
         Q_Unc = Horz_Data['Q_Unc']
         Shadow = Horz_Data['Shadow']
         text_output = np.array([Q, Struc, Struc_Unc, M_Parl_Sub, M_Parl_Sub_Unc, Q_Unc, Q_mean, Shadow])
-        text_output = text_output.T
-        np.savetxt(save_path + 'ResultsUnpol_{samp},{cf}_{width}{sub}.txt'.format(samp=Sample, cf = Config, width = Width, sub = Sub), text_output,
-               delimiter = ' ', comments = '', header= 'Q, Struc, DelStruc, M_Parl_Sub, DelM_Parl_Sub, Q_Unc, Q_mean, Shadow', fmt='%1.4e')
+        VSANS_SaveColumns('ResultsUnpol_{samp},{cf}_{width}{sub}.txt'.format(samp=Sample, cf = Config, width = Width, sub = Sub), text_output, 'Q, Struc, DelStruc, M_Parl_Sub, DelM_Parl_Sub, Q_Unc, Q_mean, Shadow', Sample, Config)
 
     Results = {}
     if 'Circ' in Slices:
@@ -3378,42 +4227,29 @@ def Annular_Average(Sample, Config, InPlaneAngleMap, Q_min, Q_max, Q_total, Gene
         Q_Mask[dshort] = QBorder
 
     
-    Counts = -101
-    Deg = -101
-    BothSides = 0
-    PlotYesNo = 0
+    #72 sectors of 5 degrees (+/- 2.5 around each centre) summed in one pass per panel
+    summed_pixels = np.zeros(72)
+    summed_intensity = np.zeros(72)
+    for dshort in relevant_detectors:
+        Sector_Index = AngularBinIndex(InPlaneAngleMap[dshort], 5.0)
+        pixel_counts = np.ravel(Q_Mask[dshort]*GeneralMask[dshort])
+        intensity_counts = pixel_counts*np.ravel(ScaledData[dshort])
+        summed_pixels += np.bincount(Sector_Index, weights=pixel_counts, minlength=72)
+        summed_intensity += np.bincount(Sector_Index, weights=intensity_counts, minlength=72)
+
+    Counts = []
+    Deg = []
     for x in range(0, 72):
-        degree = x*5
-        Sector_Mask = SectorMask_AllDetectors(InPlaneAngleMap, degree, 2.5, BothSides)
-
-        summed_pixels = 0
-        summed_intensity = 0
-        for dshort in relevant_detectors:
-            pixel_counts = Sector_Mask[dshort]*Q_Mask[dshort]*GeneralMask[dshort]
-            intensity_counts = pixel_counts*ScaledData[dshort]
-            summed_pixels = summed_pixels + np.sum(pixel_counts)
-            summed_intensity = summed_intensity + np.sum(intensity_counts)
-        ratio = summed_intensity/summed_pixels
-        if Counts == -101 and summed_pixels > 0:
-            Counts = [ratio]
-            Deg = [degree]
-        elif summed_pixels > 0:
-            Counts.append(ratio)
-            Deg.append(degree)
+        if summed_pixels[x] > 0:
+            Counts.append(summed_intensity[x]/summed_pixels[x])
+            Deg.append(x*5)
 
     xdata = np.array(Deg)
     ydata = np.array(Counts)
-    fig = plt.figure()
-    plt.plot(xdata, ydata, 'b*-', label='Annular_Average')
-    plt.xscale('linear')
-    plt.yscale('linear')
-    plt.xlabel('Angle (degrees)')
-    plt.ylabel('Summed Counts')
-    plt.title('Annular Average_{qmin}to{qmax}invang'.format(qmin = Q_min, qmax = Q_max))
-    plt.legend()
-    fig.savefig(save_path + 'AnnularAverage_{idnum},{cf}.png'.format(idnum=Sample, cf = Config))
-    plt.pause(2)
-    plt.close()
+    Figure = VSANS_Figure(save_path + 'AnnularAverage_{idnum},{cf}.png'.format(idnum=Sample, cf = Config), 'Annular Average_{qmin}to{qmax}invang'.format(qmin = Q_min, qmax = Q_max),
+                          'Angle (degrees)', 'Summed Counts', 'linear', 'linear')
+    VSANS_FigureSeries(Figure, xdata, ydata, 'b*-', 'Annular_Average')
+    VSANS_QueueFigure(Figure)
     
     
     return
@@ -3436,16 +4272,16 @@ def RemoveMainBeamFullPol(Scatt_Type, Sample, Config, Scatt, HE3_Cell_Summary, S
     type_time = Scatt_Type + "_Time"
     filenumber_counter = 0
     AveHe3Trans = 0
+    Times = []
     for filenumber in Scatt[Sample]['Config(s)'][Config][Scatt_Type]:
         f = get_by_filenumber(representative_filenumber)
         if f is not None:
-            entry = Scatt[Sample]['Config(s)'][Config][type_time][filenumber_counter]
-            NP, UT, T_MAJ, T_MIN = HE3_Pol_AtGivenTime(entry, HE3_Cell_Summary)
-            AveHe3Trans += T_MAJ
+            Times.append(Scatt[Sample]['Config(s)'][Config][type_time][filenumber_counter])
             filenumber_counter += 1
             
     if filenumber_counter > 0:
-        AveHe3Trans = AveHe3Trans / filenumber_counter
+        NP, UT, T_MAJ, T_MIN = HE3_Pol_AtTimes(Times, HE3_CellTimeline(HE3_Cell_Summary))
+        AveHe3Trans = np.sum(T_MAJ) / filenumber_counter
         for dshort in relevant_detectors:
             #Kludge 2
             ScaledData[dshort] = ScaledData[dshort] - OpenScaledData[dshort]*AveHe3Trans
@@ -3464,10 +4300,8 @@ def vSANS_Comparison_PlotsAndText(Config, CompareVariable, CutVariable, FullCutN
             descrip = ''
             Q_previous = np.array([0, 0, 0])
             counter = 0
-            fig = plt.figure()
-            ax = plt.axes()
-            ax.set_xscale("log")
-            ax.set_yscale("log")
+            Figure = VSANS_Figure(save_path + 'Compare_{base},{cf}_{name}.png'.format(base = Base, cf = Config, name = FullCutName),
+                                  '{name} for_{cf}'.format(name = FullCutName, cf = Config), 'Q', 'Intensity')
             for Sample in BaseMap[Base]:
                 if Sample in ScattCatalog:                
                     if 'Sample' in str(ScattCatalog[Sample]['Intent']):
@@ -3498,298 +4332,700 @@ def vSANS_Comparison_PlotsAndText(Config, CompareVariable, CutVariable, FullCutN
                             counter += 1
                             Q_previous = Q
                             symbol = str(plot_symbols[symbol_counter])
-                            ax.errorbar(Q, I, yerr=DI, fmt = symbol, label='{name}, {samp}'.format(name = FullCutName, samp=Sample))
+                            VSANS_FigureSeries(Figure, Q, I, symbol, '{name}, {samp}'.format(name = FullCutName, samp=Sample), DI)
                             symbol_counter += 1
                             if symbol_counter >= symbol_max:
                                 symbol_counter = 0
             if HaveData >= 2:
-                text_outputII = np.array(text_output)
-                text_outputII = text_outputII.T
-                np.savetxt(save_path + 'Compare_{base},{cf}_{name}.txt'.format(base = Base, cf=Config, name = FullCutName), text_outputII, delimiter = ' ', comments = '', header =  descrip, fmt='%1.4e')
-
-                plt.xlabel('Q')
-                plt.ylabel('Intensity')
-                plt.title('{name} for_{cf}'.format(name = FullCutName, cf = Config))
-                plt.legend()
-                fig.savefig(save_path + 'Compare_{base},{cf}_{name}.png'.format(base = Base, cf = Config, name = FullCutName))
-                plt.pause(2)
-                plt.close()
-            else:
-                plt.close()
+                VSANS_SaveColumns('Compare_{base},{cf}_{name}.txt'.format(base = Base, cf=Config, name = FullCutName), text_output, descrip, Base, Config)
+                VSANS_QueueFigure(Figure)
     return
                     
+IncrementalCache_Folder = 'IncrementalCache'
+IncrementalCache_Version = 1
+IncrementalCache_Parameters = ['TransPanel', 'SectorCutAngles', 'Slices', 'Calc_Q_From_Trans', 'AverageQRanges', 'Absolute_Q_min', 'Absolute_Q_max',
+                               'YesNo_2DCombinedFiles', 'YesNo_2DFilesPerDetector', 'HighResMinX', 'HighResMaxX', 'HighResMinY', 'HighResMaxY',
+                               'ConvertHighResToSubset', 'HighResGain', 'HighResRebin', 'SinglePrecision', 'UsePolCorr', 'He3CorrectionType', 'PolCorrUncertainty', 'Minimum_PSM', 'YesNoManualHe3Entry',
+                               'New_HE3_Files', 'MuValues', 'TeValues', 'YesNo_TextOutput', 'YesNo_HDF5Output']
+incremental_hashes = {}
+incremental_stats = {'Reused' : 0, 'Reduced' : 0}
+
+def VSANS_LoadIncrementalHashes():
+    #Content hashes of previously seen input files, keyed by full path as [size, mtime, sha256].
+    hash_fullpath = os.path.join(save_path, IncrementalCache_Folder, 'FileHashes.pkl')
+    if UseIncrementalReduction > 0 and os.path.isfile(hash_fullpath):
+        try:
+            with open(hash_fullpath, 'rb') as g:
+                incremental_hashes.update(pickle.load(g))
+        except (OSError, pickle.UnpicklingError, EOFError):
+            print('Could not read', hash_fullpath, '; input files will be re-hashed')
+    return
+
+def VSANS_SaveIncrementalHashes():
+    if UseIncrementalReduction > 0:
+        print('Incremental reduction:', incremental_stats['Reused'], 'slice sets reused,', incremental_stats['Reduced'], 'reduced')
+        cache_path = os.path.join(save_path, IncrementalCache_Folder)
+        try:
+            if not os.path.exists(cache_path):
+                os.makedirs(cache_path)
+            with open(os.path.join(cache_path, 'FileHashes.pkl'), 'wb') as g:
+                pickle.dump(incremental_hashes, g)
+        except OSError:
+            print('Could not save input file hashes to', cache_path)
+    return
+
+def VSANS_InputFileHash(fullpath):
+    #SHA-256 of the file contents; only recomputed when the size or modification time differs from the saved value.
+    if not os.path.isfile(fullpath):
+        return 'NA'
+    file_stat = os.stat(fullpath)
+    if fullpath in incremental_hashes:
+        size, mtime, digest = incremental_hashes[fullpath]
+        if size == file_stat.st_size and mtime == file_stat.st_mtime:
+            return digest
+    sha = hashlib.sha256()
+    with open(fullpath, 'rb') as g:
+        for chunk in iter(lambda: g.read(1 << 20), b''):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    incremental_hashes[fullpath] = [file_stat.st_size, file_stat.st_mtime, digest]
+    return digest
+
+def VSANS_IncrementalFingerprint(PolType, ScattTypes, Sample, Config, QFilenumbers, BBList, Scatt, Trans, Pol_Trans, HE3_Cell_Summary, BestPSM, Plex_Name, Mask_Record):
+    #Uses VSANS_InputFileHash
+    #Everything the slices of one (PolType, Sample, Config) depend on: the scattering file numbers and times for the cross-sections
+    #in ScattTypes, the content hashes of those files and of the blocked beam, plex, mask and Q-map (QFilenumbers) files, the
+    #transmission values, the polarization corrections (full-pol only) and the relevant UserInput parameters.
+    #Returns None when incremental reduction is off or the cross-sections are not all present.
+
+    if UseIncrementalReduction <= 0 or Sample not in Scatt or Config not in Scatt[Sample]['Config(s)']:
+        return None
+    Entry = Scatt[Sample]['Config(s)'][Config]
+    for ScattType in ScattTypes:
+        if str(Entry[ScattType]).find('NA') != -1:
+            return None
+
+    filenumbers = list(QFilenumbers) + [fn for fn in BBList if fn != 0]
+    Record = {'Version' : IncrementalCache_Version, 'PolType' : PolType, 'Intent' : Scatt[Sample]['Intent'], 'Plex' : Plex_Name}
+    for ScattType in ScattTypes:
+        Record[ScattType] = Entry[ScattType]
+        if ScattType + '_Time' in Entry:
+            Record[ScattType + '_Time'] = Entry[ScattType + '_Time']
+        filenumbers += list(Entry[ScattType])
+    if Sample in Trans and Config in Trans[Sample]['Config(s)']:
+        Record['Trans'] = Trans[Sample]['Config(s)'][Config]
+    if Config in Mask_Record:
+        Record['Masks'] = Mask_Record[Config]
+        for name in Mask_Record[Config].values():
+            if name != 'NA':
+                Record[name] = VSANS_InputFileHash(os.path.join("./", name))
+    if PolType == 'FullPol':
+        Record['PSM'] = BestPSM
+        Record['He3'] = HE3_Cell_Summary
+        if Sample in Pol_Trans:
+            Record['Pol_Trans'] = Pol_Trans[Sample]
+    Record['Parameters'] = {name : globals().get(name, 'NA') for name in IncrementalCache_Parameters}
+    Record['Files'] = {fn : VSANS_InputFileHash(os.path.join(input_path, "sans" + str(fn) + ".nxs.ngv")) for fn in sorted(set(filenumbers))}
+    Record['Plex_File'] = VSANS_InputFileHash(os.path.join(input_path, str(Plex_Name)))
+
+    return hashlib.sha256(repr(Record).encode()).hexdigest()
+
+def VSANS_LoadIncrementalSlices(PolType, Sample, Config, Fingerprint):
+    #Returns the saved slices for (PolType, Sample, Config) if they were made from identical inputs, otherwise None.
+    if Fingerprint is None:
+        return None
+    cache_fullpath = os.path.join(save_path, IncrementalCache_Folder, '{pt}_{samp}_{cf}.pkl'.format(pt=PolType, samp=Sample, cf=Config))
+    if os.path.isfile(cache_fullpath):
+        try:
+            with open(cache_fullpath, 'rb') as g:
+                Saved = pickle.load(g)
+            if Saved['Fingerprint'] == Fingerprint:
+                incremental_stats['Reused'] += 1
+                return Saved['Slices']
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError):
+            print('Could not read', cache_fullpath, '; reducing', Sample, 'again')
+    return None
+
+def VSANS_SaveIncrementalSlices(PolType, Sample, Config, Fingerprint, ReturnSlices):
+    if Fingerprint is None:
+        return
+    incremental_stats['Reduced'] += 1
+    cache_path = os.path.join(save_path, IncrementalCache_Folder)
+    try:
+        if not os.path.exists(cache_path):
+            os.makedirs(cache_path)
+        with open(os.path.join(cache_path, '{pt}_{samp}_{cf}.pkl'.format(pt=PolType, samp=Sample, cf=Config)), 'wb') as g:
+            pickle.dump({'Fingerprint' : Fingerprint, 'Slices' : ReturnSlices}, g)
+    except OSError:
+        print('Could not save slices for', Sample, Config, 'to', cache_path)
+    return
+
+def vSANS_ReduceSample(Sample, Config, Q_filenumber, Setup):
+    #Uses AbsScale, vSANS_PolCorrScattFiles, ASCIIlike_Output and the vSANS_*Slices functions along with the catalogues made at the start of the program
+    #Reduces one (Config, Sample) work unit to its 1D slices. Setup holds the inputs shared by every sample in Config (solid angle,
+    #blocked beam, Q range and masks); Q_filenumber is the file whose Q map the slices start from, which in the serial loop is the
+    #last one calculated for the previous sample (see vSANS_NextQFile).
+    #Returns FullPolCuts, HalfPolCuts, UnpolCuts (None if not measured) and the file of the last Q map calculated.
+
+    BBList = Setup['BBList']
+    BB_per_second = Setup['BB_per_second']
+    Solid_Angle = Setup['Solid_Angle']
+    Q_min = Setup['Q_min']
+    Q_max = Setup['Q_max']
+    Q_bins = Setup['Q_bins']
+    GeneralMaskWSolenoid = Setup['GeneralMaskWSolenoid']
+    GeneralMaskWOSolenoid = Setup['GeneralMaskWOSolenoid']
+    representative_filenumber = Q_filenumber
+    Qx, Qy, Qz, Q_total, Q_perp_unc, Q_parl_unc, InPlaneAngleMap, dimXX, dimYY, Shadow_Mask = QCalculation_AllDetectors(representative_filenumber, Config)
+    QValues_All = {'QX':Qx,'QY':Qy,'QZ':Qz,'Q_total':Q_total,'Q_perp_unc':Q_perp_unc,'Q_parl_unc':Q_parl_unc}
+    FullPolCuts = None
+    HalfPolCuts = None
+    UnpolCuts = None
+
+    VSANS_GetBeamCenterForScattFile(Sample, Config, AlignDet_TransCatalog)
+
+    if str(ScattCatalog[Sample]['Intent']).find('Sample') != -1 or str(ScattCatalog[Sample]['Intent']).find('Empty') != -1:
+
+        Fingerprint = VSANS_IncrementalFingerprint('FullPol', ['UU', 'DU', 'DD', 'UD'], Sample, Config, [Configs[Config], representative_filenumber], BBList, ScattCatalog, TransCatalog, Pol_TransCatalog, HE3_Cell_Summary, Truest_PSM, Plex_Name, Mask_Record)
+        FullPolCuts = VSANS_LoadIncrementalSlices('FullPol', Sample, Config, Fingerprint)
+        if FullPolCuts is None:
+            UUScaledData, UUScaledData_Unc = AbsScale('UU', Sample, Config, BB_per_second, Solid_Angle, Plex, ScattCatalog, TransCatalog)
+            DUScaledData, DUScaledData_Unc = AbsScale('DU', Sample, Config, BB_per_second, Solid_Angle, Plex, ScattCatalog, TransCatalog)
+            DDScaledData, DDScaledData_Unc = AbsScale('DD', Sample, Config, BB_per_second, Solid_Angle, Plex, ScattCatalog, TransCatalog)
+            UDScaledData, UDScaledData_Unc = AbsScale('UD', Sample, Config, BB_per_second, Solid_Angle, Plex, ScattCatalog, TransCatalog)
+            FullPolGo = 0
+            if 'NA' not in UUScaledData and 'NA' not in DUScaledData and 'NA' not in DDScaledData and 'NA' not in UDScaledData:
+
+                
+                representative_filenumber = ScattCatalog[Sample]['Config(s)'][Config]['UU'][0]
+                Qx, Qy, Qz, Q_total, Q_perp_unc, Q_parl_unc, InPlaneAngleMap, dimXX, dimYY, Shadow_Mask = QCalculation_AllDetectors(representative_filenumber, Config)
+                QValues_All = {'QX':Qx,'QY':Qy,'QZ':Qz,'Q_total':Q_total,'Q_perp_unc':Q_perp_unc,'Q_parl_unc':Q_parl_unc}
+                FullPolGo, PolCorrUU, PolCorrDU, PolCorrDD, PolCorrUD, PolCorrUU_Unc, PolCorrDU_Unc, PolCorrDD_Unc, PolCorrUD_Unc = vSANS_PolCorrScattFiles(Truest_PSM, dimXX, dimYY, Sample, Config, ScattCatalog, TransCatalog, Pol_TransCatalog, UUScaledData, DUScaledData, DDScaledData, UDScaledData, UUScaledData_Unc, DUScaledData_Unc, DDScaledData_Unc, UDScaledData_Unc, QValues_All, GeneralMaskWSolenoid)
+
+                if YesNo_2DCombinedFiles > 0:
+                    if FullPolGo >= 2:
+                        ASCIIlike_Output('PolCorrUU', Sample, Config, PolCorrUU, PolCorrUU_Unc, QValues_All, GeneralMaskWSolenoid)
+                        ASCIIlike_Output('PolCorrDU', Sample, Config, PolCorrDU, PolCorrDU_Unc, QValues_All, GeneralMaskWSolenoid)
+                        ASCIIlike_Output('PolCorrDD', Sample, Config, PolCorrDD, PolCorrDD_Unc, QValues_All, GeneralMaskWSolenoid)
+                        ASCIIlike_Output('PolCorrUD', Sample, Config, PolCorrUD, PolCorrUD_Unc, QValues_All, GeneralMaskWSolenoid)
+                        ASCIIlike_Output('PolCorrSumAllCS', Sample, Config, UnpolEquiv, UnpolEquiv_Unc, QValues_All, GeneralMaskWSolenoid)
+                    elif FullPolGo >= 1 and FullPolGo < 2:
+                        ASCIIlike_Output('He3CorrUU', Sample, Config, PolCorrUU, PolCorrUU_Unc, QValues_All, GeneralMaskWSolenoid)
+                        ASCIIlike_Output('He3CorrDU', Sample, Config, PolCorrDU, PolCorrDU_Unc, QValues_All, GeneralMaskWSolenoid)
+                        ASCIIlike_Output('He3CorrDD', Sample, Config, PolCorrDD, PolCorrDD_Unc, QValues_All, GeneralMaskWSolenoid)
+                        ASCIIlike_Output('He3CorrUD', Sample, Config, PolCorrUD, PolCorrUD_Unc, QValues_All, GeneralMaskWSolenoid)
+                        ASCIIlike_Output('He3CorrSumAllCS', Sample, Config, UnpolEquiv, UnpolEquiv_Unc, QValues_All, GeneralMaskWSolenoid)
+                    else:
+                        ASCIIlike_Output('NotCorrUU', Sample, Config, UUScaledData, UUScaledData_Unc, QValues_All, GeneralMaskWSolenoid)
+                        ASCIIlike_Output('NotCorrDU', Sample, Config, DUScaledData, DUScaledData_Unc, QValues_All, GeneralMaskWSolenoid)
+                        ASCIIlike_Output('NotCorrDD', Sample, Config, DDScaledData, DDScaledData_Unc, QValues_All, GeneralMaskWSolenoid)
+                        ASCIIlike_Output('NotCorrUD', Sample, Config, UDScaledData, UDScaledData_Unc, QValues_All, GeneralMaskWSolenoid)
+
+                FullPolCuts = vSANS_FullPolSlices(AverageQRanges, FullPolGo, Sample, Config, InPlaneAngleMap, Q_min, Q_max, Q_bins, QValues_All, GeneralMaskWSolenoid, PolCorrUU, PolCorrUU_Unc, PolCorrDU, PolCorrDU_Unc, PolCorrDD, PolCorrDD_Unc, PolCorrUD, PolCorrUD_Unc)
+                VSANS_SaveIncrementalSlices('FullPol', Sample, Config, Fingerprint, FullPolCuts)
+        else:
+            #The half-pol and unpolarized slices below use this Q map, as they would after a full reduction
+            representative_filenumber = ScattCatalog[Sample]['Config(s)'][Config]['UU'][0]
+            Qx, Qy, Qz, Q_total, Q_perp_unc, Q_parl_unc, InPlaneAngleMap, dimXX, dimYY, Shadow_Mask = QCalculation_AllDetectors(representative_filenumber, Config)
+            QValues_All = {'QX':Qx,'QY':Qy,'QZ':Qz,'Q_total':Q_total,'Q_perp_unc':Q_perp_unc,'Q_parl_unc':Q_parl_unc}
+
+        Fingerprint = VSANS_IncrementalFingerprint('HalfPol', ['U', 'D'], Sample, Config, [Configs[Config], representative_filenumber], BBList, ScattCatalog, TransCatalog, Pol_TransCatalog, HE3_Cell_Summary, Truest_PSM, Plex_Name, Mask_Record)
+        HalfPolCuts = VSANS_LoadIncrementalSlices('HalfPol', Sample, Config, Fingerprint)
+        if HalfPolCuts is None:
+            UScaledData, UScaledData_Unc = AbsScale('U', Sample, Config, BB_per_second, Solid_Angle, Plex, ScattCatalog, TransCatalog)
+            DScaledData, DScaledData_Unc = AbsScale('D', Sample, Config, BB_per_second, Solid_Angle, Plex, ScattCatalog, TransCatalog)
+            if 'NA' not in UScaledData and 'NA' not in DScaledData:
+                if YesNo_2DCombinedFiles > 0:
+                    representative_filenumber = Scatt[Sample]['Config(s)'][Config]['U'][0]
+                    Qx, Qy, Qz, Q_total, Q_perp_unc, Q_parl_unc, InPlaneAngleMap, dimXX, dimYY, Shadow_Mask = QCalculation_AllDetectors(representative_filenumber, Config)
+                    QValues_All = {'QX':Qx,'QY':Qy,'QZ':Qz,'Q_total':Q_total,'Q_perp_unc':Q_perp_unc,'Q_parl_unc':Q_parl_unc}
+                    ASCIIlike_Output('U', Sample, Config, UScaledData, UScaledData_Unc, QValues_All, GeneralMaskWOSolenoid)
+                    ASCIIlike_Output('D', Sample, Config, DScaledData, DScaledData_Unc, QValues_All, GeneralMaskWOSolenoid)
+                    ASCIIlike_Output('DMinusU', Sample, Config, DiffData, DiffData_Unc, QValues_All, GeneralMaskWOSolenoid)
+                    ASCIIlike_Output('DPlusU', Sample, Config, SumData, SumData_Unc, QValues_All, GeneralMaskWOSolenoid)
+                HalfPolCuts = vSANS_HalfPolSlices(AverageQRanges, 'HalfPol', Sample, Config, InPlaneAngleMap, Q_min, Q_max, Q_bins, QValues_All, GeneralMaskWSolenoid, UScaledData, UScaledData_Unc, DScaledData, DScaledData_Unc)
+                VSANS_SaveIncrementalSlices('HalfPol', Sample, Config, Fingerprint, HalfPolCuts)
+        elif YesNo_2DCombinedFiles > 0:
+            representative_filenumber = ScattCatalog[Sample]['Config(s)'][Config]['U'][0]
+
+        Fingerprint = VSANS_IncrementalFingerprint('Unpol', ['Unpol'], Sample, Config, [Configs[Config], representative_filenumber], BBList, ScattCatalog, TransCatalog, Pol_TransCatalog, HE3_Cell_Summary, Truest_PSM, Plex_Name, Mask_Record)
+        UnpolCuts = VSANS_LoadIncrementalSlices('Unpol', Sample, Config, Fingerprint)
+        if UnpolCuts is None:
+            UnpolScaledData, UnpolScaledData_Unc = AbsScale('Unpol', Sample, Config, BB_per_second, Solid_Angle, Plex, ScattCatalog, TransCatalog)
+            if 'NA' not in UnpolScaledData:
+                if YesNo_2DCombinedFiles > 0:
+                    representative_filenumber = ScattCatalog[Sample]['Config(s)'][Config]['Unpol'][0]
+                    Qx, Qy, Qz, Q_total, Q_perp_unc, Q_parl_unc, InPlaneAngleMap, dimXX, dimYY, Shadow_Mask = QCalculation_AllDetectors(representative_filenumber, Config)
+                    QValues_All = {'QX':Qx,'QY':Qy,'QZ':Qz,'Q_total':Q_total,'Q_perp_unc':Q_perp_unc,'Q_parl_unc':Q_parl_unc}
+                    ASCIIlike_Output('Unpol', Sample, Config, UnpolScaledData, UnpolScaledData_Unc, QValues_All, GeneralMaskWOSolenoid)
+                UnpolCuts = vSANS_UnpolSlices(AverageQRanges, 'Unpol', Sample, Config, InPlaneAngleMap, Q_min, Q_max, Q_bins, QValues_All, GeneralMaskWSolenoid, UnpolScaledData, UnpolScaledData_Unc)
+                VSANS_SaveIncrementalSlices('Unpol', Sample, Config, Fingerprint, UnpolCuts)
+        elif YesNo_2DCombinedFiles > 0:
+            representative_filenumber = ScattCatalog[Sample]['Config(s)'][Config]['Unpol'][0]
+
+    return FullPolCuts, HalfPolCuts, UnpolCuts, representative_filenumber
+
+def vSANS_NextQFile(Sample, Config, Q_filenumber):
+    #The file whose Q map vSANS_ReduceSample leaves behind for the next sample, worked out from the catalogue alone so that
+    #parallel work units start from the same Q map as they would in the serial loop.
+    if Sample in ScattCatalog and Config in ScattCatalog[Sample]['Config(s)']:
+        if str(ScattCatalog[Sample]['Intent']).find('Sample') != -1 or str(ScattCatalog[Sample]['Intent']).find('Empty') != -1:
+            Entry = ScattCatalog[Sample]['Config(s)'][Config]
+            if 'NA' not in Entry['UU'] and 'NA' not in Entry['DU'] and 'NA' not in Entry['DD'] and 'NA' not in Entry['UD']:
+                Q_filenumber = Entry['UU'][0]
+            if YesNo_2DCombinedFiles > 0:
+                if 'NA' not in Entry['U'] and 'NA' not in Entry['D']:
+                    Q_filenumber = Entry['U'][0]
+                if 'NA' not in Entry['Unpol']:
+                    Q_filenumber = Entry['Unpol'][0]
+    return Q_filenumber
+
+#Globals set by reduce() that vSANS_ReduceSample reads, besides the settings; spawned workers are given them by vSANS_InitWorker
+Worker_Globals = ['UseIncrementalReduction', 'HDF5Output_Run', 'Configs', 'Config', 'ConfigSetups', 'ScattCatalog', 'TransCatalog', 'Pol_TransCatalog',
+                  'AlignDet_TransCatalog', 'HE3_Cell_Summary', 'Truest_PSM', 'Plex_Name', 'Plex', 'Mask_Record', 'representative_filenumber',
+                  'incremental_hashes']
+
+def vSANS_WorkerContext():
+    #Forked workers inherit the parent's state for free, but fork is only safe on Linux (macOS system libraries may deadlock in a
+    #forked child and Windows has no fork); elsewhere the workers are spawned and vSANS_InitWorker hands them the state instead.
+    if sys.platform.startswith('linux'):
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context('spawn')
+
+def vSANS_InitWorker(State = None):
+    #Forked workers must not share the parent's HDF5 file handles, so each worker reopens the files it needs.
+    #Spawned workers start from the module defaults and are given the settings and Worker_Globals in State.
+    file_objects.clear()
+    if State is not None:
+        globals().update(State)
+    return
+
+def vSANS_ReduceSampleWorker(Sample, Config, Q_filenumber):
+    #Runs in a worker process set up by vSANS_InitWorker; returns the cuts, the incremental counts and only the
+    #incremental_hashes entries this work unit added or changed.
+    Reused = incremental_stats['Reused']
+    Reduced = incremental_stats['Reduced']
+    Known_Hashes = dict(incremental_hashes)
+    try:
+        Cuts = vSANS_ReduceSample(Sample, Config, Q_filenumber, ConfigSetups[Config])
+    finally:
+        VSANS_RenderQueuedFigures(1)
+    Hashes = {fullpath : entry for fullpath, entry in incremental_hashes.items() if Known_Hashes.get(fullpath) != entry}
+    return Cuts, incremental_stats['Reused'] - Reused, incremental_stats['Reduced'] - Reduced, Hashes
+
+def vSANS_ReduceWorkUnits(WorkUnits, ConfigSetups):
+    #Uses vSANS_ReduceSample(Sample, Config, Q_filenumber, Setup)
+    #WorkUnits is a list of (Config, Sample) pairs in serial order. With ParallelWorkers > 1 (or 0 for one per CPU core) they are
+    #spread over a process pool; results are collected in the order of WorkUnits so the output does not depend on scheduling.
+    #Returns {(Config, Sample) : (FullPolCuts, HalfPolCuts, UnpolCuts)}
+
+    Q_filenumbers = []
+    Previous_Config = None
+    for Config, Sample in WorkUnits:
+        if Config != Previous_Config:
+            Q_filenumber = Configs[Config]
+            Previous_Config = Config
+        Q_filenumbers.append(Q_filenumber)
+        Q_filenumber = vSANS_NextQFile(Sample, Config, Q_filenumber)
+
+    Workers = int(ParallelWorkers)
+    if Workers == 0:
+        Workers = os.cpu_count()
+
+    SampleCuts = {}
+    if Workers > 1 and len(WorkUnits) > 1:
+        print('Reducing', len(WorkUnits), '(configuration, sample) pairs with', Workers, 'worker processes')
+        Context = vSANS_WorkerContext()
+        State = None
+        if Context.get_start_method() != 'fork':
+            State = {Name : globals()[Name] for Name in list(Default_Settings) + Required_Settings + Worker_Globals}
+        with ProcessPoolExecutor(max_workers=Workers, mp_context=Context, initializer=vSANS_InitWorker, initargs=(State,)) as executor:
+            futures = [executor.submit(vSANS_ReduceSampleWorker, Sample, Config, Q_filenumber) for (Config, Sample), Q_filenumber in zip(WorkUnits, Q_filenumbers)]
+            for (Config, Sample), future in zip(WorkUnits, futures):
+                Cuts, Reused, Reduced, Hashes = future.result()
+                SampleCuts[(Config, Sample)] = Cuts[:3]
+                incremental_stats['Reused'] += Reused
+                incremental_stats['Reduced'] += Reduced
+                incremental_hashes.update(Hashes)
+    else:
+        for (Config, Sample), Q_filenumber in zip(WorkUnits, Q_filenumbers):
+            Cuts = vSANS_ReduceSample(Sample, Config, Q_filenumber, ConfigSetups[Config])
+            SampleCuts[(Config, Sample)] = Cuts[:3]
+
+    return SampleCuts
+
+def VSANS_DataFolderSnapshot(data_path):
+    #{filename : (size, modification time)} of the data (.nxs.ngv) and PLEX files in data_path
+    Snapshot = {}
+    for filename in os.listdir(data_path):
+        if filename.endswith(".nxs.ngv") or filename.startswith("PLEX"):
+            try:
+                file_stat = os.stat(os.path.join(data_path, filename))
+            except OSError:
+                continue
+            Snapshot[filename] = (file_stat.st_size, file_stat.st_mtime)
+    return Snapshot
+
+def VSANS_WaitForNewData(Previous):
+    #Uses VSANS_DataFolderSnapshot(input_path)
+    #Polls input_path every LivePollSeconds until its files differ from Previous and then stay the same for one more poll
+    #(so a run that is still being written is not read half finished). Returns the new snapshot and the file numbers of
+    #data files that were rewritten (new files need no clean-up), or None, None when interrupted with Ctrl-C.
+    print('Live reduction: watching', input_path, 'for new data (Ctrl-C to stop)...')
+    try:
+        Current = VSANS_DataFolderSnapshot(input_path)
+        while True:
+            time.sleep(LivePollSeconds)
+            Latest = VSANS_DataFolderSnapshot(input_path)
+            if Latest == Current and Latest != Previous:
+                break
+            Current = Latest
+    except KeyboardInterrupt:
+        return None, None
+    Changed = [filename for filename in Current if filename in Previous and Current[filename] != Previous[filename]]
+    print('Live reduction:', len([filename for filename in Current if filename not in Previous]), 'new and', len(Changed), 'changed files')
+    Rewritten = [int(filename[4:9]) for filename in Changed if filename.endswith(".nxs.ngv")]
+    return Current, Rewritten
+
 #*************************************************
 #***        Start of 'The Program'             ***
 #*************************************************
-h = open("UserInput.py","r")
-if h.mode == "r":
-    Contents = h.read()
-    #print(contents)
-h.close()
-
-if not os.path.exists(save_path):
-    os.makedirs(save_path)
-
-'''System based on categorizing/grouping files:'''
-Sample_Names, Sample_Bases, Configs, BlockBeamCatalog, ScattCatalog, TransCatalog, Pol_TransCatalog, AlignDet_TransCatalog, HE3_TransCatalog, start_number, filenumberlisting = VSANS_SortDataAutomaticAlt(YesNoManualHe3Entry, New_HE3_Files, MuValues, TeValues)
-VSANS_ShareAlignDetTransCatalog(AlignDet_TransCatalog, ScattCatalog)
-VSANS_ShareSampleBaseTransCatalog(TransCatalog, ScattCatalog)
-VSANS_ShareEmptyPolBeamScattCatalog(ScattCatalog)
-VSANS_ProcessHe3TransCatalog(HE3_TransCatalog, BlockBeamCatalog, TransPanel)
-VSANS_ProcessPolTransCatalog(Pol_TransCatalog, BlockBeamCatalog, TransPanel)
-VSANS_ProcessTransCatalog(TransCatalog, BlockBeamCatalog, TransPanel)
-
-UserDefinedMasks, Mask_Record = ReadIn_IGORMasks(filenumberlisting)
-Plex_Name, Plex = Plex_File(start_number)
-HE3_Cell_Summary = HE3_DecayCurves(HE3_TransCatalog)
-vSANS_PolarizationSupermirrorAndFlipper(Pol_TransCatalog, HE3_Cell_Summary, UsePolCorr)
-Truest_PSM = vSANS_BestSuperMirrorPolarizationValue(PSM_Guess, YesNoBypassBestGuessPSM, Pol_TransCatalog)
-vSANS_Record_DataProcessing(Contents, Plex_Name, Mask_Record, ScattCatalog, BlockBeamCatalog, TransCatalog, Pol_TransCatalog, HE3_Cell_Summary)
-
-GeneralMaskWOSolenoid = {}
-GeneralMaskWSolenoid = {}
-QValues_All = {}
-for Config in Configs:
-    representative_filenumber = Configs[Config]
-    if representative_filenumber != 0: #and str(Config).find('CvB') != -1:
-        Solid_Angle = SolidAngle_AllDetectors(representative_filenumber, Config)
-        BBList = [0]
-        if Config in BlockBeamCatalog:
-            if 'NA' not in BlockBeamCatalog[Config]['Trans']['File']:
-                BBList = BlockBeamCatalog[Config]['Trans']['File']
-            elif 'NA' not in BlockBeamCatalog[Config]['Scatt']['File']:
-                BBList = BlockBeamCatalog[Config]['Scatt']['File']
-        BB_per_second, BBUnc_per_second = VSANS_BlockedBeamCountsPerSecond_ListOfFiles(BBList, Config, representative_filenumber)
-        Qx, Qy, Qz, Q_total, Q_perp_unc, Q_parl_unc, InPlaneAngleMap, dimXX, dimYY, Shadow_Mask = QCalculation_AllDetectors(representative_filenumber, Config)
-        QValues_All = {'QX':Qx,'QY':Qy,'QZ':Qz,'Q_total':Q_total,'Q_perp_unc':Q_perp_unc,'Q_parl_unc':Q_parl_unc}
-        Q_min, Q_max, Q_bins = MinMaxQ(Q_total, Config)
+Last_Reduction = {'input_path' : None, 'Snapshot' : {}}
+
+def VSANS_ApplySettings(Settings):
+    #Installs the values in Settings (a ReductionSettings) as the module globals read by the functions above.
+    #Data files held in memory are forgotten if input_path changed or if they were rewritten since the last reduction.
+    global UseIncrementalReduction
+    Missing = Settings.Missing()
+    if len(Missing) > 0:
+        raise ValueError('ReductionSettings is missing ' + ', '.join(Missing))
+    if Settings.HighResRebin not in HighRes_Levels:
+        raise ValueError('HighResRebin must be one of ' + ', '.join(str(Level) for Level in HighRes_Levels))
+    if Settings.SinglePrecision not in (0, 1):
+        raise ValueError('SinglePrecision must be 0 or 1')
+    globals().update(Settings.Values)
+    if LiveReduction > 0:
+        UseIncrementalReduction = 1
+
+    Snapshot = VSANS_DataFolderSnapshot(input_path)
+    if Last_Reduction['input_path'] != input_path:
+        forget_all_files()
+    else:
+        for filename in Last_Reduction['Snapshot']:
+            if filename.endswith(".nxs.ngv") and Snapshot.get(filename) != Last_Reduction['Snapshot'][filename]:
+                forget_file(int(filename[4:9]))
+    Last_Reduction['input_path'] = input_path
+    Last_Reduction['Snapshot'] = Snapshot
+    return Snapshot
+
+def reduce(Settings):
+    '''
+    Runs the reduction described by Settings (a ReductionSettings) and returns {Config : {'FullPol' : FullPolResults,
+    'HalfPol' : HalfPolResults, 'Unpol' : UnpolResults}}. With LiveReduction = 1 it only returns once interrupted (Ctrl+C).
+    The module caches (open files, panel arrays, geometry, transmissions, He3 fits, masks) are kept between calls, so
+    later reductions of the same data are faster; call close_all_files() when done. Plots queued before an error or
+    interruption are still saved.
+    '''
+    try:
+        return vSANS_ReducePasses(Settings)
+    finally:
+        VSANS_RenderQueuedFigures()
+
+def vSANS_ReducePasses(Settings):
+    #Uses VSANS_ApplySettings(Settings) and runs one reduction pass over the data folder, then (LiveReduction = 1) one more
+    #each time VSANS_WaitForNewData reports new or rewritten files; returns the results of the last pass.
+    #The functions above also read these as globals
+    global Configs, Config, ConfigSetups, ScattCatalog, TransCatalog, Pol_TransCatalog, AlignDet_TransCatalog, HE3_Cell_Summary
+    global Truest_PSM, Plex_Name, Plex, Mask_Record, representative_filenumber, HDF5Output_Run
+
+    Live_Snapshot = VSANS_ApplySettings(Settings)
+    Contents = Settings.Record()
+
+    if not os.path.exists(save_path):
+        os.makedirs(save_path)
+
+    while True:
+        incremental_stats['Reused'] = 0
+        incremental_stats['Reduced'] = 0
+        HDF5Output_Run = datetime.datetime.now().isoformat() #each pass rewrites the HDF5 file headers once
+        Results = {}
+        '''System based on categorizing/grouping files:'''
+        Sample_Names, Sample_Bases, Configs, BlockBeamCatalog, ScattCatalog, TransCatalog, Pol_TransCatalog, AlignDet_TransCatalog, HE3_TransCatalog, start_number, filenumberlisting = VSANS_SortDataAutomaticAlt(YesNoManualHe3Entry, New_HE3_Files, MuValues, TeValues)
+        VSANS_ShareAlignDetTransCatalog(AlignDet_TransCatalog, ScattCatalog)
+        VSANS_ShareSampleBaseTransCatalog(TransCatalog, ScattCatalog)
+        VSANS_ShareEmptyPolBeamScattCatalog(ScattCatalog)
+        VSANS_ProcessHe3TransCatalog(HE3_TransCatalog, BlockBeamCatalog, TransPanel)
+        VSANS_ProcessPolTransCatalog(Pol_TransCatalog, BlockBeamCatalog, TransPanel)
+        VSANS_ProcessTransCatalog(TransCatalog, BlockBeamCatalog, TransPanel)
+
+        UserDefinedMasks, Mask_Record = ReadIn_IGORMasks(filenumberlisting)
+        Plex_Name, Plex = Plex_File(start_number)
+        HE3_Cell_Summary = HE3_DecayCurves(HE3_TransCatalog)
+        vSANS_PolarizationSupermirrorAndFlipper(Pol_TransCatalog, HE3_Cell_Summary, UsePolCorr)
+        Truest_PSM = vSANS_BestSuperMirrorPolarizationValue(PSM_Guess, YesNoBypassBestGuessPSM, Pol_TransCatalog)
+        vSANS_Record_DataProcessing(Contents, Plex_Name, Mask_Record, ScattCatalog, BlockBeamCatalog, TransCatalog, Pol_TransCatalog, HE3_Cell_Summary)
+        VSANS_LoadIncrementalHashes()
+
+        ConfigSetups = {}
+        GeneralMaskWOSolenoid = {}
+        GeneralMaskWSolenoid = {}
+        for Config in Configs:
+            representative_filenumber = Configs[Config]
+            if representative_filenumber != 0: #and str(Config).find('CvB') != -1:
+                Solid_Angle = SolidAngle_AllDetectors(representative_filenumber, Config)
+                BBList = VSANS_BlockBeamList(Config, BlockBeamCatalog)
+                BB_per_second, BBUnc_per_second = VSANS_BlockedBeamCountsPerSecond_ListOfFiles(BBList, Config, representative_filenumber)
+                Qx, Qy, Qz, Q_total, Q_perp_unc, Q_parl_unc, InPlaneAngleMap, dimXX, dimYY, Shadow_Mask = QCalculation_AllDetectors(representative_filenumber, Config)
+                Q_min, Q_max, Q_bins = MinMaxQ(Q_total, Config)
                     
-        relevant_detectors = short_detectors
-        if str(Config).find('CvB') != -1:
-            relevant_detectors = all_detectors
+                relevant_detectors = short_detectors
+                if str(Config).find('CvB') != -1:
+                    relevant_detectors = all_detectors
             
-        for dshort in relevant_detectors:
-            GeneralMaskWOSolenoid[dshort] = Shadow_Mask[dshort]
-            GeneralMaskWSolenoid[dshort] = Shadow_Mask[dshort]
-        if Config in UserDefinedMasks:
-            if 'NA' not in UserDefinedMasks[Config]['Scatt_WithSolenoid']:
-                for dshort in relevant_detectors:
-                    GeneralMaskWSolenoid[dshort] = Shadow_Mask[dshort]*UserDefinedMasks[Config]['Scatt_WithSolenoid'][dshort]          
-            if 'NA' not in UserDefinedMasks[Config]['Scatt_Standard']:
                 for dshort in relevant_detectors:
-                    GeneralMaskWOSolenoid[dshort] = Shadow_Mask[dshort]*UserDefinedMasks[Config]['Scatt_Standard'][dshort]
-                        
-
-        FullPolSampleSlices = {}
-        FullPolEmptySlices = {}
-        HalfPolSampleSlices = {}
-        HalfPolEmptySlices = {}
-        UnpolSampleSlices = {}
-        UnpolEmptySlices = {}
-        for Sample in Sample_Names:
-            if Sample in ScattCatalog:
-                VSANS_GetBeamCenterForScattFile(Sample, Config, AlignDet_TransCatalog)
-                                            
-                if str(ScattCatalog[Sample]['Intent']).find('Sample') != -1 or str(ScattCatalog[Sample]['Intent']).find('Empty') != -1:
-
-                    UUScaledData, UUScaledData_Unc = AbsScale('UU', Sample, Config, BB_per_second, Solid_Angle, Plex, ScattCatalog, TransCatalog)
-                    DUScaledData, DUScaledData_Unc = AbsScale('DU', Sample, Config, BB_per_second, Solid_Angle, Plex, ScattCatalog, TransCatalog)
-                    DDScaledData, DDScaledData_Unc = AbsScale('DD', Sample, Config, BB_per_second, Solid_Angle, Plex, ScattCatalog, TransCatalog)
-                    UDScaledData, UDScaledData_Unc = AbsScale('UD', Sample, Config, BB_per_second, Solid_Angle, Plex, ScattCatalog, TransCatalog)
-                    FullPolGo = 0
-                    if 'NA' not in UUScaledData and 'NA' not in DUScaledData and 'NA' not in DDScaledData and 'NA' not in UDScaledData:
-
+                    GeneralMaskWOSolenoid[dshort] = Shadow_Mask[dshort]
+                    GeneralMaskWSolenoid[dshort] = Shadow_Mask[dshort]
+                if Config in UserDefinedMasks:
+                    if 'NA' not in UserDefinedMasks[Config]['Scatt_WithSolenoid']:
+                        for dshort in relevant_detectors:
+                            GeneralMaskWSolenoid[dshort] = Shadow_Mask[dshort]*UserDefinedMasks[Config]['Scatt_WithSolenoid'][dshort]          
+                    if 'NA' not in UserDefinedMasks[Config]['Scatt_Standard']:
+                        for dshort in relevant_detectors:
+                            GeneralMaskWOSolenoid[dshort] = Shadow_Mask[dshort]*UserDefinedMasks[Config]['Scatt_Standard'][dshort]
+
+                if SinglePrecision >= 1:
+                    for dshort in relevant_detectors:
+                        GeneralMaskWSolenoid[dshort] = (GeneralMaskWSolenoid[dshort] > 0).astype(np.uint8)
+                        GeneralMaskWOSolenoid[dshort] = (GeneralMaskWOSolenoid[dshort] > 0).astype(np.uint8)
+
+                ConfigSetups[Config] = {'BBList' : BBList, 'BB_per_second' : BB_per_second, 'Solid_Angle' : Solid_Angle, 'Q_min' : Q_min, 'Q_max' : Q_max, 'Q_bins' : Q_bins,
+                                        'GeneralMaskWSolenoid' : dict(GeneralMaskWSolenoid), 'GeneralMaskWOSolenoid' : dict(GeneralMaskWOSolenoid)}
+
+        WorkUnits = [(Config, Sample) for Config in ConfigSetups for Sample in Sample_Names if Sample in ScattCatalog]
+        SampleCuts = vSANS_ReduceWorkUnits(WorkUnits, ConfigSetups)
+
+        for Config in Configs:
+            if Config in ConfigSetups:
+                FullPolSampleSlices = {}
+                FullPolEmptySlices = {}
+                HalfPolSampleSlices = {}
+                HalfPolEmptySlices = {}
+                UnpolSampleSlices = {}
+                UnpolEmptySlices = {}
+                for Sample in Sample_Names:
+                    if (Config, Sample) in SampleCuts:
+                        FullPolCuts, HalfPolCuts, UnpolCuts = SampleCuts[(Config, Sample)]
+                        if FullPolCuts is not None:
+                            if str(ScattCatalog[Sample]['Intent']).find('Sample') != -1:
+                                FullPolSampleSlices[Sample] = FullPolCuts
+                            if str(ScattCatalog[Sample]['Intent']).find('Empty') != -1:
+                                FullPolEmptySlices['Empty'] = FullPolCuts
+                        if HalfPolCuts is not None:
+                            if str(ScattCatalog[Sample]['Intent']).find('Sample') != -1:
+                                HalfPolSampleSlices[Sample] = HalfPolCuts
+                            if str(ScattCatalog[Sample]['Intent']).find('Empty') != -1:
+                                HalfPolEmptySlices['Empty'] = HalfPolCuts
+                        if UnpolCuts is not None:
+                            if str(ScattCatalog[Sample]['Intent']).find('Sample') != -1:
+                                UnpolSampleSlices[Sample] = UnpolCuts
+                            if str(ScattCatalog[Sample]['Intent']).find('Empty') != -1:
+                                UnpolEmptySlices['Empty'] = UnpolCuts
+
+
+                #Catergorize Samples and Sample Bases
+                FullPol_BaseToSampleMap = {}
+                for Base in Sample_Bases:
+                    for Sample in Sample_Names:
+                        if str(Sample).find(Base) != -1:
+                            if Sample in ScattCatalog:                
+                                if str(ScattCatalog[Sample]['Intent']).find('Sample') != -1:
+                                    if Sample in FullPolSampleSlices:
+                                        if Base not in FullPol_BaseToSampleMap:
+                                            FullPol_BaseToSampleMap[Base] = [Sample]
+                                        else:
+                                            FullPol_BaseToSampleMap[Base].append(Sample)
+                HalfPol_BaseToSampleMap = {}
+                for Base in Sample_Bases:
+                    for Sample in Sample_Names:
+                        if str(Sample).find(Base) != -1:
+                            if Sample in ScattCatalog:                
+                                if str(ScattCatalog[Sample]['Intent']).find('Sample') != -1:
+                                    if Sample in HalfPolSampleSlices:
+                                        if Base not in HalfPol_BaseToSampleMap:
+                                            HalfPol_BaseToSampleMap[Base] = [Sample]
+                                        else:
+                                            HalfPol_BaseToSampleMap[Base].append(Sample)
+                Unpol_BaseToSampleMap = {}
+                for Base in Sample_Bases:
+                    for Sample in Sample_Names:
+                        if str(Sample).find(Base) != -1:
+                            if Sample in ScattCatalog:                
+                                if str(ScattCatalog[Sample]['Intent']).find('Sample') != -1:
+                                    if Sample in UnpolSampleSlices:
+                                        if Base not in Unpol_BaseToSampleMap:
+                                            Unpol_BaseToSampleMap[Base] = [Sample]
+                                        else:
+                                            Unpol_BaseToSampleMap[Base].append(Sample)
                         
-                        representative_filenumber = ScattCatalog[Sample]['Config(s)'][Config]['UU'][0]
-                        Qx, Qy, Qz, Q_total, Q_perp_unc, Q_parl_unc, InPlaneAngleMap, dimXX, dimYY, Shadow_Mask = QCalculation_AllDetectors(representative_filenumber, Config)
-                        QValues_All = {'QX':Qx,'QY':Qy,'QZ':Qz,'Q_total':Q_total,'Q_perp_unc':Q_perp_unc,'Q_parl_unc':Q_parl_unc}
-                        FullPolGo, PolCorrUU, PolCorrDU, PolCorrDD, PolCorrUD, PolCorrUU_Unc, PolCorrDU_Unc, PolCorrDD_Unc, PolCorrUD_Unc = vSANS_PolCorrScattFiles(Truest_PSM, dimXX, dimYY, Sample, Config, ScattCatalog, TransCatalog, Pol_TransCatalog, UUScaledData, DUScaledData, DDScaledData, UDScaledData, UUScaledData_Unc, DUScaledData_Unc, DDScaledData_Unc, UDScaledData_Unc)
-
-                        if YesNo_2DCombinedFiles > 0:
-                            if FullPolGo >= 2:
-                                ASCIIlike_Output('PolCorrUU', Sample, Config, PolCorrUU, PolCorrUU_Unc, QValues_All, GeneralMaskWSolenoid)
-                                ASCIIlike_Output('PolCorrDU', Sample, Config, PolCorrDU, PolCorrDU_Unc, QValues_All, GeneralMaskWSolenoid)
-                                ASCIIlike_Output('PolCorrDD', Sample, Config, PolCorrDD, PolCorrDD_Unc, QValues_All, GeneralMaskWSolenoid)
-                                ASCIIlike_Output('PolCorrUD', Sample, Config, PolCorrUD, PolCorrUD_Unc, QValues_All, GeneralMaskWSolenoid)
-                                ASCIIlike_Output('PolCorrSumAllCS', Sample, Config, UnpolEquiv, UnpolEquiv_Unc, QValues_All, GeneralMaskWSolenoid)
-                            elif FullPolGo >= 1 and FullPolGo < 2:
-                                ASCIIlike_Output('He3CorrUU', Sample, Config, PolCorrUU, PolCorrUU_Unc, QValues_All, GeneralMaskWSolenoid)
-                                ASCIIlike_Output('He3CorrDU', Sample, Config, PolCorrDU, PolCorrDU_Unc, QValues_All, GeneralMaskWSolenoid)
-                                ASCIIlike_Output('He3CorrDD', Sample, Config, PolCorrDD, PolCorrDD_Unc, QValues_All, GeneralMaskWSolenoid)
-                                ASCIIlike_Output('He3CorrUD', Sample, Config, PolCorrUD, PolCorrUD_Unc, QValues_All, GeneralMaskWSolenoid)
-                                ASCIIlike_Output('He3CorrSumAllCS', Sample, Config, UnpolEquiv, UnpolEquiv_Unc, QValues_All, GeneralMaskWSolenoid)
-                            else:
-                                ASCIIlike_Output('NotCorrUU', Sample, Config, UUScaledData, UUScaledData_Unc, QValues_All, GeneralMaskWSolenoid)
-                                ASCIIlike_Output('NotCorrDU', Sample, Config, DUScaledData, DUScaledData_Unc, QValues_All, GeneralMaskWSolenoid)
-                                ASCIIlike_Output('NotCorrDD', Sample, Config, DDScaledData, DDScaledData_Unc, QValues_All, GeneralMaskWSolenoid)
-                                ASCIIlike_Output('NotCorrUD', Sample, Config, UDScaledData, UDScaledData_Unc, QValues_All, GeneralMaskWSolenoid)
-
-                        if str(ScattCatalog[Sample]['Intent']).find('Sample') != -1:
-                            FullPolSampleSlices[Sample] = vSANS_FullPolSlices(AverageQRanges, FullPolGo, Sample, Config, InPlaneAngleMap, Q_min, Q_max, Q_bins, QValues_All, GeneralMaskWSolenoid, PolCorrUU, PolCorrUU_Unc, PolCorrDU, PolCorrDU_Unc, PolCorrDD, PolCorrDD_Unc, PolCorrUD, PolCorrUD_Unc)
-                        if str(ScattCatalog[Sample]['Intent']).find('Empty') != -1:
-                            FullPolEmptySlices['Empty'] = vSANS_FullPolSlices(AverageQRanges, FullPolGo, Sample, Config, InPlaneAngleMap, Q_min, Q_max, Q_bins, QValues_All, GeneralMaskWSolenoid, PolCorrUU, PolCorrUU_Unc, PolCorrDU, PolCorrDU_Unc, PolCorrDD, PolCorrDD_Unc, PolCorrUD, PolCorrUD_Unc)
-                    
-                    UScaledData, UScaledData_Unc = AbsScale('U', Sample, Config, BB_per_second, Solid_Angle, Plex, ScattCatalog, TransCatalog)
-                    DScaledData, DScaledData_Unc = AbsScale('D', Sample, Config, BB_per_second, Solid_Angle, Plex, ScattCatalog, TransCatalog)
-                    if 'NA' not in UScaledData and 'NA' not in DScaledData:
-                        if YesNo_2DCombinedFiles > 0:
-                            representative_filenumber = Scatt[Sample]['Config(s)'][Config]['U'][0]
-                            Qx, Qy, Qz, Q_total, Q_perp_unc, Q_parl_unc, InPlaneAngleMap, dimXX, dimYY, Shadow_Mask = QCalculation_AllDetectors(representative_filenumber, Config)
-                            QValues_All = {'QX':Qx,'QY':Qy,'QZ':Qz,'Q_total':Q_total,'Q_perp_unc':Q_perp_unc,'Q_parl_unc':Q_parl_unc}
-                            ASCIIlike_Output('U', Sample, Config, UScaledData, UScaledData_Unc, QValues_All, GeneralMaskWOSolenoid)
-                            ASCIIlike_Output('D', Sample, Config, DScaledData, DScaledData_Unc, QValues_All, GeneralMaskWOSolenoid)
-                            ASCIIlike_Output('DMinusU', Sample, Config, DiffData, DiffData_Unc, QValues_All, GeneralMaskWOSolenoid)
-                            ASCIIlike_Output('DPlusU', Sample, Config, SumData, SumData_Unc, QValues_All, GeneralMaskWOSolenoid)
-                        if str(ScattCatalog[Sample]['Intent']).find('Sample') != -1:
-                            HalfPolSampleSlices[Sample] = vSANS_HalfPolSlices(AverageQRanges, 'HalfPol', Sample, Config, InPlaneAngleMap, Q_min, Q_max, Q_bins, QValues_All, GeneralMaskWSolenoid, UScaledData, UScaledData_Unc, DScaledData, DScaledData_Unc)
-                        if str(ScattCatalog[Sample]['Intent']).find('Empty') != -1:
-                            HalfPolEmptySlices['Empty'] = vSANS_HalfPolSlices(AverageQRanges, 'HalfPol', Sample, Config, InPlaneAngleMap, Q_min, Q_max, Q_bins, QValues_All, GeneralMaskWSolenoid, UScaledData, UScaledData_Unc, DScaledData, DScaledData_Unc)
-
-                    UnpolScaledData, UnpolScaledData_Unc = AbsScale('Unpol', Sample, Config, BB_per_second, Solid_Angle, Plex, ScattCatalog, TransCatalog)
-                    if 'NA' not in UnpolScaledData:
-                        if YesNo_2DCombinedFiles > 0:
-                            representative_filenumber = ScattCatalog[Sample]['Config(s)'][Config]['Unpol'][0]
-                            Qx, Qy, Qz, Q_total, Q_perp_unc, Q_parl_unc, InPlaneAngleMap, dimXX, dimYY, Shadow_Mask = QCalculation_AllDetectors(representative_filenumber, Config)
-                            QValues_All = {'QX':Qx,'QY':Qy,'QZ':Qz,'Q_total':Q_total,'Q_perp_unc':Q_perp_unc,'Q_parl_unc':Q_parl_unc}
-                            ASCIIlike_Output('Unpol', Sample, Config, UnpolScaledData, UnpolScaledData_Unc, QValues_All, GeneralMaskWOSolenoid)
-                        if str(ScattCatalog[Sample]['Intent']).find('Sample') != -1:
-                            UnpolSampleSlices[Sample] = vSANS_UnpolSlices(AverageQRanges, 'Unpol', Sample, Config, InPlaneAngleMap, Q_min, Q_max, Q_bins, QValues_All, GeneralMaskWSolenoid, UnpolScaledData, UnpolScaledData_Unc)
-                        if str(ScattCatalog[Sample]['Intent']).find('Empty') != -1:
-                            UnpolEmptySlices['Empty'] = vSANS_UnpolSlices(AverageQRanges, 'Unpol', Sample, Config, InPlaneAngleMap, Q_min, Q_max, Q_bins, QValues_All, GeneralMaskWSolenoid, UnpolScaledData, UnpolScaledData_Unc)
-
-
-        #Catergorize Samples and Sample Bases
-        FullPol_BaseToSampleMap = {}
-        for Base in Sample_Bases:
-            for Sample in Sample_Names:
-                if str(Sample).find(Base) != -1:
+                print('Saving text files and data plots...')
+                FullPolResults = {}
+                Representative_FullPolSample = 'NA'
+                HalfPolResults = {}
+                Representative_HalfPolSample = 'NA'
+                UnpolResults = {}
+                Representative_UnpolSample = 'NA'
+                for Sample in Sample_Names:
                     if Sample in ScattCatalog:                
                         if str(ScattCatalog[Sample]['Intent']).find('Sample') != -1:
                             if Sample in FullPolSampleSlices:
-                                if Base not in FullPol_BaseToSampleMap:
-                                    FullPol_BaseToSampleMap[Base] = [Sample]
-                                else:
-                                    FullPol_BaseToSampleMap[Base].append(Sample)
-        HalfPol_BaseToSampleMap = {}
-        for Base in Sample_Bases:
-            for Sample in Sample_Names:
-                if str(Sample).find(Base) != -1:
-                    if Sample in ScattCatalog:                
-                        if str(ScattCatalog[Sample]['Intent']).find('Sample') != -1:
+                                Representative_FullPolSample = Sample
+                                FullPolResults[Sample] = vSANS_ProcessFullPolSlices(FullPolSampleSlices, Sample, FullPolEmptySlices)
                             if Sample in HalfPolSampleSlices:
-                                if Base not in HalfPol_BaseToSampleMap:
-                                    HalfPol_BaseToSampleMap[Base] = [Sample]
-                                else:
-                                    HalfPol_BaseToSampleMap[Base].append(Sample)
-        Unpol_BaseToSampleMap = {}
-        for Base in Sample_Bases:
-            for Sample in Sample_Names:
-                if str(Sample).find(Base) != -1:
-                    if Sample in ScattCatalog:                
-                        if str(ScattCatalog[Sample]['Intent']).find('Sample') != -1:
+                                Representative_HalfPolSample = Sample
+                                HalfPolResults[Sample] = vSANS_ProcessHalfPolSlices(HalfPolSampleSlices, Sample, HalfPolEmptySlices)
                             if Sample in UnpolSampleSlices:
-                                if Base not in Unpol_BaseToSampleMap:
-                                    Unpol_BaseToSampleMap[Base] = [Sample]
-                                else:
-                                    Unpol_BaseToSampleMap[Base].append(Sample)
-                        
-        print('Saving text files and data plots...')
-        FullPolResults = {}
-        Representative_FullPolSample = 'NA'
-        HalfPolResults = {}
-        Representative_HalfPolSample = 'NA'
-        UnpolResults = {}
-        Representative_UnpolSample = 'NA'
-        for Sample in Sample_Names:
-            if Sample in ScattCatalog:                
-                if str(ScattCatalog[Sample]['Intent']).find('Sample') != -1:
-                    if Sample in FullPolSampleSlices:
-                        Representative_FullPolSample = Sample
-                        FullPolResults[Sample] = vSANS_ProcessFullPolSlices(FullPolSampleSlices, Sample, FullPolEmptySlices)
-                    if Sample in HalfPolSampleSlices:
-                        Representative_HalfPolSample = Sample
-                        HalfPolResults[Sample] = vSANS_ProcessHalfPolSlices(HalfPolSampleSlices, Sample, HalfPolEmptySlices)
-                    if Sample in UnpolSampleSlices:
-                        Representative_UnpolSample = Sample
-                        UnpolResults[Sample] = vSANS_ProcessUnpolSlices(UnpolSampleSlices, Sample, UnpolEmptySlices)
-        if AutoSubtractEmpty == 0:
-            if 'Empty' in FullPolEmptySlices:
-                FullPolResults['Empty'] = vSANS_ProcessFullPolSlices(FullPolEmptySlices, 'Empty', FullPolEmptySlices)
-            if 'Empty' in HalfPolEmptySlices:
-                HalfPolResults['Empty'] = vSANS_ProcessHalfPolSlices(HalfPolEmptySlices, 'Empty', HalfPolEmptySlices)
-            if 'Empty' in UnpolEmptySlices:
-                UnpolResults['Empty'] = vSANS_ProcessUnpolSlices(UnpolEmptySlices, 'Empty', UnpolEmptySlices)
-
-        #Saving text files and data plots for similar bases, conditions, and cuts
-
-        CompareVariable = CompareFullPolSumCirc
-        CutVariable = 'Circ'
-        FullCutName = 'FullPolSumCirc'
-        BaseMap = FullPol_BaseToSampleMap
-        SampleSlices = FullPolSampleSlices
-        ResultsArray = FullPolResults
-        QName = 'QCirc'
-        IName = 'CircSum'
-        UncName = 'CircSum_Unc'
-        vSANS_Comparison_PlotsAndText(Config, CompareVariable, CutVariable, FullCutName, BaseMap, SampleSlices, ResultsArray, QName, IName, UncName)
-
-        CompareVariable = CompareHalfPolSumCirc
-        CutVariable = 'Circ'
-        FullCutName = 'HalfPolPolSumCirc'
-        BaseMap = HalfPol_BaseToSampleMap
-        SampleSlices = HalfPolSampleSlices
-        ResultsArray = HalfPolResults
-        QName = 'QCirc'
-        IName = 'CircSum'
-        UncName = 'CircSum_Unc'
-        vSANS_Comparison_PlotsAndText(Config, CompareVariable, CutVariable, FullCutName, BaseMap, SampleSlices, ResultsArray, QName, IName, UncName)
-
-
-        CompareVariable = CompareUnpolCirc
-        CutVariable = 'Circ'
-        FullCutName = 'UnpolCirc'
-        BaseMap = Unpol_BaseToSampleMap
-        SampleSlices = UnpolSampleSlices
-        ResultsArray = UnpolResults
-        QName = 'QCirc'
-        IName = 'CircSum'
-        UncName = 'CircSum_Unc'
-        vSANS_Comparison_PlotsAndText(Config, CompareVariable, CutVariable, FullCutName, BaseMap, SampleSlices, ResultsArray, QName, IName, UncName)
-
-
-        CompareVariable = CompareFullPolTypes
-        CutVariable = 'Horz'
-        FullCutName = 'FullPolNSFSum'
-        BaseMap = FullPol_BaseToSampleMap
-        SampleSlices = FullPolSampleSlices
-        ResultsArray = FullPolResults
-        QName = 'QHorz'
-        IName = 'HorzNSFSum'
-        UncName = 'HorzNSFSum_Unc'
-        vSANS_Comparison_PlotsAndText(Config, CompareVariable, CutVariable, FullCutName, BaseMap, SampleSlices, ResultsArray, QName, IName, UncName)
+                                Representative_UnpolSample = Sample
+                                UnpolResults[Sample] = vSANS_ProcessUnpolSlices(UnpolSampleSlices, Sample, UnpolEmptySlices)
+                if AutoSubtractEmpty == 0:
+                    if 'Empty' in FullPolEmptySlices:
+                        FullPolResults['Empty'] = vSANS_ProcessFullPolSlices(FullPolEmptySlices, 'Empty', FullPolEmptySlices)
+                    if 'Empty' in HalfPolEmptySlices:
+                        HalfPolResults['Empty'] = vSANS_ProcessHalfPolSlices(HalfPolEmptySlices, 'Empty', HalfPolEmptySlices)
+                    if 'Empty' in UnpolEmptySlices:
+                        UnpolResults['Empty'] = vSANS_ProcessUnpolSlices(UnpolEmptySlices, 'Empty', UnpolEmptySlices)
+
+                #Saving text files and data plots for similar bases, conditions, and cuts
+
+                CompareVariable = CompareFullPolSumCirc
+                CutVariable = 'Circ'
+                FullCutName = 'FullPolSumCirc'
+                BaseMap = FullPol_BaseToSampleMap
+                SampleSlices = FullPolSampleSlices
+                ResultsArray = FullPolResults
+                QName = 'QCirc'
+                IName = 'CircSum'
+                UncName = 'CircSum_Unc'
+                vSANS_Comparison_PlotsAndText(Config, CompareVariable, CutVariable, FullCutName, BaseMap, SampleSlices, ResultsArray, QName, IName, UncName)
+
+                CompareVariable = CompareHalfPolSumCirc
+                CutVariable = 'Circ'
+                FullCutName = 'HalfPolPolSumCirc'
+                BaseMap = HalfPol_BaseToSampleMap
+                SampleSlices = HalfPolSampleSlices
+                ResultsArray = HalfPolResults
+                QName = 'QCirc'
+                IName = 'CircSum'
+                UncName = 'CircSum_Unc'
+                vSANS_Comparison_PlotsAndText(Config, CompareVariable, CutVariable, FullCutName, BaseMap, SampleSlices, ResultsArray, QName, IName, UncName)
+
+
+                CompareVariable = CompareUnpolCirc
+                CutVariable = 'Circ'
+                FullCutName = 'UnpolCirc'
+                BaseMap = Unpol_BaseToSampleMap
+                SampleSlices = UnpolSampleSlices
+                ResultsArray = UnpolResults
+                QName = 'QCirc'
+                IName = 'CircSum'
+                UncName = 'CircSum_Unc'
+                vSANS_Comparison_PlotsAndText(Config, CompareVariable, CutVariable, FullCutName, BaseMap, SampleSlices, ResultsArray, QName, IName, UncName)
+
+
+                CompareVariable = CompareFullPolTypes
+                CutVariable = 'Horz'
+                FullCutName = 'FullPolNSFSum'
+                BaseMap = FullPol_BaseToSampleMap
+                SampleSlices = FullPolSampleSlices
+                ResultsArray = FullPolResults
+                QName = 'QHorz'
+                IName = 'HorzNSFSum'
+                UncName = 'HorzNSFSum_Unc'
+                vSANS_Comparison_PlotsAndText(Config, CompareVariable, CutVariable, FullCutName, BaseMap, SampleSlices, ResultsArray, QName, IName, UncName)
   
-        CompareVariable = CompareFullPolTypes
-        CutVariable = 'Horz'
-        FullCutName = 'FullPolM_Perp'
-        BaseMap = FullPol_BaseToSampleMap
-        SampleSlices = FullPolSampleSlices
-        ResultsArray = FullPolResults
-        QName = 'QHorz'
-        IName = 'M_Perp'
-        UncName = 'M_Perp_Unc'
-        vSANS_Comparison_PlotsAndText(Config, CompareVariable, CutVariable, FullCutName, BaseMap, SampleSlices, ResultsArray, QName, IName, UncName)
+                CompareVariable = CompareFullPolTypes
+                CutVariable = 'Horz'
+                FullCutName = 'FullPolM_Perp'
+                BaseMap = FullPol_BaseToSampleMap
+                SampleSlices = FullPolSampleSlices
+                ResultsArray = FullPolResults
+                QName = 'QHorz'
+                IName = 'M_Perp'
+                UncName = 'M_Perp_Unc'
+                vSANS_Comparison_PlotsAndText(Config, CompareVariable, CutVariable, FullCutName, BaseMap, SampleSlices, ResultsArray, QName, IName, UncName)
   
-        CompareVariable = CompareFullPolTypes
-        CutVariable = 'Horz'
-        FullCutName = 'FullPolM_Parl_NSF'
-        BaseMap = FullPol_BaseToSampleMap
-        SampleSlices = FullPolSampleSlices
-        ResultsArray = FullPolResults
-        QName = 'QHorz'
-        IName = 'M_Parl_NSF'
-        UncName = 'M_Parl_NSF_Unc'
-        vSANS_Comparison_PlotsAndText(Config, CompareVariable, CutVariable, FullCutName, BaseMap, SampleSlices, ResultsArray, QName, IName, UncName)
-                            
+                CompareVariable = CompareFullPolTypes
+                CutVariable = 'Horz'
+                FullCutName = 'FullPolM_Parl_NSF'
+                BaseMap = FullPol_BaseToSampleMap
+                SampleSlices = FullPolSampleSlices
+                ResultsArray = FullPolResults
+                QName = 'QHorz'
+                IName = 'M_Parl_NSF'
+                UncName = 'M_Parl_NSF_Unc'
+                vSANS_Comparison_PlotsAndText(Config, CompareVariable, CutVariable, FullCutName, BaseMap, SampleSlices, ResultsArray, QName, IName, UncName)
+
+                Results[Config] = {'FullPol' : FullPolResults, 'HalfPol' : HalfPolResults, 'Unpol' : UnpolResults}
+
+        VSANS_RenderQueuedFigures()
+        VSANS_SaveIncrementalHashes()
+        print_file_stats()
+        if LiveReduction <= 0:
+            break
+        Live_Snapshot, Rewritten = VSANS_WaitForNewData(Live_Snapshot)
+        if Live_Snapshot is None:
+            break
+        for filenumber in Rewritten:
+            forget_file(filenumber)
+        Last_Reduction['Snapshot'] = Live_Snapshot
+
+    return Results
+
+def VSANS_PrecisionDifferences(Reference, Single, Floor):
+    #Reference and Single are the saved_columns of two reductions. Returns (FileName:column, largest difference) for every column written by
+    #either; each point's difference is taken relative to its own float64 magnitude, or to Floor where that is smaller (so values
+    #crossing zero are judged on an absolute scale), and is inf if a file, its shape or a point's NaN pattern differs.
+    Differences = []
+    for FileName in sorted(set(Reference) | set(Single)):
+        if FileName not in Reference or FileName not in Single or Reference[FileName][1].shape != Single[FileName][1].shape:
+            Differences.append((FileName, np.inf))
+            continue
+        header, Reference_Columns = Reference[FileName]
+        Single_Columns = Single[FileName][1]
+        for name, Reference_Column, Single_Column in zip(header.split(', '), Reference_Columns, Single_Columns):
+            Both_NaN = np.isnan(Reference_Column) & np.isnan(Single_Column)
+            with np.errstate(invalid='ignore'):
+                Relative = np.abs(Single_Column - Reference_Column)/np.maximum(np.abs(Reference_Column), Floor)
+            Relative = np.where(Both_NaN, 0.0, np.where(np.isnan(Relative), np.inf, Relative))
+            Differences.append((FileName + ':' + name, float(np.max(Relative, initial=0.0))))
+    return Differences
+
+def check_precision(Settings, Tolerance = 1e-4, Floor = 1e-3):
+    '''
+    Regression check for SinglePrecision: reduces Settings in float32 and then in float64 and compares every column of every 1D product
+    they write (each slice with all of its cross sections, and the results), point by point and unrounded. A point's difference is
+    relative to its float64 value, or absolute once that value is below Floor. On the example data every point agrees to within 5e-5.
+    Returns (worst difference, [(file:column, difference) beyond Tolerance]); save_path is left with the float64 files.
+    '''
+    global saved_columns
+    Columns = {}
+    try:
+        for Precision in (1, 0):
+            saved_columns = {}
+            reduce(ReductionSettings(**dict(Settings.Values, SinglePrecision = Precision, LiveReduction = 0)))
+            Columns[Precision] = saved_columns
+    finally:
+        saved_columns = None
+
+    Differences = VSANS_PrecisionDifferences(Columns[0], Columns[1], Floor)
+    Worst = max([Difference for Entry, Difference in Differences], default=0.0)
+    Failed = [(Entry, Difference) for Entry, Difference in Differences if not Difference <= Tolerance]
+    print('SinglePrecision check:', len(Differences), 'columns compared, largest difference', Worst, ',', len(Failed), 'beyond', Tolerance)
+    return Worst, Failed
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    reduce(ReductionSettings.from_file('UserInput.py'))
+    close_all_files()
 
 #*************************************************
 #***           End of 'The Program'            ***
@@ -1,34 +1,150 @@
 import requests
 import posixpath
 import os
+import tempfile
+import time
+import json
 from hashlib import sha256
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import argparse
 
-def retrieve_NCNR_datafiles(path, localpath="datafiles", extension=None, check_signature=True, verbose=True):
+LISTING_URL = "https://ncnr.nist.gov/ncnrdata/listftpfiles_new.php"
+DATA_URL = "https://ncnr.nist.gov/pub/ncnrdata/"
+CHUNK_SIZE = 1024*1024
+HASH_CACHE_NAME = ".sha256_cache.json"
+
+def file_sha256(fullpath):
+    """ sha256 (upper case hex) of a file, read in CHUNK_SIZE pieces """
+
+    digest = sha256()
+    with open(fullpath, 'rb') as local_file:
+        for chunk in iter(lambda: local_file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest().upper()
+
+def load_hash_cache(localpath):
+    """ {filename: [size, mtime_ns, sha256]} saved by a previous run in localpath """
+
+    cache_fullpath = os.path.join(localpath, HASH_CACHE_NAME)
+    try:
+        with open(cache_fullpath) as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+
+def save_hash_cache(localpath, hash_cache):
+    cache_fullpath = os.path.join(localpath, HASH_CACHE_NAME)
+    temp_fullpath = cache_fullpath + ".tmp"
+    with open(temp_fullpath, 'w') as cache_file:
+        json.dump(hash_cache, cache_file)
+    os.replace(temp_fullpath, cache_fullpath)
+
+def local_hashes(localpath, filenames, hash_cache, workers=None):
+    """ sha256 of each existing file in filenames, taken from hash_cache
+    while the file size and modification time are unchanged; the rest are
+    hashed in a pool of up to `workers` threads (hashlib releases the GIL,
+    so this uses several cores) and added to hash_cache """
+
+    hashes = {}
+    stale = []
+    for fn in filenames:
+        stat = os.stat(os.path.join(localpath, fn))
+        cached = hash_cache.get(fn)
+        if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            hashes[fn] = cached[2]
+        else:
+            stale.append((fn, stat))
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for (fn, stat), local_hash in zip(stale, executor.map(file_sha256, [os.path.join(localpath, fn) for fn, stat in stale])):
+            hashes[fn] = local_hash
+            hash_cache[fn] = [stat.st_size, stat.st_mtime_ns, local_hash]
+    return hashes
+
+def make_session(workers=8):
+    """ One keep-alive session for all downloads, with a connection pool
+    large enough for the number of concurrent workers """
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(workers, 1))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+class SignatureMismatch(OSError):
+    """ A downloaded body whose sha256 differs from the remote signature """
+
+def download_file(session, url, local_fullpath, retries=3, backoff=1.0, timeout=60, expected_sha256=None):
+    """ Stream url into a temporary file next to local_fullpath and rename
+    it into place once complete, so an interrupted download never leaves a
+    partial file under the real name.  If expected_sha256 is given, a body
+    with a different sha256 (hashed while streaming) is discarded and counts
+    as a failed attempt.  Failed attempts are retried after backoff,
+    2*backoff, 4*backoff... seconds.  Returns the number of bytes written
+    and the sha256 of the body; raises the last error if every attempt
+    fails """
+
+    localpath, fn = os.path.split(local_fullpath)
+    for attempt in range(retries + 1):
+        fd, temp_fullpath = tempfile.mkstemp(prefix="." + fn + ".", suffix=".part", dir=localpath or ".")
+        try:
+            nbytes = 0
+            digest = sha256()
+            with os.fdopen(fd, 'wb') as temp_file:
+                with session.get(url, stream=True, timeout=timeout) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        temp_file.write(chunk)
+                        digest.update(chunk)
+                        nbytes += len(chunk)
+            local_hash = digest.hexdigest().upper()
+            if expected_sha256 is not None and local_hash != expected_sha256.upper():
+                raise SignatureMismatch("sha256 {local} does not match remote {remote}".format(local=local_hash, remote=expected_sha256.upper()))
+            os.replace(temp_fullpath, local_fullpath)
+            return nbytes, local_hash
+        except (requests.RequestException, OSError):
+            if os.path.exists(temp_fullpath):
+                os.remove(temp_fullpath)
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2**attempt)
+
+def retrieve_NCNR_datafiles(path, localpath="datafiles", extension=None, check_signature=True, verbose=True, workers=8, retries=3,
+                            listing_url=LISTING_URL, data_url=DATA_URL):
     """ Get a listing of all the datafiles matching the extension in
     the specified path, and retrieve them locally if they do no exist here
     or if check_signature=True and the remote signature differs from the
-    local sha256 """
-    
+    local sha256.  Up to `workers` files are downloaded at once over a
+    shared session; listing_url and data_url can point at another server
+    (e.g. a local stand-in) that serves the same listing JSON and files.
+    Returns the list of files that could not be retrieved (empty if none) """
+
+    session = make_session(workers)
     pathlist = posixpath.split(path)
     data = {'pathlist[]' : pathlist}
-    raw_listing = requests.post("https://ncnr.nist.gov/ncnrdata/listftpfiles_new.php", data=data).json()
+    raw_listing = session.post(listing_url, data=data).json()
     files_metadata = raw_listing['files_metadata']
-    remote_url = "https://ncnr.nist.gov/pub/ncnrdata/" + posixpath.join(*raw_listing["pathlist"])
+    remote_url = data_url + posixpath.join(*raw_listing["pathlist"])
 
     if files_metadata == []:
         print("no files found in path {path}".format(path=path))
-        return
-    
+        return []
+
     if extension is not None:
         files_metadata = dict([(fn, v) for fn, v in files_metadata.items() if fn.endswith(extension)])
         if len(files_metadata.values()) == 0:
             print("no files matching extension {extension} were found - exiting.".format(extension=extension))
-            return
+            return []
 
     if not os.path.exists(localpath):
         os.mkdir(localpath)
-        
+
+    hash_cache = load_hash_cache(localpath)
+    hashes = {}
+    if check_signature:
+        hashes = local_hashes(localpath, [fn for fn in files_metadata if os.path.exists(os.path.join(localpath, fn))], hash_cache, workers)
+
+    to_retrieve = []
     for fn in files_metadata:
         retrieve = False
         local_fullpath = os.path.join(localpath, fn)
@@ -38,7 +154,7 @@ def retrieve_NCNR_datafiles(path, localpath="datafiles", extension=None, check_s
             retrieve = True
         else:
             if check_signature:
-                local_hash = sha256(open(local_fullpath, 'rb').read()).hexdigest().upper()
+                local_hash = hashes[fn]
                 if local_hash.upper() != files_metadata[fn]['sha256'].upper():
                     retrieve = True
                     if verbose:
@@ -50,10 +166,36 @@ def retrieve_NCNR_datafiles(path, localpath="datafiles", extension=None, check_s
             else:
                 if verbose:
                     print("file exists locally and not checking signatures: " + fn)
-        
+
         if retrieve:
-            file_contents = requests.get(posixpath.join(remote_url, fn)).content
-            open(local_fullpath, 'wb').write(file_contents)
+            to_retrieve.append(fn)
+
+    start = time.time()
+    nbytes = 0
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = dict((executor.submit(download_file, session, posixpath.join(remote_url, fn), os.path.join(localpath, fn), retries,
+                                        expected_sha256=files_metadata[fn]['sha256'] if check_signature else None), fn) for fn in to_retrieve)
+        for future in as_completed(futures):
+            fn = futures[future]
+            try:
+                file_bytes, local_hash = future.result()
+                nbytes += file_bytes
+                stat = os.stat(os.path.join(localpath, fn))
+                hash_cache[fn] = [stat.st_size, stat.st_mtime_ns, local_hash]
+                if verbose:
+                    print("retrieved: " + fn)
+            except (requests.RequestException, OSError) as error:
+                failed.append(fn)
+                print("failed to retrieve {fn}: {error}".format(fn=fn, error=error))
+
+    for fn in [fn for fn in hash_cache if not os.path.exists(os.path.join(localpath, fn))]:
+        del hash_cache[fn]
+    save_hash_cache(localpath, hash_cache)
+    elapsed = time.time() - start
+    print("{total} files listed, {retrieved} retrieved ({mb:.1f} MB in {sec:.1f} s), {failed} failed".format(
+        total=len(files_metadata), retrieved=len(to_retrieve) - len(failed), mb=nbytes/1e6, sec=elapsed, failed=len(failed)))
+    return failed
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -62,9 +204,14 @@ if __name__ == '__main__':
     parser.add_argument("-e", "--extension", help="filter for file endings, e.g. .nxs.ngv")
     parser.add_argument("-f", "--force", action="store_true", help="force re-download even for files you already have")
     parser.add_argument("-q", "--quiet", action="store_true", help="suppress debugging printouts during execution")
+    parser.add_argument("-j", "--jobs", type=int, default=8, help="number of files downloaded at the same time (defaults to 8)")
+    parser.add_argument("-r", "--retries", type=int, default=3, help="times a failed download is retried (defaults to 3)")
+    parser.add_argument("--listing-url", type=str, default=LISTING_URL, help="url of the file listing service (for testing against another server)")
+    parser.add_argument("--data-url", type=str, default=DATA_URL, help="base url the listed files are downloaded from (for testing against another server)")
     args = parser.parse_args()
     check_signature = (not args.force)
     verbose = (not args.quiet)
     print(args)
 
-    retrieve_NCNR_datafiles(args.path, localpath=args.localpath, extension=args.extension, check_signature=check_signature, verbose=verbose)
+    retrieve_NCNR_datafiles(args.path, localpath=args.localpath, extension=args.extension, check_signature=check_signature, verbose=verbose,
+                            workers=args.jobs, retries=args.retries, listing_url=args.listing_url, data_url=args.data_url)
@@ -0,0 +1,118 @@
+""" get_ncnr_files against a local stand-in for the NCNR listing service and
+data server (run with: python -m pytest tests) """
+
+import hashlib
+import http.server
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import get_ncnr_files
+
+
+class StandInServer(object):
+    """ Serves a listing of `files` (POST) and their bodies (GET) on a free
+    local port; `signatures` overrides the listed sha256 of a file and
+    `requests` counts the GETs per file """
+
+    def __init__(self, files, signatures=None):
+        self.files = files
+        self.signatures = signatures or {}
+        self.requests = {}
+        stand_in = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def send_body(self, body):
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers['Content-Length']))
+                self.send_body(json.dumps({'files_metadata': stand_in.listing(), 'pathlist': ['p']}).encode())
+
+            def do_GET(self):
+                fn = os.path.basename(self.path)
+                stand_in.requests[fn] = stand_in.requests.get(fn, 0) + 1
+                self.send_body(stand_in.files[fn])
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        url = 'http://127.0.0.1:{port}/'.format(port=self.httpd.server_address[1])
+        self.urls = {'listing_url': url + 'listing', 'data_url': url + 'data/'}
+
+    def listing(self):
+        if len(self.files) == 0:
+            return []
+        return dict((fn, {'sha256': self.signatures.get(fn, hashlib.sha256(body).hexdigest())}) for fn, body in self.files.items())
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def stand_in(monkeypatch):
+    monkeypatch.setattr(get_ncnr_files.time, 'sleep', lambda seconds: None)
+    servers = []
+
+    def start(files, signatures=None):
+        servers.append(StandInServer(files, signatures))
+        return servers[-1]
+    yield start
+    for server in servers:
+        server.close()
+
+
+def retrieve(server, localpath, **kwargs):
+    return get_ncnr_files.retrieve_NCNR_datafiles('p', localpath=str(localpath), verbose=False, retries=2, **kwargs, **server.urls)
+
+
+def test_downloads_listed_files(stand_in, tmp_path):
+    server = stand_in({'a.nxs.ngv': b'a'*3000000, 'b.nxs.ngv': b'b'*1000})
+    assert retrieve(server, tmp_path) == []
+    assert (tmp_path / 'a.nxs.ngv').read_bytes() == b'a'*3000000
+    assert (tmp_path / 'b.nxs.ngv').read_bytes() == b'b'*1000
+    assert sorted(fn for fn in os.listdir(tmp_path) if fn.endswith('.part')) == []
+
+
+def test_signature_mismatch_is_retried_and_reported(stand_in, tmp_path):
+    server = stand_in({'a.nxs.ngv': b'a'*1000, 'bad.nxs.ngv': b'b'*1000}, signatures={'bad.nxs.ngv': hashlib.sha256(b'other').hexdigest()})
+    assert retrieve(server, tmp_path) == ['bad.nxs.ngv']
+    assert server.requests['bad.nxs.ngv'] == 3
+    assert not (tmp_path / 'bad.nxs.ngv').exists()
+    assert sorted(fn for fn in os.listdir(tmp_path) if fn.endswith('.part')) == []
+    assert (tmp_path / 'a.nxs.ngv').exists()
+
+
+def test_unchanged_files_are_skipped(stand_in, tmp_path):
+    server = stand_in({'a.nxs.ngv': b'a'*1000, 'b.nxs.ngv': b'b'*1000})
+    assert retrieve(server, tmp_path) == []
+    (tmp_path / 'b.nxs.ngv').write_bytes(b'changed locally')
+    assert retrieve(server, tmp_path) == []
+    assert server.requests == {'a.nxs.ngv': 1, 'b.nxs.ngv': 2}
+    assert (tmp_path / 'b.nxs.ngv').read_bytes() == b'b'*1000
+
+
+def test_hash_cache_is_pruned(stand_in, tmp_path):
+    server = stand_in({'a.nxs.ngv': b'a'*1000, 'b.nxs.ngv': b'b'*1000})
+    assert retrieve(server, tmp_path) == []
+    assert sorted(get_ncnr_files.load_hash_cache(str(tmp_path))) == ['a.nxs.ngv', 'b.nxs.ngv']
+    os.remove(str(tmp_path / 'b.nxs.ngv'))
+    del server.files['b.nxs.ngv']
+    assert retrieve(server, tmp_path) == []
+    assert sorted(get_ncnr_files.load_hash_cache(str(tmp_path))) == ['a.nxs.ngv']
+
+
+def test_nothing_to_fetch_returns_empty_list(stand_in, tmp_path):
+    assert retrieve(stand_in({}), tmp_path) == []
+    assert retrieve(stand_in({'a.dat': b'a'}), tmp_path, extension='.nxs.ngv') == []
@@ -0,0 +1,96 @@
+""" LiveReduction = 1 on a copy of the example data (VSANS26903_Fe3O4Check)
+into which files are dropped and rewritten between passes (run with:
+python -m pytest tests) """
+
+import glob
+import os
+import shutil
+import sys
+
+import h5py
+import pytest
+
+Package_Path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, Package_Path)
+import VSANS_ReductionHighRes as V
+
+Example_Data = os.path.join(Package_Path, 'VSANS26903_Fe3O4Check')
+Config = '4Gd300cmF1400cmM5.5Ang'
+Dropped = 51321 #second Unpol run of Fe3O4NPs_4.9V_300.0K, held back until the first pass is done
+Rewritten = 51321 #the same run, written again after the second pass
+Poll_Seconds = 0.25
+
+
+def link_or_copy(source, destination):
+    try:
+        os.symlink(source, destination)
+    except (OSError, NotImplementedError):
+        shutil.copy2(source, destination)
+
+
+def rewrite_with_more_monitor_counts(data_path, filenumber):
+    #A new file (new inode, modification time and contents) under the same name, as when a run is written again
+    fullpath = os.path.join(data_path, 'sans{}.nxs.ngv'.format(filenumber))
+    temp_fullpath = os.path.join(data_path, '.sans{}.part'.format(filenumber))
+    shutil.copyfile(os.path.realpath(fullpath), temp_fullpath)
+    with h5py.File(temp_fullpath, 'r+') as f:
+        f['entry/control/monitor_counts'][0] = f['entry/control/monitor_counts'][0] + 1000
+    os.replace(temp_fullpath, fullpath)
+
+
+@pytest.mark.skipif(not os.path.isdir(Example_Data), reason='example data not present')
+def test_live_reduction_reduces_only_what_changed(tmp_path, monkeypatch):
+    data_path = str(tmp_path / 'data')
+    os.mkdir(data_path)
+    for source in glob.glob(os.path.join(Example_Data, '*.nxs.ngv')):
+        if os.path.basename(source) != 'sans{}.nxs.ngv'.format(Dropped):
+            link_or_copy(source, os.path.join(data_path, os.path.basename(source)))
+
+    Reduced = []
+    save_slices = V.VSANS_SaveIncrementalSlices
+    def record_reduced(Type, Sample, Config, Fingerprint, Cuts):
+        Reduced.append((Type, Sample, Config))
+        return save_slices(Type, Sample, Config, Fingerprint, Cuts)
+    monkeypatch.setattr(V, 'VSANS_SaveIncrementalSlices', record_reduced)
+
+    Passes = []
+    Polls = []
+    Handles = {}
+    sleep = V.time.sleep
+    def poll(seconds):
+        #After each pass one poll changes the folder and the next finds it settled, which starts the next pass
+        if seconds != Poll_Seconds:
+            return sleep(seconds)
+        Polls.append(seconds)
+        if len(Polls) % 2 == 1:
+            Passes.append((sorted(Reduced), dict(V.incremental_stats)))
+            del Reduced[:]
+        if len(Polls) == 1:
+            link_or_copy(os.path.join(Example_Data, 'sans{}.nxs.ngv'.format(Dropped)), os.path.join(data_path, 'sans{}.nxs.ngv'.format(Dropped)))
+        elif len(Polls) == 3:
+            Handles['Before'] = V.file_objects[Rewritten]
+            rewrite_with_more_monitor_counts(data_path, Rewritten)
+        elif len(Polls) == 5:
+            raise KeyboardInterrupt
+    monkeypatch.setattr(V.time, 'sleep', poll)
+
+    Settings = V.ReductionSettings.from_file(os.path.join(Package_Path, 'ExampleUserInput.py'), input_path = data_path,
+                                             save_path = os.path.join(str(tmp_path), 'Results', ''), Min_Filenumber = 0,
+                                             Min_Scatt_Filenumber = 0, Min_Trans_Filenumber = 0, LiveReduction = 1,
+                                             LivePollSeconds = Poll_Seconds, SavePlots = 0, Headless = 1)
+    try:
+        V.reduce(Settings)
+        Rewritten_Monitor = V.get_by_filenumber(Rewritten)['entry/control/monitor_counts'][0]
+        with h5py.File(os.path.join(Example_Data, 'sans{}.nxs.ngv'.format(Rewritten)), 'r') as f:
+            Original_Monitor = f['entry/control/monitor_counts'][0]
+    finally:
+        V.close_all_files()
+
+    assert len(Passes) == 3
+    assert Passes[0][1] == {'Reused' : 0, 'Reduced' : 4}
+    #dropping the second Unpol run of Fe3O4NPs only re-reduces its Unpol slices
+    assert Passes[1] == ([('Unpol', 'Fe3O4NPs_4.9V_300.0K', Config)], {'Reused' : 3, 'Reduced' : 1})
+    #rewriting it re-reduces the same slices again, from the new file
+    assert Passes[2] == ([('Unpol', 'Fe3O4NPs_4.9V_300.0K', Config)], {'Reused' : 3, 'Reduced' : 1})
+    assert not Handles['Before'].id.valid
+    assert Rewritten_Monitor == Original_Monitor + 1000